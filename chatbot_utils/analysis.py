@@ -0,0 +1,303 @@
+import re
+
+try:
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_constants
+
+from chatbot_utils.literals import fold_case, parse_pattern
+
+
+# Kinds of issues reported by pattern analysis
+NESTED_QUANTIFIER = "nested quantifier"
+OVERLAPPING_ALTERNATION = "overlapping alternation"
+UNANCHORED_WILDCARD = "unanchored wildcard"
+
+_REPEATS = frozenset([sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT])
+_POSSESSIVE_REPEAT = getattr(sre_constants, "POSSESSIVE_REPEAT", None)
+_ATOMIC_GROUP = getattr(sre_constants, "ATOMIC_GROUP", None)
+
+_ZERO_WIDTH = frozenset([sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT])
+
+# Items which contain no other items
+_SIMPLE = frozenset([sre_constants.LITERAL, sre_constants.NOT_LITERAL, sre_constants.IN,
+                     sre_constants.ANY, sre_constants.CATEGORY, sre_constants.GROUPREF])
+
+_NEGATED_CATEGORIES = [sre_constants.CATEGORY_NOT_DIGIT, sre_constants.CATEGORY_NOT_SPACE,
+                       sre_constants.CATEGORY_NOT_WORD]
+
+
+class PatternReport(object):
+    """
+    Result of analyzing a single pattern for constructs which can make
+    matching slow
+
+    :ivar str pattern: the pattern that was analyzed
+    :ivar str location: where the pattern lives in a Responder, e.g.\
+        ``"contexts[0].responses"``, or None if not known
+    :ivar int block: position of the block of patterns that the pattern is\
+        compiled in (see ``ReDict.groups_per_regex``), or None if the\
+        pattern is not compiled in a block
+    :ivar bool wildcard: True if the pattern starts with a "match anything"\
+        prefix, and is matched separately from its block
+    :ivar list issues: list of ``(kind, description)`` tuples, where ``kind``\
+        is ``NESTED_QUANTIFIER``, ``OVERLAPPING_ALTERNATION`` or\
+        ``UNANCHORED_WILDCARD``
+    :ivar int degree: estimated worst-case matching time of the pattern, as\
+        the power of the input text length that it grows with (1 for linear\
+        time), or None if it may grow exponentially
+    """
+    def __init__(self, pattern, issues, degree, block=None, wildcard=False, location=None):
+        self.pattern = pattern
+        self.location = location
+        self.block = block
+        self.wildcard = wildcard
+        self.issues = issues
+        self.degree = degree
+
+    @property
+    def complexity(self):
+        """
+        Estimated worst-case matching time in big-O notation, e.g. ``"O(n^2)"``
+        """
+        if self.degree is None:
+            return "O(2^n)"
+
+        if self.degree == 1:
+            return "O(n)"
+
+        return "O(n^%d)" % self.degree
+
+    def cost(self, length=1000):
+        """
+        Estimate the worst-case number of steps needed to match the pattern
+        against input text of a given length
+
+        :param int length: input text length
+        :return: estimated number of steps
+        :rtype: float
+        """
+        if self.degree is None:
+            return float("inf")
+
+        return float(length) ** self.degree
+
+    def __str__(self):
+        where = "" if self.location is None else "%s " % self.location
+        if self.block is not None:
+            where += "block %d " % self.block
+
+        desc = "; ".join(description for _, description in self.issues)
+        return "%s'%s' %s%s" % (where, self.pattern, self.complexity,
+                                (": " + desc) if desc else "")
+
+    def __repr__(self):
+        return "<PatternReport %s>" % str(self)
+
+
+class _State(object):
+    def __init__(self):
+        self.nested = False
+        self.overlap = False
+        self.overlap_repeated = False
+        self.wildcards = 0
+        self.leading_wildcard = False
+
+
+def _items(parsed):
+    return getattr(parsed, "data", parsed)
+
+
+def _first(items):
+    # Returns (chars, nullable), where 'chars' is the set of case-folded
+    # characters that a match of 'items' can start with (None for any
+    # character), and 'nullable' is True if 'items' can match empty text
+    chars = set()
+
+    for op, av in _items(items):
+        if op in _ZERO_WIDTH:
+            continue
+
+        if op is sre_constants.LITERAL:
+            chars.add(fold_case(chr(av)))
+            return chars, False
+
+        if (op is sre_constants.IN) and all(o is sre_constants.LITERAL for o, _ in av):
+            chars.update(fold_case(chr(c)) for _, c in av)
+            return chars, False
+
+        if op is sre_constants.SUBPATTERN:
+            sub, nullable = _first(av[-1])
+        elif (_ATOMIC_GROUP is not None) and (op is _ATOMIC_GROUP):
+            sub, nullable = _first(av)
+        elif (op in _REPEATS) or (op is _POSSESSIVE_REPEAT):
+            sub, nullable = _first(av[2])
+            nullable = nullable or (av[0] == 0)
+        elif op is sre_constants.BRANCH:
+            sub, nullable = set(), False
+            for branch in av[1]:
+                branch_chars, branch_nullable = _first(branch)
+                if branch_chars is None:
+                    sub = None
+                    break
+
+                sub.update(branch_chars)
+                nullable = nullable or branch_nullable
+        else:
+            return None, False
+
+        if sub is None:
+            return None, False
+
+        chars.update(sub)
+        if not nullable:
+            return chars, False
+
+    return chars, True
+
+
+def _overlapping(branches):
+    firsts = []
+    for branch in branches:
+        chars, _ = _first(branch)
+        if chars is None:
+            return True
+
+        for other in firsts:
+            if chars & other:
+                return True
+
+        firsts.append(chars)
+
+    return False
+
+
+def _is_broad(body):
+    # True if 'body' is a single item matching (almost) any character
+    items = _items(body)
+    if len(items) != 1:
+        return False
+
+    op, av = items[0]
+    if op in (sre_constants.ANY, sre_constants.NOT_LITERAL):
+        return True
+
+    if op is sre_constants.IN:
+        if av and (av[0][0] is sre_constants.NEGATE):
+            return True
+
+        if (len(av) == 1) and (av[0][0] is sre_constants.CATEGORY):
+            return av[0][1] in _NEGATED_CATEGORIES
+
+    return False
+
+
+def _walk(items, state, repeated, at_end, at_start):
+    items = _items(items)
+
+    # Zero-width items at the end, such as '$', don't stop a wildcard from
+    # being at the end
+    last = len(items) - 1
+    while (last >= 0) and (items[last][0] in _ZERO_WIDTH):
+        last -= 1
+
+    start = at_start
+    for i in range(len(items)):
+        op, av = items[i]
+        if op in _SIMPLE:
+            start = False
+            continue
+
+        end = at_end and (i >= last)
+
+        if op in _REPEATS:
+            low, high, body = av
+            variable = (high != low) and (high > 1)
+            if variable and repeated:
+                state.nested = True
+
+            if (high == sre_constants.MAXREPEAT) and _is_broad(body) and (not end):
+                state.wildcards += 1
+                if start:
+                    state.leading_wildcard = True
+
+            _walk(body, state, repeated or variable, end, start)
+        elif op is sre_constants.SUBPATTERN:
+            _walk(av[-1], state, repeated, end, start)
+        elif op is sre_constants.BRANCH:
+            if _overlapping(av[1]):
+                state.overlap = True
+                state.overlap_repeated = state.overlap_repeated or repeated
+
+            for branch in av[1]:
+                _walk(branch, state, repeated, end, start)
+        elif (op is _POSSESSIVE_REPEAT) or ((_ATOMIC_GROUP is not None) and (op is _ATOMIC_GROUP)):
+            # No backtracking into these from outside
+            _walk(av[2] if op is _POSSESSIVE_REPEAT else av, state, False, False, False)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _walk(av[1], state, False, False, False)
+            continue
+        elif op is sre_constants.GROUPREF_EXISTS:
+            for branch in av[1:]:
+                if branch is not None:
+                    _walk(branch, state, repeated, end, start)
+        elif op is sre_constants.AT:
+            continue
+
+        start = False
+
+
+def analyze_parsed(parsed, wildcard=False):
+    """
+    Analyze a parsed pattern for constructs which can make matching slow
+
+    :param parsed: pattern parsed by :func:`chatbot_utils.literals.parse_pattern`
+    :param bool wildcard: True if 'parsed' is the rest of a pattern after a\
+        "match anything" prefix (see\
+        :func:`chatbot_utils.literals.split_wildcard`), which is tried at\
+        every position where it could start
+    :return: tuple of the form ``(issues, degree)`` (see :class:`PatternReport`)
+    :rtype: tuple
+    """
+    state = _State()
+    _walk(parsed, state, False, True, True)
+    issues = []
+
+    if state.nested:
+        issues.append((NESTED_QUANTIFIER, "quantifier applied to an expression "
+                       "that already has a quantifier, e.g. (a+)+"))
+
+    if state.overlap:
+        issues.append((OVERLAPPING_ALTERNATION, "alternatives that can start "
+                       "with the same character%s" % (" inside a quantifier"
+                       if state.overlap_repeated else "")))
+
+    if state.wildcards > 1:
+        issues.append((UNANCHORED_WILDCARD, "%d unbounded wildcards such as .* "
+                       "in sequence" % state.wildcards))
+    elif state.leading_wildcard and (not wildcard):
+        issues.append((UNANCHORED_WILDCARD, "leading wildcard such as .* is "
+                       "tried against every position of the input text"))
+
+    if state.nested or state.overlap_repeated:
+        return issues, None
+
+    return issues, max(1, state.wildcards) + int(wildcard)
+
+
+def analyze_pattern(pattern, flags=re.IGNORECASE):
+    """
+    Analyze a pattern for constructs which can make matching slow
+
+    :param str pattern: pattern to analyze
+    :param int flags: flags that the pattern will be compiled with
+    :return: report for the pattern
+    :rtype: chatbot_utils.analysis.PatternReport
+    :raises ValueError: if the pattern is not a valid regular expression
+    """
+    parsed = parse_pattern(pattern, flags)
+    if parsed is None:
+        raise ValueError("Invalid regular expression '%s'" % pattern)
+
+    issues, degree = analyze_parsed(parsed)
+    return PatternReport(pattern, issues, degree)
@@ -0,0 +1,241 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chatbot_utils.replay import _load_responder, _pool_context
+from chatbot_utils.session import Session
+
+
+# Responder used by the current worker process of a process pool
+_responder = None
+
+
+class QueueFullError(Exception):
+    """
+    Raised by ``AsyncResponder.get_response`` when ``max_waiting`` requests
+    are already waiting to be matched
+    """
+    pass
+
+
+def _init_worker(responder, content_hash):
+    global _responder
+    _responder = _load_responder(responder, content_hash)
+
+def _process_response(text, data):
+    session = Session.from_bytes(data)
+    response, groups = _responder.get_response(text, session)
+    return response, groups, session.to_bytes()
+
+def process_executor(responder, max_workers=None, content_hash=None):
+    """
+    Create a process pool that an AsyncResponder can offload matching to.
+    Each worker process holds its own copy of the responder; where the
+    ``fork`` start method is available, workers share the compiled
+    responder of the parent process.
+
+    :param responder: chatbot_utils.responder.Responder instance, or name of\
+        a file saved by ``Responder.save_compiled``
+    :param int max_workers: number of worker processes. If None, the number\
+        of CPUs is used.
+    :param str content_hash: if 'responder' is a file name, and this is not\
+        None, workers raise ValueError unless the saved responder has this\
+        content hash (see ``Responder.content_hash``)
+    :return: new process pool
+    :rtype: concurrent.futures.ProcessPoolExecutor
+    """
+    if not isinstance(responder, str):
+        responder.compile()
+
+    return ProcessPoolExecutor(max_workers, _pool_context(), _init_worker,
+                               (responder, content_hash))
+
+
+class _SessionLock(object):
+    __slots__ = ['lock', 'users']
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class AsyncResponder(object):
+    """
+    Wraps a Responder for use from asyncio code. Matching is done in an
+    executor, so that a slow match does not block the event loop, while
+    requests for the same session are handled one at a time, in the order
+    they were made.
+
+    At most ``max_pending`` requests are matched at once; further requests
+    wait until a running request finishes, and once ``max_waiting`` requests
+    are waiting, new requests are rejected with :class:`QueueFullError` so
+    that callers can shed load. Once matching has started, it always runs to
+    completion and updates the session, even if the awaiting task is
+    cancelled.
+
+    When offloading to a process pool (see :func:`process_executor`), the
+    session is sent to the worker process and updated from the worker's copy
+    afterwards, so all session variables must be JSON-serializable and all
+    response objects must be picklable. Match timeouts in worker processes
+    are not added to ``Responder.timeouts``.
+
+    Example:
+
+    >>> async_responder = AsyncResponder(responder, max_pending=32)
+    >>> response, groups = await async_responder.get_response("hello", session)
+
+    :param responder: chatbot_utils.responder.Responder instance to wrap.\
+        It is compiled immediately.
+    :param executor: ``concurrent.futures.Executor`` instance to run matching\
+        in. If None, the event loop's default executor is used. Process pools\
+        must be created with :func:`process_executor`.
+    :param int max_pending: maximum number of requests matched at once
+    :param int max_waiting: maximum number of requests waiting to be matched,\
+        or None for no limit
+    """
+    def __init__(self, responder, executor=None, max_pending=64, max_waiting=1024):
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1")
+
+        if (max_waiting is not None) and (max_waiting < 0):
+            raise ValueError("max_waiting must not be negative")
+
+        self.responder = responder.compile()
+        self.executor = executor
+        self.max_pending = max_pending
+        self.max_waiting = max_waiting
+
+        self._processes = isinstance(executor, ProcessPoolExecutor)
+        self._slots = None
+        self._slots_loop = None
+        self._locks = {}
+
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def queue_info(self):
+        """
+        Return statistics about requests. The wait time of a request is the
+        time from the call to ``get_response`` until matching starts.
+
+        :return: dict with keys ``waiting`` (requests waiting to be matched),\
+            ``running`` (requests being matched), ``max_pending``,\
+            ``max_waiting``, ``completed``, ``rejected`` (requests rejected\
+            because the queue was full), ``mean_wait`` and ``max_wait`` (wait\
+            times of completed requests, in seconds)
+        :rtype: dict
+        """
+        return {
+            "waiting": self.waiting,
+            "running": self.running,
+            "max_pending": self.max_pending,
+            "max_waiting": self.max_waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "mean_wait": (self.total_wait / self.completed) if self.completed else 0.0,
+            "max_wait": self.max_wait
+        }
+
+    def _get_slots(self, loop):
+        # Created in the running loop, since before Python 3.10 asyncio
+        # objects are bound to the event loop that is current when they are
+        # created, and the responder may be created outside of any loop
+        if self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_pending)
+            self._slots_loop = loop
+
+        return self._slots
+
+    def _restore(self, session, data):
+        restored = Session.from_bytes(data)
+        path = restored.context_path
+        context = self.responder.get_context(path) if path else None
+
+        session.context = context
+        session.context_path = path
+        session.chain = restored.chain
+        session.chain_index = restored.chain_index
+        session.variables = restored.variables
+
+    async def get_response(self, text, session=None):
+        """
+        Find a response for 'text' (see ``Responder.get_response``)
+
+        :param str text: input text to check for matching patterns against
+        :param chatbot_utils.session.Session session: session holding the \
+            conversation state. If None, the responder's own session is used.
+        :return: tuple of the form ``(response, groups)`` (see \
+            ``Responder.get_response``)
+        :raises QueueFullError: if ``max_waiting`` requests are already\
+            waiting to be matched
+        """
+        if (self.max_waiting is not None) and (self.waiting >= self.max_waiting):
+            self.rejected += 1
+            raise QueueFullError("%d requests are already waiting" % self.waiting)
+
+        if session is None:
+            session = self.responder.session
+
+        loop = asyncio.get_running_loop()
+        slots = self._get_slots(loop)
+        start = time.monotonic()
+        entry = self._locks.get(session)
+        if entry is None:
+            entry = _SessionLock()
+            self._locks[session] = entry
+
+        entry.users += 1
+        self.waiting += 1
+
+        def release():
+            entry.users -= 1
+            if entry.users == 0:
+                del self._locks[session]
+
+        try:
+            await entry.lock.acquire()
+            try:
+                await slots.acquire()
+            except BaseException:
+                entry.lock.release()
+                raise
+        except BaseException:
+            self.waiting -= 1
+            release()
+            raise
+
+        wait = time.monotonic() - start
+        self.waiting -= 1
+        self.running += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+        if self._processes:
+            future = loop.run_in_executor(self.executor, _process_response, text,
+                                          session.to_bytes())
+        else:
+            future = loop.run_in_executor(self.executor, self.responder.get_response,
+                                          text, session)
+
+        def done(future):
+            try:
+                if self._processes and (not future.cancelled()) and (future.exception() is None):
+                    self._restore(session, future.result()[2])
+            finally:
+                self.running -= 1
+                self.completed += 1
+                slots.release()
+                entry.lock.release()
+                release()
+
+        future.add_done_callback(done)
+
+        # Shielded, so that cancelling the caller doesn't release the session
+        # while the executor may still be updating it
+        result = await asyncio.shield(future)
+        return result[0], result[1]
@@ -0,0 +1,123 @@
+import re
+
+try:
+    import regex
+except ImportError:
+    regex = None
+
+from chatbot_utils.literals import MAX_GROUPS, compile_pattern, parse_pattern
+
+
+class Backend(object):
+    """
+    Regular expression engine used by ReDicts to compile patterns. Subclass
+    this to use a different engine, and override ``compile``.
+
+    Compiled regular expressions must support the parts of the interface of
+    the standard library's compiled regular expressions that ReDicts use:
+    the ``groups`` and ``groupindex`` attributes, and a ``match(text, pos=0)``
+    method returning None, or a match object with ``groups()``,
+    ``lastgroup`` and ``lastindex``.
+
+    Patterns are also parsed with the standard library's parser, to find
+    the literal strings they require and check them for slow constructs, so
+    patterns must use syntax that the standard library supports.
+
+    :ivar str name: name of the backend
+    :ivar bool native: True if compiled regular expressions are the standard\
+        library's own compiled regular expressions
+    :ivar int max_groups: maximum number of capturing groups in a compiled\
+        regular expression, or None if there is no limit. ReDicts keep the\
+        blocks of patterns they compile within this limit.
+    """
+    name = None
+    native = False
+    max_groups = None
+
+    def compile(self, pattern, flags):
+        """
+        Compile a regular expression
+
+        :param str pattern: regular expression to compile
+        :param int flags: flags to compile the regular expression with, using\
+            the values of the standard library's ``re`` flags
+        :return: compiled regular expression
+        """
+        raise NotImplementedError()
+
+    def compile_parsed(self, pattern, flags):
+        """
+        Compile a regular expression, and parse it with the standard library's
+        parser (see :func:`chatbot_utils.literals.parse_pattern`)
+
+        :param str pattern: regular expression to compile
+        :param int flags: flags to compile the regular expression with
+        :return: tuple of the form ``(compiled, parsed)``
+        :rtype: tuple
+        """
+        compiled = self.compile(pattern, flags)
+        parsed = parse_pattern(pattern, flags)
+        if parsed is None:
+            raise ValueError("Pattern '%s' is not supported by the standard "
+                             "library's parser" % pattern)
+
+        return compiled, parsed
+
+    def __repr__(self):
+        return "<%s backend>" % self.name
+
+
+class StdlibBackend(Backend):
+    """
+    Backend using the standard library's ``re`` module (the default)
+    """
+    name = "re"
+    native = True
+    max_groups = MAX_GROUPS
+
+    def compile(self, pattern, flags):
+        return re.compile(pattern, flags)
+
+    def compile_parsed(self, pattern, flags):
+        # Parsed only once, then compiled from the parsed form
+        return compile_pattern(pattern, flags)
+
+
+class RegexBackend(Backend):
+    """
+    Backend using the third-party ``regex`` module, in its
+    ``re``-compatible mode (``regex.VERSION0``)
+    """
+    name = "regex"
+
+    def __init__(self):
+        if regex is None:
+            raise ImportError("The 'regex' module is required for RegexBackend; "
+                              "install it with 'pip install regex'")
+
+    def compile(self, pattern, flags):
+        return regex.compile(pattern, int(flags) | regex.VERSION0)
+
+
+DEFAULT_BACKEND = StdlibBackend()
+
+BACKENDS = {
+    StdlibBackend.name: StdlibBackend,
+    RegexBackend.name: RegexBackend
+}
+
+
+def get_backend(name):
+    """
+    Create a backend by name
+
+    :param str name: name of the backend, one of the keys of ``BACKENDS``
+    :return: new backend
+    :rtype: chatbot_utils.backends.Backend
+    :raises ValueError: if there is no backend with the given name
+    :raises ImportError: if the modules needed by the backend are not installed
+    """
+    if name not in BACKENDS:
+        raise ValueError("Unknown backend '%s'" % name)
+
+    return BACKENDS[name]()
@@ -0,0 +1,352 @@
+"""
+Benchmarks for tracking the performance of chatbot_utils across releases.
+Run from the command line, and results are written as JSON:
+
+::
+
+    python -m chatbot_utils.benchmark --counts 1000,10000,100000 --output results.json
+
+Each benchmark is run once for each pattern count, and for each regular
+expression backend (see :mod:`chatbot_utils.backends`), so that backends can
+be compared on the same patterns and input text:
+
+::
+
+    python -m chatbot_utils.benchmark --backends re,regex --output results.json
+
+Patterns are generated from a fixed seed, in a mix of shapes typical of
+chatbots: plain phrases, alternations, match groups and "match anything"
+prefixes and suffixes.
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from chatbot_utils import __version__
+from chatbot_utils.backends import BACKENDS, get_backend
+from chatbot_utils.format_tokens import FormattedResponse, ResponseTemplate
+from chatbot_utils.redict import ReDict
+from chatbot_utils.responder import Responder, Context
+from chatbot_utils.session import Session
+
+
+# Number of entry phrases per context in the context entry benchmark
+ENTRY_PHRASES_PER_CONTEXT = 5
+
+# Number of steps per chain in the chain traversal benchmark
+CHAIN_LENGTH = 5
+
+# Response strings compared by the response text benchmark
+RESPONSE_KINDS = [
+    ("literal", "Hello there, how are you today?"),
+    ("tokenized", "Cool, I like {p0} too"),
+    ("assigning", "Cool, I will remember that you like {p0};;fave={p0}")
+]
+
+_WORDS = ["hello", "weather", "music", "cats", "dogs", "food", "movie", "book",
+          "game", "travel", "work", "sleep", "coffee", "friend", "name", "time"]
+
+
+def _pattern(rand, i):
+    # Returns (pattern, text matching the pattern) for pattern number 'i'
+    w1, w2 = rand.sample(_WORDS, 2)
+    shape = i % 4
+
+    if shape == 0:
+        return "%s %s %d" % (w1, w2, i), "%s %s %d" % (w1, w2, i)
+
+    if shape == 1:
+        return ("(what|how) about %s %d\\??" % (w1, i),
+                "how about %s %d?" % (w1, i))
+
+    if shape == 2:
+        return ("(.* )?%s (and|or) %s %d( .*)?" % (w1, w2, i),
+                "i think %s or %s %d are great" % (w1, w2, i))
+
+    return "i like (\\w+) %s %d" % (w1, i), "i like red %s %d" % (w1, i)
+
+def _patterns(count, seed):
+    rand = random.Random(seed)
+    return [_pattern(rand, i) for i in range(count)]
+
+def _latency(func, inputs):
+    # Returns latency statistics of calling 'func' once for each input
+    times = []
+    for arg in inputs:
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+
+    times.sort()
+    return {
+        "samples": len(times),
+        "mean_us": (sum(times) / len(times)) * 1e6,
+        "p50_us": times[len(times) // 2] * 1e6,
+        "p99_us": times[min(len(times) - 1, (len(times) * 99) // 100)] * 1e6
+    }
+
+def _build_redict(patterns, backend=None):
+    d = ReDict(backend=backend)
+    for i in range(len(patterns)):
+        d[patterns[i][0]] = i
+
+    return d
+
+def bench_compile(count, seed, samples, backend):
+    """
+    Time taken to compile a ReDict
+    """
+    d = _build_redict(_patterns(count, seed), backend)
+    start = time.perf_counter()
+    d.compile()
+    return {"seconds": time.perf_counter() - start}
+
+def bench_memory(count, seed, samples, backend):
+    """
+    Memory allocated per pattern by a compiled ReDict
+    """
+    patterns = _patterns(count, seed)
+    tracemalloc.start()
+    try:
+        d = _build_redict(patterns, backend)
+        d.compile()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"bytes_per_pattern": size / float(count)}
+
+def bench_hit(count, seed, samples, backend):
+    """
+    Latency of ReDict lookups which match a pattern
+    """
+    patterns = _patterns(count, seed)
+    d = _build_redict(patterns, backend)
+    d.compile()
+
+    rand = random.Random(seed)
+    return _latency(d.match, [rand.choice(patterns)[1] for _ in range(samples)])
+
+def bench_miss(count, seed, samples, backend):
+    """
+    Latency of ReDict lookups which match no pattern
+    """
+    d = _build_redict(_patterns(count, seed), backend)
+    d.compile()
+
+    rand = random.Random(seed)
+    inputs = ["%s %s nothing %d" % (rand.choice(_WORDS), rand.choice(_WORDS), i)
+              for i in range(samples)]
+
+    def lookup(text):
+        try:
+            d.match(text)
+        except KeyError:
+            pass
+
+    return _latency(lookup, inputs)
+
+def bench_context_entry(count, seed, samples, backend):
+    """
+    Latency of entering one of many sibling contexts, with
+    ``ENTRY_PHRASES_PER_CONTEXT`` entry phrases per context
+    """
+    patterns = _patterns(count, seed)
+    responder = Responder()
+    for i in range(0, count, ENTRY_PHRASES_PER_CONTEXT):
+        context = Context()
+        for pattern, _ in patterns[i:i + ENTRY_PHRASES_PER_CONTEXT]:
+            context.add_entry_phrase(pattern, "entered")
+
+        responder.add_context(context)
+
+    responder.set_backend(backend).compile()
+
+    rand = random.Random(seed)
+    inputs = [rand.choice(patterns)[1] for _ in range(samples)]
+    return _latency(lambda text: responder.get_response(text, Session()), inputs)
+
+def bench_chain(count, seed, samples, backend):
+    """
+    Latency of each step when following a chain, in a context with
+    ``count / CHAIN_LENGTH`` chains of ``CHAIN_LENGTH`` steps
+    """
+    patterns = _patterns(count, seed)
+    context = Context().add_entry_phrase("start", "started")
+    chains = []
+    for i in range(0, count - CHAIN_LENGTH + 1, CHAIN_LENGTH):
+        steps = patterns[i:i + CHAIN_LENGTH]
+        context.add_chained_phrases(*[(pattern, "step") for pattern, _ in steps])
+        chains.append([text for _, text in steps])
+
+    responder = Responder().add_context(context)
+    responder.set_backend(backend).compile()
+
+    rand = random.Random(seed)
+    session = Session()
+    inputs = []
+    while len(inputs) < samples:
+        inputs.append("start")
+        inputs.extend(rand.choice(chains))
+
+    inputs = inputs[:samples]
+    return _latency(lambda text: responder.get_response(text, session), inputs)
+
+def bench_formatted(count, seed, samples, backend):
+    """
+    Latency of responses which format match groups into the response text
+    and assign variables
+    """
+    patterns = _patterns(count, seed)
+    responder = Responder()
+    for i in range(count):
+        responder.add_response(patterns[i][0], "Response %d {p0};;last={p0}" % i)
+
+    responder.set_backend(backend).compile()
+
+    # Every pattern needs a group for the response to be formatted
+    rand = random.Random(seed)
+    inputs = [rand.choice(patterns[3::4])[1] for _ in range(samples)]
+    return _latency(responder.get_response, inputs)
+
+def bench_response_text(count, seed, samples, backend):
+    """
+    Mean time taken to produce the text of each kind of response in
+    ``RESPONSE_KINDS``: by parsing the response string for every message
+    with ``FormattedResponse`` (``<kind>_parse_us``), by rendering a parsed
+    ``ResponseTemplate`` (``<kind>_render_us``), and with
+    ``Responder.get_response`` when all responses are of that kind
+    (``<kind>_response_us``)
+    """
+    patterns = _patterns(count, seed)
+    groups = ("cats",)
+
+    rand = random.Random(seed)
+    inputs = [rand.choice(patterns[3::4])[1] for _ in range(samples)]
+
+    ret = {}
+    for kind, text in RESPONSE_KINDS:
+        template = ResponseTemplate(text)
+        responder = Responder()
+        for pattern, _ in patterns:
+            responder.add_response(pattern, text)
+
+        responder.set_backend(backend).compile()
+
+        parse = lambda _: FormattedResponse(text, groups, {}).formatted_response_text
+        render = lambda _: template.render(groups, {})
+        ret[kind + "_parse_us"] = _latency(parse, range(samples))["mean_us"]
+        ret[kind + "_render_us"] = _latency(render, range(samples))["mean_us"]
+        ret[kind + "_response_us"] = _latency(responder.get_response, inputs)["mean_us"]
+
+    return ret
+
+
+BENCHMARKS = [
+    ("compile", bench_compile),
+    ("memory", bench_memory),
+    ("hit", bench_hit),
+    ("miss", bench_miss),
+    ("context_entry", bench_context_entry),
+    ("chain", bench_chain),
+    ("formatted", bench_formatted),
+    ("response_text", bench_response_text)
+]
+
+def run(counts, names=None, samples=1000, seed=0, progress=None, backends=None):
+    """
+    Run benchmarks
+
+    :param list counts: pattern counts to run each benchmark with
+    :param list names: names of benchmarks to run, or None to run all\
+        benchmarks (see ``BENCHMARKS``)
+    :param int samples: number of lookups timed by each latency benchmark
+    :param int seed: seed used to generate patterns and input text
+    :param progress: if not None, a file to write progress messages to
+    :param list backends: names of backends to run each benchmark with (see\
+        ``chatbot_utils.backends.BACKENDS``), or None for only ``"re"``
+    :return: results, as a dict with keys ``version``, ``python``,\
+        ``platform``, ``samples``, ``seed`` and ``results``, a list of dicts\
+        with keys ``benchmark``, ``backend`` and ``patterns`` along with the\
+        measurements of each run
+    :rtype: dict
+    :raises ValueError: if a benchmark or backend name is unknown
+    :raises ImportError: if the modules needed by a backend are not installed
+    """
+    benchmarks = dict(BENCHMARKS)
+    if names is None:
+        names = [name for name, _ in BENCHMARKS]
+
+    for name in names:
+        if name not in benchmarks:
+            raise ValueError("Unknown benchmark '%s'" % name)
+
+    if backends is None:
+        backends = ["re"]
+
+    instances = [get_backend(backend) for backend in backends]
+
+    results = []
+    for name in names:
+        for backend in instances:
+            for count in counts:
+                if progress is not None:
+                    progress.write("%s, %s, %d patterns\n" % (name, backend.name, count))
+
+                result = {"benchmark": name, "backend": backend.name, "patterns": count}
+                result.update(benchmarks[name](count, seed, samples, backend))
+                results.append(result)
+
+    return {
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "samples": samples,
+        "seed": seed,
+        "results": results
+    }
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m chatbot_utils.benchmark",
+                                     description="Run chatbot_utils benchmarks")
+
+    parser.add_argument("--counts", default="1000,10000",
+                        help="comma-separated pattern counts (default: %(default)s)")
+    parser.add_argument("--benchmarks", default=None,
+                        help="comma-separated benchmarks to run, from: %s (default: all)"
+                        % ", ".join(name for name, _ in BENCHMARKS))
+    parser.add_argument("--backends", default="re",
+                        help="comma-separated regular expression backends, from: %s "
+                        "(default: %%(default)s)" % ", ".join(sorted(BACKENDS)))
+    parser.add_argument("--samples", type=int, default=1000,
+                        help="lookups timed per latency benchmark (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed for generated patterns (default: %(default)s)")
+    parser.add_argument("--output", default=None,
+                        help="file to write JSON results to (default: standard output)")
+    parser.add_argument("--quiet", action="store_true", help="don't print progress")
+
+    args = parser.parse_args(args)
+    counts = [int(count) for count in args.counts.split(",")]
+    names = None if args.benchmarks is None else args.benchmarks.split(",")
+
+    try:
+        results = run(counts, names, args.samples, args.seed,
+                      None if args.quiet else sys.stderr, args.backends.split(","))
+    except (ValueError, ImportError) as e:
+        parser.error(str(e))
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+if __name__ == "__main__":
+    main()
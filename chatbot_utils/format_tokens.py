@@ -1,3 +1,5 @@
+from string import Formatter
+
 from chatbot_utils import constants as const
 
 
@@ -60,3 +62,228 @@ class FormattedResponse(object):
         except (KeyError, IndexError):
 
             raise InvalidFormatTokenError("Invalid format token in response '%s'" % response_text)
+
+
+# Kinds of response phrases, see ResponseTemplate.kind
+LITERAL = "literal"
+TOKENIZED = "tokenized"
+ASSIGNING = "assigning"
+
+_CONVERSIONS = {None: None, "s": str, "r": repr, "a": ascii}
+
+
+class _TemplateNotSupported(Exception):
+    pass
+
+
+class _SeparatorInGroup(Exception):
+    pass
+
+
+_FORMATTER = Formatter()
+
+def _parse_segments(text):
+    # Split text into a list of literal strings and format fields. Fields are
+    # tuples of (group index or None, name, conversion function, format spec)
+    segments = []
+    try:
+        parsed = list(_FORMATTER.parse(text))
+    except ValueError:
+        raise _TemplateNotSupported()
+
+    for literal, name, spec, conversion in parsed:
+        if literal:
+            segments.append(literal)
+
+        if name is None:
+            continue
+
+        # Anything other than a plain name (positional fields, attribute or
+        # index lookups, nested fields in the format spec) is left to str.format
+        if (not name.isidentifier()) or ("{" in spec) or (conversion not in _CONVERSIONS):
+            raise _TemplateNotSupported()
+
+        index = None
+        if name.startswith("p") and name[1:].isdigit() and ("p%d" % int(name[1:])) == name:
+            index = int(name[1:])
+
+        segments.append((index, name, _CONVERSIONS[conversion], spec))
+
+    return segments
+
+
+def _split_segments(segments, sep):
+    # Split a list of segments on 'sep', only where 'sep' occurs in literal text
+    ret = [[]]
+    for segment in segments:
+        if segment.__class__ is not str:
+            ret[-1].append(segment)
+            continue
+
+        fields = segment.split(sep)
+        if fields[0]:
+            ret[-1].append(fields[0])
+
+        for field in fields[1:]:
+            ret.append([field] if field else [])
+
+    return ret
+
+
+def _compile_segments(segments):
+    # Returns the text if there are no fields, otherwise a tuple of the form
+    # (parts, fields), where 'parts' is a list of literal strings with a
+    # placeholder for each field, and each field is a tuple of the form
+    # (position in parts, group index, name, conversion function, format spec)
+    parts = []
+    fields = []
+    for segment in segments:
+        if segment.__class__ is str:
+            parts.append(segment)
+        else:
+            fields.append((len(parts),) + segment)
+            parts.append(None)
+
+    if not fields:
+        return "".join(parts)
+
+    return parts, fields
+
+
+def _render(compiled, match_groups, variables, check_separators=False):
+    parts, fields = compiled
+    parts = list(parts)
+    numgroups = 0 if match_groups is None else len(match_groups)
+
+    for pos, index, name, conversion, spec in fields:
+        if (index is not None) and (index < numgroups):
+            value = match_groups[index]
+        else:
+            value = variables[name]
+
+        if conversion is not None:
+            value = conversion(value)
+
+        if spec or (value.__class__ is not str):
+            value = format(value, spec)
+
+        if check_separators and ((const.VAR_ASSIGNMENT_SEP in value) or
+                                 (const.VAR_ASSIGNMENT_OP in value)):
+            raise _SeparatorInGroup()
+
+        parts[pos] = value
+
+    return "".join(parts)
+
+
+class ResponseTemplate(object):
+    """
+    Response phrase which has been parsed once up front, so that it can be
+    rendered repeatedly without re-parsing the variable assignments and format
+    tokens. Rendering produces exactly the same results (and raises the same
+    errors) as :class:`FormattedResponse`.
+
+    :ivar str response_text: The unformatted response text containing format tokens and/or\
+        variable assignments
+    :ivar str kind: ``LITERAL`` if the response text contains no format tokens\
+        or variable assignments, ``ASSIGNING`` if the response text contains\
+        variable assignments, otherwise ``TOKENIZED``
+    :ivar str static: the response text, if ``kind`` is ``LITERAL``, otherwise None
+    """
+    def __init__(self, response_text):
+        self.response_text = response_text
+        self.kind = TOKENIZED
+
+        # Response text with the variable assignment section removed
+        self.text = response_text
+
+        self.static = None
+
+        # Compiled response text (see _compile_segments), or None if the
+        # response text is only supported by FormattedResponse
+        self.compiled = None
+
+        # List of compiled variable assignments, or None if there is no
+        # variable assignment section. Each assignment is a tuple of the form
+        # (pieces, valid), where 'pieces' is a list of compiled segments split
+        # on the assignment operator, and 'valid' is False if the assignment
+        # will be ignored (but still needs to be formatted)
+        self.assignments = None
+
+        try:
+            self._parse(response_text)
+        except _TemplateNotSupported:
+            self.compiled = None
+            self.assignments = None
+
+    def _parse(self, response_text):
+        fields = response_text.split(const.VAR_ASSIGNMENT_SECTION_SEP)
+        if len(fields) >= 2:
+            self.kind = ASSIGNING
+            self.text = response_text = const.VAR_ASSIGNMENT_SECTION_SEP.join(fields[:-1])
+            self.assignments = []
+
+            for assignment in _split_segments(_parse_segments(fields[-1]), const.VAR_ASSIGNMENT_SEP):
+                pieces = [_compile_segments(s) for s in _split_segments(assignment, const.VAR_ASSIGNMENT_OP)]
+                valid = len(pieces) == 2
+                if valid:
+                    pieces = [p.strip() if p.__class__ is str else p for p in pieces]
+                elif all(p.__class__ is str for p in pieces):
+                    continue
+
+                self.assignments.append((pieces, valid))
+
+        self.compiled = _compile_segments(_parse_segments(response_text))
+        if (self.assignments is None) and (self.compiled.__class__ is str):
+            self.kind = LITERAL
+            self.static = self.compiled
+
+    def _assign(self, match_groups):
+        # Format tokens in the assignment section can only refer to match groups
+        ret = {}
+        for pieces, valid in self.assignments:
+            names = [p if p.__class__ is str else _render(p, match_groups, {}, True).strip()
+                     for p in pieces]
+            if valid:
+                ret[names[0]] = names[1]
+
+        return ret
+
+    def render(self, match_groups, variables={}):
+        """
+        Apply format tokens to the response text, and parse the variable
+        assignments
+
+        :param list match_groups: The match groups from the input text that matched a regular expression
+        :param dict variables: dict of variables that should be included when applying format tokens
+        :return: tuple of the form ``(formatted_response_text, variables)``, where\
+            ``variables`` is a dict of variables assigned by the response
+        :rtype: tuple
+        """
+        if self.static is not None:
+            return self.static, {}
+
+        if self.compiled is None:
+            formatted = FormattedResponse(self.response_text, match_groups, variables)
+            return formatted.formatted_response_text, formatted.variables
+
+        new_vars = {}
+        if self.assignments:
+            try:
+                new_vars = self._assign(match_groups)
+            except KeyError:
+                raise InvalidFormatTokenError("Invalid format token in variable assignment")
+            except _SeparatorInGroup:
+                # A match group added separators, split the same way as
+                # FormattedResponse does
+                formatted = FormattedResponse(self.response_text, match_groups, variables)
+                return formatted.formatted_response_text, formatted.variables
+
+        compiled = self.compiled
+        if compiled.__class__ is str:
+            return compiled, new_vars
+
+        try:
+            return _render(compiled, match_groups, variables), new_vars
+        except (KeyError, IndexError):
+            raise InvalidFormatTokenError("Invalid format token in response '%s'" % self.text)
@@ -0,0 +1,142 @@
+import threading
+
+
+# Stages of Responder.get_response reported to Instrument.stage
+CONTEXT = "context"
+SUBCONTEXT_ENTRY = "subcontext_entry"
+CONTEXT_EXIT = "context_exit"
+RESPONSES = "responses"
+CONTEXT_ENTRY = "context_entry"
+RENDER = "render"
+
+
+class Instrument(object):
+    """
+    Receives measurements from instrumented Responders and ReDicts (see
+    ``Responder.set_instrument`` and ``ReDict.set_instrument``). All methods
+    do nothing; subclass this and override the methods you are interested
+    in, for example to export measurements to a metrics system. Methods may
+    be called from several threads at once.
+    """
+    def stage(self, stage, duration):
+        """
+        Called after each stage of ``Responder.get_response`` that runs. The
+        stages, in the order they run, are ``CONTEXT`` (chains, responses and
+        entry phrases of the active context), ``SUBCONTEXT_ENTRY`` (entry
+        phrases of the active context's subcontexts), ``CONTEXT_EXIT`` (exit
+        phrases of the active context), ``RESPONSES`` (contextless
+        responses), ``CONTEXT_ENTRY`` (entry phrases of top-level contexts)
+        and ``RENDER`` (formatting the response).
+
+        :param str stage: name of the stage
+        :param float duration: time taken by the stage, in seconds
+        """
+        pass
+
+    def match(self, redict, block, scanned, duration):
+        """
+        Called after each lookup in an instrumented ReDict
+
+        :param chatbot_utils.redict.ReDict redict: ReDict that was searched.\
+            ``redict.name`` identifies the ReDict within a Responder, e.g.\
+            ``"contexts[0].responses"``.
+        :param int block: position of the block containing the matching\
+            pattern, or None if no pattern matched
+        :param int scanned: number of blocks tried (0 if the result was cached)
+        :param float duration: time taken by the lookup, in seconds
+        """
+        pass
+
+    def compile(self, redict, blocks, duration):
+        """
+        Called after an instrumented ReDict compiles any blocks of patterns
+
+        :param chatbot_utils.redict.ReDict redict: ReDict that was compiled
+        :param int blocks: number of blocks compiled
+        :param float duration: time taken to compile, in seconds
+        """
+        pass
+
+
+class Counters(Instrument):
+    """
+    Instrument which keeps running totals of all measurements, for
+    periodic export to a metrics system
+
+    :ivar dict stages: maps each stage name to a list of the form\
+        ``[count, seconds]``
+    :ivar dict lookups: maps each ReDict name to a list of the form\
+        ``[lookups, matches, blocks scanned, seconds]``
+    :ivar dict blocks: maps each ``(ReDict name, block position)`` tuple to\
+        the number of lookups that matched a pattern in that block
+    :ivar dict compiles: maps each ReDict name to a list of the form\
+        ``[compiles, blocks compiled, seconds]``
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Set all totals to zero
+        """
+        self.stages = {}
+        self.lookups = {}
+        self.blocks = {}
+        self.compiles = {}
+
+    def snapshot(self, reset=False):
+        """
+        Return a copy of all totals
+
+        :param bool reset: if True, set all totals to zero afterwards
+        :return: dict with keys ``stages``, ``lookups``, ``blocks`` and\
+            ``compiles`` (see the instance attributes of the same names)
+        :rtype: dict
+        """
+        with self.lock:
+            ret = {
+                "stages": {k: list(v) for k, v in self.stages.items()},
+                "lookups": {k: list(v) for k, v in self.lookups.items()},
+                "blocks": dict(self.blocks),
+                "compiles": {k: list(v) for k, v in self.compiles.items()}
+            }
+
+            if reset:
+                self.reset()
+
+        return ret
+
+    def stage(self, stage, duration):
+        with self.lock:
+            totals = self.stages.get(stage)
+            if totals is None:
+                totals = self.stages[stage] = [0, 0.0]
+
+            totals[0] += 1
+            totals[1] += duration
+
+    def match(self, redict, block, scanned, duration):
+        with self.lock:
+            totals = self.lookups.get(redict.name)
+            if totals is None:
+                totals = self.lookups[redict.name] = [0, 0, 0, 0.0]
+
+            totals[0] += 1
+            totals[2] += scanned
+            totals[3] += duration
+
+            if block is not None:
+                totals[1] += 1
+                key = (redict.name, block)
+                self.blocks[key] = self.blocks.get(key, 0) + 1
+
+    def compile(self, redict, blocks, duration):
+        with self.lock:
+            totals = self.compiles.get(redict.name)
+            if totals is None:
+                totals = self.compiles[redict.name] = [0, 0, 0.0]
+
+            totals[0] += 1
+            totals[1] += blocks
+            totals[2] += duration
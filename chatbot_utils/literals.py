@@ -0,0 +1,877 @@
+import re
+
+try:
+    from re import _parser as sre_parse
+    from re import _compiler as sre_compile
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_compile
+    import sre_constants
+
+
+# Non-ASCII characters which re.IGNORECASE treats as equal to an ASCII letter
+_IGNORECASE_FIXES = {0x130: u"i", 0x131: u"i", 0x17f: u"s", 0x212a: u"k"}
+
+_REPEATS = [sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT]
+if hasattr(sre_constants, "POSSESSIVE_REPEAT"):
+    _REPEATS.append(sre_constants.POSSESSIVE_REPEAT)
+
+_ATOMIC_GROUP = getattr(sre_constants, "ATOMIC_GROUP", None)
+
+_GROUPREFS = [sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS,
+              sre_constants.GROUPREF_IGNORE]
+for _name in ["GROUPREF_LOC_IGNORE", "GROUPREF_UNI_IGNORE"]:
+    if hasattr(sre_constants, _name):
+        _GROUPREFS.append(getattr(sre_constants, _name))
+
+# Maximum number of capturing groups (including named groups) that a regular
+# expression compiled by the re module may have
+MAX_GROUPS = getattr(sre_constants, "MAXGROUPS", 100) - 1
+
+# Matches escapes, character classes and the opening parentheses of
+# capturing groups in a pattern. Group 1 is only non-empty for parentheses.
+_SUBGROUP_RE = re.compile(r"\\.|\[\^?\]?(?:\\.|[^\]\\])*\]|(\((?!\?)|\(\?P<)")
+
+# Matches escapes, character classes and global inline flags, e.g. (?i), in
+# a pattern. Group 1 is only non-empty for inline flags.
+_GLOBAL_FLAGS_RE = re.compile(r"\\.|\[\^?\]?(?:\\.|[^\]\\])*\]|(\(\?[aiLmsux]+\))")
+
+# Maximum number of distinct prefixes returned by leading_literals
+_MAX_PREFIXES = 64
+
+# Textual forms of the leading wildcards recognized by split_wildcard
+_WILDCARD_RE = re.compile(r"(\(\.\*([^\\.^$*+?{}\[\]()|])?\)\?|\.\*)")
+
+# Patterns made only of these characters (printable ASCII, except for
+# special characters) match only text equal to the pattern
+_PLAIN_RE = re.compile(r"[ !\"#%&',\-/0-9:;<=>@A-Z_`a-z~]+")
+
+# Flags which change what a plain pattern matches, other than re.IGNORECASE
+_PLAIN_EXCLUDED_FLAGS = re.VERBOSE | re.MULTILINE | re.LOCALE
+
+# Prefix of token patterns which may match starting at any token
+TOKEN_PREFIX = "(.* )?"
+
+# Patterns containing any of these can't be token patterns, which is much
+# quicker to check than parsing the pattern
+_NOT_TOKENS_RE = re.compile(r"\\[A-Za-z0-9]|[+{^$]|(?<!\.)\*")
+
+# Keys of TokenTrie nodes holding the keys of texts which end at the node,
+# and the last tokens of open texts, respectively
+_EXACT = None
+_OPEN = 0
+
+
+def fold_case(text):
+    """
+    Fold the case of a string, such that any two strings which are equal
+    according to re.IGNORECASE are also equal after folding, as long as they
+    only contain ASCII characters after folding
+
+    :param str text: text to fold
+    :return: folded text
+    :rtype: str
+    """
+    return text.translate(_IGNORECASE_FIXES).lower()
+
+
+def parse_pattern(pattern, flags=0):
+    """
+    Parse a regular expression into a list of (opcode, argument) tuples, as
+    produced by the standard library's internal regex parser
+
+    :param str pattern: regular expression to parse
+    :param int flags: flags that the regular expression will be compiled with
+    :return: parsed regular expression, or None if the regular expression is invalid
+    """
+    try:
+        return sre_parse.parse(pattern, flags)
+    except Exception:
+        return None
+
+
+def _items(parsed):
+    # Parsed sub-patterns wrap a list of items, which is much faster to iterate
+    return getattr(parsed, "data", parsed)
+
+
+def _score(literals, max_length):
+    return min(min(len(lit), max_length) for lit in literals), -len(literals)
+
+
+def _is_literal_seq(items):
+    for op, av in _items(items):
+        if (op is not sre_constants.LITERAL) or (av >= 128):
+            return False
+
+    return True
+
+
+def _required(items, max_length):
+    candidates = []
+    run = []
+
+    for op, av in _items(items):
+        if (op is sre_constants.LITERAL) and (av < 128):
+            run.append(chr(av))
+            continue
+
+        if (op is sre_constants.SUBPATTERN) and _is_literal_seq(av[-1]):
+            run.extend(chr(c) for _, c in _items(av[-1]))
+            continue
+
+        if run:
+            candidates.append(frozenset([fold_case(u"".join(run))]))
+            run = []
+
+        if op is sre_constants.SUBPATTERN:
+            candidates.append(_required(av[-1], max_length))
+        elif (_ATOMIC_GROUP is not None) and (op is _ATOMIC_GROUP):
+            candidates.append(_required(av, max_length))
+        elif (op in _REPEATS) and (av[0] >= 1):
+            candidates.append(_required(av[2], max_length))
+        elif (op is sre_constants.IN) and _is_literal_seq(av):
+            candidates.append(frozenset(fold_case(chr(c)) for _, c in av))
+        elif op is sre_constants.BRANCH:
+            branches = [_required(branch, max_length) for branch in av[1]]
+            if all(branches):
+                candidates.append(frozenset().union(*branches))
+
+    if run:
+        candidates.append(frozenset([fold_case(u"".join(run))]))
+
+    candidates = [literals for literals in candidates if literals]
+    if not candidates:
+        return None
+
+    if len(candidates) == 1:
+        return candidates[0]
+
+    return max(candidates, key=lambda literals: _score(literals, max_length))
+
+
+def _product(prefixes, literals, max_length):
+    ret = set()
+    for prefix in prefixes:
+        if len(prefix) >= max_length:
+            ret.add(prefix)
+            continue
+
+        for literal in literals:
+            ret.add((prefix + literal)[:max_length])
+
+    return ret
+
+
+def _leading(items, max_length):
+    # Returns (prefixes, complete), where 'complete' is True if the prefixes
+    # are the complete strings matched by 'items'
+    prefixes = set([u""])
+
+    for op, av in _items(items):
+        if len(prefixes) > _MAX_PREFIXES:
+            return None, False
+
+        if all(len(prefix) >= max_length for prefix in prefixes):
+            return prefixes, False
+
+        if (op is sre_constants.LITERAL) and (av < 128):
+            literals, complete = [fold_case(chr(av))], True
+        elif (op is sre_constants.IN) and _is_literal_seq(av):
+            literals, complete = set(fold_case(chr(c)) for _, c in av), True
+        elif op is sre_constants.SUBPATTERN:
+            literals, complete = _leading(av[-1], max_length)
+        elif (_ATOMIC_GROUP is not None) and (op is _ATOMIC_GROUP):
+            literals, complete = _leading(av, max_length)
+        elif (op in _REPEATS) and (av[0] >= 1):
+            literals, complete = _leading(av[2], max_length)
+            complete = False
+        elif op is sre_constants.BRANCH:
+            literals, complete = set(), True
+            for branch in av[1]:
+                branch_literals, branch_complete = _leading(branch, max_length)
+                if branch_literals is None:
+                    literals = None
+                    break
+
+                literals.update(branch_literals)
+                complete = complete and branch_complete
+        else:
+            literals, complete = None, False
+
+        if literals is None:
+            return prefixes, False
+
+        prefixes = _product(prefixes, literals, max_length)
+        if not complete:
+            return prefixes, False
+
+    return prefixes, True
+
+
+def leading_literals(parsed, max_length=8):
+    """
+    Find a set of literal strings, one of which must appear at the start of
+    any text that matches a parsed regular expression. Literals are
+    case-folded with :func:`fold_case`, and truncated to ``max_length``
+    characters.
+
+    :param parsed: regular expression parsed by :func:`parse_pattern`
+    :param int max_length: maximum length of returned literals
+    :return: set of literal strings, or None if no leading literals could be found
+    :rtype: frozenset
+    """
+    prefixes, _ = _leading(parsed, max_length)
+    if (not prefixes) or (u"" in prefixes) or (len(prefixes) > _MAX_PREFIXES):
+        return None
+
+    return frozenset(prefixes)
+
+
+def has_group_references(parsed):
+    """
+    Check whether a parsed regular expression contains any backreferences
+    or conditional groups
+
+    :param parsed: regular expression parsed by :func:`parse_pattern`
+    :return: True if any group references were found
+    :rtype: bool
+    """
+    for op, av in _items(parsed):
+        if op in _GROUPREFS:
+            return True
+
+        if op is sre_constants.SUBPATTERN:
+            children = [av[-1]]
+        elif op is sre_constants.BRANCH:
+            children = av[1]
+        elif op in _REPEATS:
+            children = [av[2]]
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            children = [av[1]]
+        elif (_ATOMIC_GROUP is not None) and (op is _ATOMIC_GROUP):
+            children = [av]
+        else:
+            continue
+
+        for child in children:
+            if has_group_references(child):
+                return True
+
+    return False
+
+
+def _has_top_level_branch(pattern):
+    # Check whether a regular expression contains '|' outside of any group.
+    # Returns None if the parentheses are not balanced.
+    depth = 0
+    i = 0
+
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 1
+        elif char == "[":
+            # Skip character class; ']' right after '[' or '[^' is literal
+            i += 1
+            if pattern[i:i + 1] == "^":
+                i += 1
+            if pattern[i:i + 1] == "]":
+                i += 1
+            while (i < len(pattern)) and (pattern[i] != "]"):
+                if pattern[i] == "\\":
+                    i += 1
+                i += 1
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth < 0:
+                return None
+        elif (char == "|") and (depth == 0):
+            return True
+
+        i += 1
+
+    if depth != 0:
+        return None
+
+    return False
+
+
+def split_wildcard(pattern, flags=0, max_length=8):
+    """
+    Check whether a regular expression starts with a "match anything" prefix
+    of the form ``(.*C)?``, ``(.*)?`` or ``.*``, where ``C`` is a single
+    character with no case (e.g. ``(.* )?``), followed by the rest of the
+    expression which must start with known literal strings. Such expressions
+    can be matched much faster by trying the rest of the expression only at
+    the positions in the input text where it can start.
+
+    :param str pattern: regular expression to analyze
+    :param int flags: flags that the regular expression will be compiled with
+    :param int max_length: maximum length of returned literals
+    :return: None if the regular expression cannot be split, otherwise a tuple\
+        of the form ``(source, compiled, capture, sep, prefixes, parsed)``,\
+        where ``source`` is a regular expression matching the rest of the\
+        expression after the prefix up to the end of the text, ``compiled``\
+        and ``parsed`` are the compiled and parsed forms of ``source``,\
+        ``capture`` is True if the prefix is a capturing group, ``sep`` is\
+        the character ``C`` (or None) and ``prefixes`` is the set of leading\
+        literals of the rest of the expression (see :func:`leading_literals`)
+    :rtype: tuple
+    """
+    if flags & re.VERBOSE:
+        return None
+
+    m = _WILDCARD_RE.match(pattern)
+    if m is None:
+        return None
+
+    capture = pattern.startswith("(")
+    sep = m.group(2)
+    rest = pattern[m.end():]
+
+    if (sep is not None) and ((ord(sep) >= 128) or (sep.lower() != sep.upper()) or (sep == "\n")):
+        return None
+
+    # The prefix must not be followed by a quantifier, and the rest of the
+    # expression must not be an alternation, otherwise the prefix would not
+    # apply to all of it
+    if (not rest) or (rest[0] in "*+?{") or (_has_top_level_branch(rest) is not False):
+        return None
+
+    # Global inline flags would apply to the prefix too. They are checked in
+    # the source, since before Python 3.11 they are accepted anywhere in the
+    # pattern and, when already given in 'flags', leave no trace in the
+    # compiled flags.
+    if any(m.group(1) for m in _GLOBAL_FLAGS_RE.finditer(rest)):
+        return None
+
+    source = "(?:%s)$" % rest
+    try:
+        compiled, parsed = compile_pattern(source, flags)
+    except Exception:
+        return None
+
+    if has_group_references(parsed):
+        return None
+
+    prefixes = leading_literals(parsed, max_length)
+    if prefixes is None:
+        return None
+
+    return source, compiled, capture, sep, prefixes, parsed
+
+
+def count_subgroups(pattern):
+    """
+    Count the capturing groups in a regular expression without parsing it,
+    which is much quicker than compiling it. Escaped parentheses, and
+    parentheses in character classes, are not counted, but parentheses in
+    comments and in patterns using the re.VERBOSE flag may be.
+
+    :param str pattern: regular expression to check
+    :return: number of capturing groups
+    :rtype: int
+    """
+    return sum(1 for group in _SUBGROUP_RE.findall(pattern) if group)
+
+
+def plain_key(pattern, flags=0):
+    """
+    Check if a pattern contains no special characters, meaning that, when
+    anchored at both ends, it only matches text which is equal to the pattern
+    (apart from an optional newline at the end of the text). Such patterns can
+    be looked up in a hash table instead of being compiled.
+
+    :param str pattern: regular expression to check
+    :param int flags: flags that the regular expression will be compiled with
+    :return: key that text matching the pattern is equal to, after folding\
+        its case with :func:`fold_case` if 'flags' contains re.IGNORECASE, or\
+        None if the pattern is not plain
+    :rtype: str
+    """
+    if (not _exact_flags(flags)) or (not _PLAIN_RE.fullmatch(pattern)):
+        return None
+
+    if flags & re.IGNORECASE:
+        return fold_case(pattern)
+
+    return pattern
+
+
+def _exact_flags(flags):
+    # Check whether printable ASCII text in a pattern compiled with 'flags'
+    # only matches text which is equal to it after folding case (if
+    # re.IGNORECASE is set). fold_case is only exact for IGNORECASE's full
+    # Unicode matching, so re.ASCII is not supported with re.IGNORECASE.
+    if flags & _PLAIN_EXCLUDED_FLAGS:
+        return False
+
+    return not ((flags & re.IGNORECASE) and (flags & re.ASCII))
+
+
+def _token_char(code, flags):
+    # Text matched by the character 'code' in token_pattern expansions
+    if (code < 32) or (code > 126):
+        return None
+
+    return chr(code).lower() if (flags & re.IGNORECASE) else chr(code)
+
+
+def _token_concat(first, second):
+    ret = []
+    seen = set()
+
+    for text, is_open in first:
+        if is_open:
+            # Nothing but empty text can follow "match anything"
+            if any(rest for rest, _ in second):
+                return None
+
+            items = [(text, True)]
+        else:
+            items = [(text + rest, rest_open) for rest, rest_open in second]
+
+        for item in items:
+            if item not in seen:
+                seen.add(item)
+                ret.append(item)
+
+    return ret
+
+
+def _token_items(items, flags, max_expansions):
+    # Returns the (text, open) expansions of a list of parsed items, or None
+    ret = [("", False)]
+    run = []
+
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            # Runs of literal characters are added to the expansions at once
+            char = _token_char(av, flags)
+            if char is None:
+                return None
+
+            run.append(char)
+            continue
+
+        if run:
+            ret = _token_concat(ret, [("".join(run), False)])
+            if ret is None:
+                return None
+
+            run = []
+
+        if op is sre_constants.IN:
+            alternatives = []
+            for item_op, item_av in av:
+                if item_op is sre_constants.LITERAL:
+                    codes = [item_av]
+                elif (item_op is sre_constants.RANGE) and ((item_av[1] - item_av[0]) < max_expansions):
+                    codes = range(item_av[0], item_av[1] + 1)
+                else:
+                    return None
+
+                for code in codes:
+                    char = _token_char(code, flags)
+                    if char is None:
+                        return None
+
+                    alternatives.append((char, False))
+        elif op is sre_constants.SUBPATTERN:
+            # Inline flags, e.g. (?i:abc)
+            if (len(av) == 4) and (av[1] or av[2]):
+                return None
+
+            alternatives = _token_items(_items(av[-1]), flags, max_expansions)
+        elif op is sre_constants.BRANCH:
+            alternatives = []
+            for branch in av[1]:
+                expansions = _token_items(_items(branch), flags, max_expansions)
+                if expansions is None:
+                    return None
+
+                alternatives.extend(expansions)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, sub = av
+            if (low, high) == (0, sre_constants.MAXREPEAT) and (_items(sub) == [(sre_constants.ANY, None)]):
+                alternatives = [("", True)]
+            elif (low, high) == (0, 1):
+                alternatives = _token_items(_items(sub), flags, max_expansions)
+                if alternatives is not None:
+                    alternatives = alternatives + [("", False)]
+            else:
+                return None
+        else:
+            return None
+
+        if alternatives is None:
+            return None
+
+        ret = _token_concat(ret, alternatives)
+        if (ret is None) or (len(ret) > max_expansions):
+            return None
+
+    if run:
+        ret = _token_concat(ret, [("".join(run), False)])
+
+    return ret
+
+
+def token_pattern(pattern, flags=0, max_expansions=64):
+    """
+    Check if a pattern matches a small, fixed set of texts, which can be
+    looked up by their tokens (the parts of the text separated by single
+    spaces) in a :class:`TokenTrie`. This is the case for patterns made of
+    printable ASCII text, optional items (``?``), alternations, character
+    classes listing only characters and ranges, and optionally ending with
+    "match anything" (``.*``). The pattern may also start with ``(.* )?``,
+    in which case the rest of the pattern may match starting at any token.
+    For example, ``(.* )?(talk about|tell( me)? about) cats?.*``.
+
+    :param str pattern: regular expression to check
+    :param int flags: flags that the regular expression will be compiled with
+    :param int max_expansions: maximum number of texts the pattern may match
+    :return: tuple of the form ``(source, prefixed, expansions, parsed)``,\
+        where ``source`` is the pattern, or the rest of the pattern after the\
+        prefix, ``prefixed`` is True if the pattern has the prefix,\
+        ``expansions`` is a list of tuples of the form ``(text, open)``, one\
+        for each text that ``source`` matches (case-folded, if 'flags'\
+        contains re.IGNORECASE), where ``open`` is True if the text may be\
+        followed by anything, and ``parsed`` is ``source``, parsed. None if\
+        the pattern can't be looked up by its tokens.
+    :rtype: tuple
+    """
+    if (not _exact_flags(flags)) or _NOT_TOKENS_RE.search(pattern):
+        return None
+
+    prefixed = pattern.startswith(TOKEN_PREFIX)
+    source = pattern[len(TOKEN_PREFIX):] if prefixed else pattern
+
+    # A top-level alternation would not be anchored at both ends, and the
+    # prefix must not be followed by a quantifier
+    if (not source) or (source[0] in "*?") or (_has_top_level_branch(source) is not False):
+        return None
+
+    parsed = parse_pattern(source, flags)
+    if parsed is None:
+        return None
+
+    # Inline flags, e.g. (?x)
+    state = getattr(parsed, "state", None) or parsed.pattern
+    if state.flags != _default_flags(flags):
+        return None
+
+    expansions = _token_items(_items(parsed), flags, max_expansions)
+    if expansions is None:
+        return None
+
+    return source, prefixed, expansions, parsed
+
+
+_flags_cache = {}
+
+
+def _default_flags(flags):
+    # Flags of a compiled regular expression with no inline flags
+    flags = int(flags)
+    if flags not in _flags_cache:
+        _flags_cache[flags] = compile_pattern("", flags)[0].flags
+
+    return _flags_cache[flags]
+
+
+def required_literals(pattern, flags=0, max_length=8):
+    """
+    Find a set of literal strings, at least one of which must appear in any
+    text that matches a regular expression. Literals are case-folded with
+    :func:`fold_case`, and truncated to ``max_length`` characters.
+
+    :param str pattern: regular expression to analyze
+    :param int flags: flags that the regular expression will be compiled with
+    :param int max_length: maximum length of returned literals
+    :return: set of literal strings, or None if no required literals could be found
+    :rtype: frozenset
+    """
+    parsed = parse_pattern(pattern, flags)
+    if parsed is None:
+        return None
+
+    literals = _required(parsed, max_length)
+    if literals is None:
+        return None
+
+    return frozenset(lit[:max_length] for lit in literals)
+
+
+def compile_pattern(pattern, flags=0):
+    """
+    Parse and compile a regular expression, returning the parsed form along
+    with the compiled regular expression so that the regular expression does
+    not need to be parsed a second time for analysis
+
+    :param str pattern: regular expression to compile
+    :param int flags: flags to compile the regular expression with
+    :return: tuple of the form ``(compiled, parsed)``
+    :rtype: tuple
+    """
+    # Use a plain int, since checking RegexFlag values is much slower
+    flags = int(flags)
+    parsed = sre_parse.parse(pattern, flags)
+    return sre_compile.compile(parsed, flags), parsed
+
+
+def group_literals(parsed, groups, max_length=8):
+    """
+    Find required literal strings (see :func:`required_literals`) for the
+    contents of named groups in a parsed regular expression, where the regular
+    expression is either a single group, or an alternation of groups, e.g.
+    ``(?P<a>...)|(?P<b>...)``.
+
+    :param parsed: regular expression parsed by :func:`compile_pattern`
+    :param dict groups: dict mapping group indexes to names, for the groups\
+        to analyze
+    :param int max_length: maximum length of returned literals
+    :return: dict mapping group names to sets of literal strings (or None,\
+        if no required literals could be found)
+    :rtype: dict
+    """
+    ret = {}
+    for name, contents in group_contents(parsed, groups).items():
+        literals = _required(contents, max_length)
+        if literals is not None:
+            literals = frozenset(lit[:max_length] for lit in literals)
+
+        ret[name] = literals
+
+    return ret
+
+
+def group_contents(parsed, groups):
+    """
+    Find the parsed contents of named groups in a parsed regular expression,
+    where the regular expression is either a single group, or an alternation
+    of groups, e.g. ``(?P<a>...)|(?P<b>...)``.
+
+    :param parsed: regular expression parsed by :func:`compile_pattern`
+    :param dict groups: dict mapping group indexes to names, for the groups\
+        to find
+    :return: dict mapping group names to parsed group contents
+    :rtype: dict
+    """
+    items = _items(parsed)
+    if (len(items) == 1) and (items[0][0] is sre_constants.BRANCH):
+        items = [branch[0] for branch in items[0][1][1] if len(branch) == 1]
+
+    ret = {}
+    for op, av in items:
+        if (op is sre_constants.SUBPATTERN) and (av[0] in groups):
+            ret[groups[av[0]]] = av[-1]
+
+    return ret
+
+
+class LiteralIndex(object):
+    """
+    Trie of case-folded literal strings, used to quickly find which keys have
+    at least one associated literal string occurring somewhere in input text.
+    Literals can be added and removed at any time without rebuilding the index.
+
+    :ivar int max_length: maximum length of literals stored in the index
+    """
+    def __init__(self, max_length=8):
+        self.max_length = max_length
+        self.root = {}
+
+    def add(self, literal, key):
+        """
+        Associate a literal string with a key
+
+        :param str literal: literal string
+        :param key: hashable object to return from ``search`` when the literal\
+            string occurs in the searched text
+        """
+        node = self.root
+        for char in literal[:self.max_length]:
+            node = node.setdefault(char, {})
+
+        keys = node.setdefault(None, {})
+        keys[key] = keys.get(key, 0) + 1
+
+    def remove(self, literal, key):
+        """
+        Remove an association previously made with ``add``
+
+        :param str literal: literal string
+        :param key: key associated with the literal string
+        """
+        node = self.root
+        for char in literal[:self.max_length]:
+            node = node[char]
+
+        keys = node[None]
+        keys[key] -= 1
+        if keys[key] == 0:
+            del keys[key]
+
+    def search(self, text):
+        """
+        Find all keys with an associated literal string occurring in text
+
+        :param str text: case-folded text to search (see :func:`fold_case`)
+        :return: set of keys
+        :rtype: set
+        """
+        ret = set()
+        root = self.root
+        max_length = self.max_length
+
+        for i in range(len(text)):
+            node = root.get(text[i])
+            j = i + 1
+
+            while node is not None:
+                keys = node.get(None)
+                if keys:
+                    ret.update(keys)
+
+                if (j - i) >= max_length or j >= len(text):
+                    break
+
+                node = node.get(text[j])
+                j += 1
+
+        return ret
+
+
+class TokenTrie(object):
+    """
+    Trie of token sequences, used to quickly find which keys have an
+    associated text (see :func:`token_pattern`) that matches input text, in a
+    single pass over the tokens of the input text, however many texts are
+    stored. Tokens are the parts of a text separated by single spaces. Texts
+    can be added and removed at any time without rebuilding the trie.
+
+    :ivar int size: number of texts stored
+    """
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+        # Length of the longest last token of any open text, and the number
+        # of open texts with each length of last token
+        self.max_partial = 0
+        self.partial_lengths = {}
+
+    def _node(self, text, is_open):
+        tokens = text.split(" ")
+        partial = tokens.pop() if is_open else None
+
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+
+        if partial is None:
+            return node.setdefault(_EXACT, [])
+
+        length = len(partial)
+        self.partial_lengths[length] = self.partial_lengths.get(length, 0) + 1
+        self.max_partial = max(self.max_partial, length)
+        return node.setdefault(_OPEN, {}).setdefault(partial, [])
+
+    def add(self, text, is_open, key):
+        """
+        Associate a text with a key
+
+        :param str text: text, case-folded if necessary
+        :param bool is_open: if True, the text matches input text which starts\
+            with the text, rather than only input text equal to the text
+        :param key: hashable object to return from ``search`` when the text\
+            matches the searched tokens
+        """
+        self._node(text, is_open).append(key)
+        self.size += 1
+
+    def remove(self, text, is_open, key):
+        """
+        Remove an association previously made with ``add``
+
+        :param str text: text
+        :param bool is_open: value of 'is_open' the text was added with
+        :param key: key associated with the text
+        """
+        tokens = text.split(" ")
+        partial = tokens.pop() if is_open else None
+
+        # Walk down without creating nodes, remembering the path so that
+        # nodes left empty can be pruned on the way back up
+        path = []
+        node = self.root
+        for token in tokens:
+            path.append((node, token))
+            node = node[token]
+
+        if partial is None:
+            keys = node[_EXACT]
+            keys.remove(key)
+            if not keys:
+                del node[_EXACT]
+        else:
+            partials = node[_OPEN]
+            keys = partials[partial]
+            keys.remove(key)
+            if not keys:
+                del partials[partial]
+                if not partials:
+                    del node[_OPEN]
+
+            length = len(partial)
+            self.partial_lengths[length] -= 1
+            if self.partial_lengths[length] == 0:
+                del self.partial_lengths[length]
+                if length == self.max_partial:
+                    self.max_partial = max(self.partial_lengths) if self.partial_lengths else 0
+
+        for parent, token in reversed(path):
+            if node:
+                break
+
+            del parent[token]
+            node = parent
+
+        self.size -= 1
+
+    def search(self, tokens, start=0):
+        """
+        Find all keys with an associated text matching ``tokens[start:]``
+
+        :param list tokens: tokens of the input text, case-folded if necessary
+        :param int start: index of the first token to match from
+        :return: list of keys, possibly with duplicates
+        :rtype: list
+        """
+        ret = []
+        node = self.root
+        max_partial = self.max_partial
+
+        for i in range(start, len(tokens)):
+            token = tokens[i]
+            partials = node.get(_OPEN)
+            if partials:
+                for length in range(min(len(token), max_partial) + 1):
+                    keys = partials.get(token[:length])
+                    if keys:
+                        ret.extend(keys)
+
+            node = node.get(token)
+            if node is None:
+                return ret
+
+        keys = node.get(_EXACT)
+        if keys:
+            ret.extend(keys)
+
+        return ret
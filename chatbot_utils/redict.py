@@ -1,4 +1,255 @@
 import re
+import threading
+import time
+from collections import OrderedDict
+from operator import attrgetter
+
+from chatbot_utils.analysis import PatternReport, analyze_parsed
+from chatbot_utils.backends import DEFAULT_BACKEND
+from chatbot_utils.literals import (TOKEN_PREFIX, LiteralIndex, TokenTrie,
+    count_subgroups, fold_case, group_contents, group_literals, plain_key,
+    split_wildcard, token_pattern)
+
+
+# Default maximum number of patterns in a block (see ReDict.set_block_size)
+DEFAULT_GROUPS_PER_REGEX = 50
+
+# Default maximum total number of subgroups of the patterns in a block
+DEFAULT_SUBGROUPS_PER_REGEX = 50
+
+
+class MatchTimeoutError(Exception):
+    """
+    Raised when a ReDict lookup with a deadline runs out of time. Lookups
+    check the deadline before trying the first block of patterns, and after
+    each block of patterns that does not match.
+
+    :ivar str text: input text of the lookup
+    :ivar int position: position of the block of patterns that was being\
+        tried when the deadline passed, or None if the deadline had already\
+        passed before the lookup started
+    :ivar list patterns: patterns in the block that was being tried when the\
+        deadline passed, or None
+    """
+    def __init__(self, text, position=None, patterns=None):
+        if position is None:
+            msg = "Deadline passed before matching '%s'" % text
+        else:
+            msg = "Deadline passed while matching '%s' against block %d" % (text, position)
+
+        super(MatchTimeoutError, self).__init__(msg)
+        self.text = text
+        self.position = position
+        self.patterns = patterns
+
+
+class _Wildcard(object):
+    """
+    A pattern starting with a "match anything" prefix such as ``(.* )?``
+    (see :func:`chatbot_utils.literals.split_wildcard`). Instead of matching
+    the whole pattern from the start of the input text, which backtracks
+    through every possible prefix, the rest of the pattern is only tried at
+    positions where one of its leading literals occurs, in the same order the
+    prefix would have tried them.
+
+    :ivar str groupname: group name of the pattern
+    :ivar int gid: group ID of the pattern, used for ordering
+    :ivar str source: source of the regular expression for the rest of the\
+        pattern after the prefix
+    :ivar bool capture: True if the prefix is a capturing group
+    :ivar str sep: character that must end the prefix, or None
+    :ivar frozenset prefixes: case-folded literals, one of which must occur\
+        at the start of any text matching the rest of the pattern
+    :ivar compiled: compiled regular expression for 'source', or None if it\
+        needs to be (re-)compiled
+    """
+    __slots__ = ['groupname', 'gid', 'source', 'capture', 'sep', 'prefixes', 'compiled']
+
+    def __init__(self, groupname, source, compiled, capture, sep, prefixes):
+        self.groupname = groupname
+        self.gid = int(groupname[1:])
+        self.source = source
+        self.capture = capture
+        self.sep = sep
+        self.prefixes = prefixes
+        self.compiled = compiled
+
+    def __getstate__(self):
+        return (self.groupname, self.gid, self.source, self.capture, self.sep,
+                self.prefixes)
+
+    def __setstate__(self, state):
+        (self.groupname, self.gid, self.source, self.capture, self.sep,
+         self.prefixes) = state
+        self.compiled = None
+
+    def match(self, text, folded, end):
+        """
+        Match the pattern against text
+
+        :param str text: text to match against
+        :param str folded: text, case-folded with :func:`chatbot_utils.literals.fold_case`
+        :param int end: index of the first character in text that the prefix\
+            cannot match (the first newline, if any, otherwise len(text))
+        :return: tuple of subgroups from the match, or None if no match
+        :rtype: tuple
+        """
+        # The prefix can only cover text[:end], plus the separator, if any
+        limit = end if self.sep is None else end + 1
+        positions = []
+        for prefix in self.prefixes:
+            i = folded.find(prefix, 0, limit + len(prefix))
+            while i != -1:
+                positions.append(i)
+                i = folded.find(prefix, i + 1, limit + len(prefix))
+
+        if not positions:
+            return None
+
+        # Greedy prefix tries the longest prefix first
+        positions.sort(reverse=True)
+        regex = self.compiled
+        sep = self.sep
+        last = None
+
+        for i in positions:
+            if i == last:
+                continue
+
+            last = i
+            if sep is not None:
+                if (i == 0) or (text[i - 1] != sep):
+                    continue
+            elif i > end:
+                continue
+
+            m = regex.match(text, i)
+            if m:
+                return ((text[:i],) + m.groups()) if self.capture else m.groups()
+
+        if (sep is not None) and (positions[-1] == 0):
+            # Prefix group doesn't participate in the match
+            m = regex.match(text, 0)
+            if m:
+                return (None,) + m.groups()
+
+        return None
+
+
+class _TokenPattern(object):
+    """
+    A pattern which matches a small, fixed set of texts (see
+    :func:`chatbot_utils.literals.token_pattern`). Instead of being matched as
+    part of its block's compiled regular expressions, the tokens of the input
+    text are looked up in a :class:`chatbot_utils.literals.TokenTrie` holding
+    the texts of all such patterns. The regular expression is only compiled,
+    when first needed, to find the subgroups of a match.
+
+    :ivar str groupname: group name of the pattern
+    :ivar int gid: group ID of the pattern, used for ordering
+    :ivar str pattern: the pattern
+    :ivar bool prefixed: True if the pattern starts with ``(.* )?``
+    :ivar compiled: compiled regular expression for the pattern, or for the\
+        rest of the pattern after ``(.* )?``, or None if it needs to be\
+        (re-)compiled
+    """
+    __slots__ = ['groupname', 'gid', 'pattern', 'prefixed', 'compiled']
+
+    def __init__(self, groupname, pattern, prefixed):
+        self.groupname = groupname
+        self.gid = int(groupname[1:])
+        self.pattern = pattern
+        self.prefixed = prefixed
+        self.compiled = None
+
+    def __getstate__(self):
+        return (self.groupname, self.gid, self.pattern, self.prefixed)
+
+    def __setstate__(self, state):
+        self.groupname, self.gid, self.pattern, self.prefixed = state
+        self.compiled = None
+
+
+class _Block(object):
+    """
+    A contiguous run of patterns from a ReDict, compiled together into one or
+    more regular expressions
+
+    :ivar list groupnames: group names of the patterns in this block, in the\
+        order they were added
+    :ivar list compiled: compiled regular expressions for this block, or None\
+        if the block needs to be (re-)compiled
+    :ivar list sources: source strings of the compiled regular expressions\
+        for this block, or None if the block has been modified since it was\
+        last compiled
+    :ivar list spans: one dict per compiled regular expression, mapping the\
+        index of each pattern's outer group to a tuple of the form\
+        ``(groupname, start, end)``, where ``start`` and ``end`` give the slice\
+        of ``MatchObject.groups()`` belonging to that pattern
+    :ivar list literals: literal strings added to the ReDict's literal index\
+        for the patterns in this block
+    :ivar bool unfiltered: True if this block contains any patterns with no\
+        required literals, meaning the block must be tried for all input text
+    :ivar int position: position of this block in the ReDict's list of blocks
+    :ivar list wildcards: _Wildcard instances for patterns in this block\
+        which are matched separately, rather than as part of the compiled\
+        regular expressions, in the order they were added
+    :ivar dict analysis: dict mapping group names to tuples of the form\
+        ``(issues, degree)``, as returned by\
+        :func:`chatbot_utils.analysis.analyze_parsed`
+    :ivar tuple all_compiled: state used by ``ReDict.match_all``, or None if\
+        not needed yet. A tuple of the form ``(names, positions, nodes)``,\
+        where ``names`` lists the group names of the patterns in this block\
+        that are not wildcards, ``positions`` maps each of those names to its\
+        position in ``names``, and ``nodes`` maps ``(start, end)`` tuples to\
+        a tuple of the form ``(compiled, spans)`` for the patterns\
+        ``names[start:end]``, compiled when first needed
+    :ivar dict plain: dict mapping the group names of plain patterns in this\
+        block to their keys in ``ReDict.plain_patterns``. Plain patterns are\
+        not compiled.
+    :ivar list tokens: _TokenPattern instances for patterns in this block\
+        which are looked up in the ReDict's token tries, rather than matched\
+        as part of the compiled regular expressions
+    :ivar int subgroups: total number of subgroups of the patterns in this\
+        block (see :func:`chatbot_utils.literals.count_subgroups`)
+    """
+    __slots__ = ['groupnames', 'compiled', 'sources', 'spans', 'literals', 'unfiltered',
+                 'position', 'wildcards', 'analysis', 'all_compiled', 'plain', 'tokens',
+                 'subgroups']
+
+    def __init__(self):
+        self.groupnames = []
+        self.compiled = None
+        self.sources = None
+        self.spans = None
+        self.literals = []
+        self.unfiltered = False
+        self.position = 0
+        self.wildcards = []
+        self.analysis = {}
+        self.all_compiled = None
+        self.plain = {}
+        self.tokens = []
+        self.subgroups = 0
+
+    def __getstate__(self):
+        # Compiled regular expressions are not stored; they are re-compiled
+        # from 'sources' when needed
+        return (self.groupnames, self.sources, self.spans, self.literals,
+                self.unfiltered, self.position, self.wildcards, self.analysis,
+                self.plain, self.tokens, self.subgroups)
+
+    def __setstate__(self, state):
+        (self.groupnames, self.sources, self.spans, self.literals,
+         self.unfiltered, self.position, self.wildcards, self.analysis,
+         self.plain, self.tokens, self.subgroups) = state
+        self.compiled = None
+        self.all_compiled = None
+
+
+_block_position = attrgetter('position')
+_token_gid = attrgetter('gid')
+
 
 class ReDict(dict):
     """
@@ -22,19 +273,165 @@ class ReDict(dict):
 	2
 	>>> d['dict key']
 	2
+
+    :param int cache_size: if greater than 0, the results of the most recent\
+        ``cache_size`` lookups (including lookups that found no match) are\
+        cached, keyed by the exact input text. The cache is cleared whenever\
+        the dict is modified.
+    :param chatbot_utils.backends.Backend backend: regular expression engine\
+        used to compile patterns. If None, the standard library's ``re``\
+        module is used.
     """
     def __init__(self, *args, **kwargs):
+        cache_size = kwargs.pop('cache_size', 0)
+        backend = kwargs.pop('backend', None)
         super(ReDict, self).__init__(*args, **kwargs)
 
-        # This *must* be lower than 100
-        self.groups_per_regex = 75
+        # Regular expression engine used to compile patterns
+        self.backend = DEFAULT_BACKEND if backend is None else backend
+
+        # Maximum number of patterns, and total number of subgroups of the
+        # patterns, in each block (see set_block_size)
+        self.groups_per_regex = DEFAULT_GROUPS_PER_REGEX
+        self.subgroups_per_regex = DEFAULT_SUBGROUPS_PER_REGEX
 
         self.flags = re.IGNORECASE
         self.groupid = 1
         self.compiled = None
+        self.compile_lock = threading.RLock()
         self.patterns = {}
         self.subgroups = None
 
+        # Patterns are grouped into blocks of at most 'groups_per_regex'
+        # patterns, so that adding or removing a pattern only requires the
+        # block containing that pattern to be re-compiled. Blocks also hold
+        # no more than 'subgroups_per_regex' subgroups in total, since a
+        # block's regular expressions get slower to match as the number of
+        # groups in them grows.
+        self.blocks = []
+        self.block_map = {}
+
+        # Index of literal strings required by each pattern, used to skip
+        # blocks that cannot possibly match the input text
+        self.literal_index = LiteralIndex()
+        self.unfiltered_blocks = []
+
+        # Patterns with no special characters (see literals.plain_key) are
+        # not compiled, but looked up by their case-folded text, before any
+        # blocks are tried. Maps each key to the group names of the patterns
+        # with that key, in the order they were added.
+        self.plain_patterns = {}
+
+        # Patterns matching a small, fixed set of texts, such as
+        # "(.* )?(talk about|tell( me)? about) cats?.*", are not compiled
+        # either (see literals.token_pattern). Their texts are stored in
+        # tries, which are searched with the tokens of the input text: from
+        # the first token only, or from every token for patterns starting
+        # with "(.* )?".
+        self.token_trie = TokenTrie()
+        self.prefixed_token_trie = TokenTrie()
+
+        # Index of the leading literals of each wildcard pattern, used by
+        # match_all to skip wildcard patterns that cannot match. Built when
+        # first needed, after each compile.
+        self.wildcard_index = None
+
+        self.cache = None
+        self.cache_size = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.set_cache_size(cache_size)
+
+        # Receives lookup and compile measurements, see set_instrument
+        self.instrument = None
+        self.name = None
+
+    def set_cache_size(self, cache_size):
+        """
+        Set the maximum number of lookup results to cache. Setting a size of 0
+        disables the cache.
+
+        :param int cache_size: maximum number of cached lookup results
+        """
+        self.cache_size = cache_size
+        self.cache = OrderedDict() if cache_size > 0 else None
+        return self
+
+    def set_backend(self, backend):
+        """
+        Set the regular expression engine used to compile patterns. All
+        patterns are re-compiled with the new engine on next use.
+
+        :param chatbot_utils.backends.Backend backend: engine to use
+        """
+        self.backend = backend
+        for block in self.blocks:
+            block.compiled = None
+            block.all_compiled = None
+            for token in block.tokens:
+                token.compiled = None
+
+        self.compiled = None
+        if self.cache:
+            self.cache.clear()
+
+        # Blocks may have more groups than the new engine supports
+        max_groups = backend.max_groups
+        if (max_groups is not None) and any((len(block.groupnames) + block.subgroups) > max_groups
+                                            for block in self.blocks):
+            self._layout()
+
+        return self
+
+    def set_block_size(self, block_size):
+        """
+        Set the maximum size of the blocks of patterns which are compiled
+        together into one regular expression. Larger blocks mean fewer
+        regular expressions to try for each lookup, but each one is slower to
+        match, especially when the patterns have many subgroups, and to
+        re-compile after a pattern in the block is added or removed. Existing
+        patterns are re-arranged into new blocks, which are all re-compiled
+        on next use.
+
+        Blocks never hold more groups than the regular expression engine
+        supports (see ``chatbot_utils.backends.Backend.max_groups``).
+
+        :param chatbot_utils.tuning.BlockSize block_size: block size limits,\
+            for example from :func:`chatbot_utils.tuning.calibrate`
+        """
+        self.groups_per_regex = block_size.patterns
+        self.subgroups_per_regex = block_size.subgroups
+        self._layout()
+        return self
+
+    def set_instrument(self, instrument, name=None):
+        """
+        Report the duration of each lookup and compile, the number of blocks
+        of patterns tried and the block that matched to an instrument.
+        Lookups are only timed while an instrument is set.
+
+        :param chatbot_utils.instrument.Instrument instrument: instrument to\
+            report to, or None to stop reporting
+        :param str name: name identifying this dict in the reports
+        """
+        self.instrument = instrument
+        self.name = name
+        return self
+
+    def cache_info(self):
+        """
+        Return statistics about the lookup result cache
+
+        :return: dict with keys ``hits``, ``misses``, ``size`` and ``max_size``
+        :rtype: dict
+        """
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "size": len(self.cache) if self.cache is not None else 0,
+            "max_size": self.cache_size
+        }
+
     def groups(self):
         """
         Return tuple of all subgroups from the last regex match performed
@@ -45,66 +442,231 @@ class ReDict(dict):
         """
         return self.subgroups
 
+    def _compile_range(self, names, start, end):
+        # Compiles the patterns names[start:end] into a single alternation,
+        # like a block, which is within the backend's limit on groups
+        regex = "|".join(["(?P<%s>^%s$)" % (name, self.patterns[name][0])
+                          for name in names[start:end]])
+        compiled = self.backend.compile(regex, self.flags)
+
+        indexes = sorted((compiled.groupindex[name], name) for name in names[start:end])
+        spans = {}
+        for i in range(len(indexes)):
+            index, name = indexes[i]
+            stop = indexes[i + 1][0] - 1 if (i + 1) < len(indexes) else compiled.groups
+            spans[index] = (name, index, stop)
+
+        return compiled, spans
+
+    def _match_range(self, block, start, end, first, text, matches):
+        # Finds all patterns matching 'text' in names[first:end], where
+        # start:end is a node of a binary tree of ranges over 'names'. Each
+        # node is compiled into one alternation, which finds the first
+        # matching pattern in the node; the rest are found in its children.
+        if end <= first:
+            return
+
+        names, positions, nodes = block.all_compiled
+        if start >= first:
+            if (start, end) not in nodes:
+                nodes[(start, end)] = self._compile_range(names, start, end)
+
+            compiled, spans = nodes[(start, end)]
+            m = compiled.match(text)
+            if not (m and m.lastgroup):
+                return
+
+            name, index, stop = spans[m.lastindex]
+            matches.append((int(name[1:]), name, m.groups()[index:stop]))
+            first = positions[name] + 1
+
+        if (end - start) > 1:
+            middle = (start + end) // 2
+            self._match_range(block, start, middle, first, text, matches)
+            self._match_range(block, middle, end, first, text, matches)
+
     def _block_to_regexs(self, block):
-        total_len = len(block)
-        override_slice = None
-        num_regexs = 1
-        start = 0
-        ret = []
-        end = 0
-        i = 0
-
-        while True:
-            slice_size = int(total_len / num_regexs)
-
-            while start < total_len:
-                start = i * slice_size                   # Slice start index
-                end = min(total_len, start + slice_size) # Slice end index
-                blockslice = block[start:end]
-                regex = '|'.join(blockslice)
-
-                try:
-                    compiled = re.compile(regex, flags=self.flags)
-                except AssertionError:
-                    # Raises AssertionError for too many named groups
-                    if (num_regexs == total_len) or (len(block) == 1):
-                        raise AssertionError("Too many groups in regex '%s'"
-                            % regex)
-
-                    num_regexs *= 2
-                    i = 0
-                    ret = []
-                    break
+        # Blocks are laid out within the backend's limit on groups (see
+        # _block_full), so each one compiles into a single regular expression.
+        # Errors from the backend, e.g. for an invalid pattern, propagate.
+        regex = '|'.join(block)
+        compiled, parsed = self.backend.compile_parsed(regex, self.flags)
+        return [(compiled, regex, parsed)]
 
-                i += 1
-                ret.append(compiled)
+    def _index_token(self, token, expansions, add):
+        trie = self.prefixed_token_trie if token.prefixed else self.token_trie
+        for text, is_open in expansions:
+            if add:
+                trie.add(text, is_open, token)
+            else:
+                trie.remove(text, is_open, token)
 
-            if ret:
-                break
+    def _unindex_block(self, block):
+        for literal in block.literals:
+            self.literal_index.remove(literal, block)
 
-        return ret
+        # Expansions are not stored, to save memory, so they are found again
+        for token in block.tokens:
+            self._index_token(token, token_pattern(token.pattern, self.flags)[2], False)
+
+        block.literals = []
+        block.tokens = []
+        block.unfiltered = False
+
+    def _index_block(self, block, literals):
+        for name in block.groupnames:
+            if name in block.plain:
+                continue
+
+            required = literals.get(name)
+            if required is None:
+                block.unfiltered = True
+                continue
+
+            for literal in required:
+                self.literal_index.add(literal, block)
+                block.literals.append(literal)
+
+    def _compile_block(self, block):
+        self._unindex_block(block)
+        names = []
+        literals = {}
+        block.wildcards = []
+        block.analysis = {}
+
+        for name in block.groupnames:
+            if name in block.plain:
+                block.analysis[name] = ([], 1)
+                continue
+
+            pattern = self.patterns[name][0]
+            token = token_pattern(pattern, self.flags)
+            if token is not None:
+                _, prefixed, expansions, parsed = token
+                token = _TokenPattern(name, pattern, prefixed)
+                self._index_token(token, expansions, True)
+                block.tokens.append(token)
+                block.analysis[name] = analyze_parsed(parsed, wildcard=prefixed)
+
+                # Not matched with the block, so no literals are required
+                literals[name] = ()
+                continue
+
+            split = split_wildcard(self.patterns[name][0], self.flags)
+            if split is None:
+                names.append(name)
+            else:
+                source, compiled, capture, sep, prefixes, parsed = split
+                if not self.backend.native:
+                    compiled = self.backend.compile(source, self.flags)
+
+                block.wildcards.append(_Wildcard(name, source, compiled, capture, sep, prefixes))
+                block.analysis[name] = analyze_parsed(parsed, wildcard=True)
+                literals[name] = prefixes
+
+        regexs = []
+        if names:
+            regexs = self._block_to_regexs(['(?P<%s>^%s$)' % (name, self.patterns[name][0])
+                                            for name in names])
+        spans = []
+
+        for regex, _, parsed in regexs:
+            indexes = sorted((regex.groupindex[name], name) for name in names
+                             if name in regex.groupindex)
+
+            regex_spans = {}
+            for i in range(len(indexes)):
+                index, name = indexes[i]
+                end = indexes[i + 1][0] - 1 if (i + 1) < len(indexes) else regex.groups
+                regex_spans[index] = (name, index, end)
+
+            spans.append(regex_spans)
+
+            # Find required literals for each pattern from the parsed regex
+            literals.update(group_literals(parsed, {index: name for index, name in indexes}))
+
+            # Check each pattern for constructs which can make matching slow
+            for name, contents in group_contents(parsed, {index: name for index, name in indexes}).items():
+                block.analysis[name] = analyze_parsed(contents)
+
+        self._index_block(block, literals)
+        block.spans = spans
+        block.sources = [source for _, source, _ in regexs]
+        block.compiled = [regex for regex, _, _ in regexs]
 
     def compile(self):
         """
-        Compile all regular expressions in the dictionary
+        Compile all regular expressions in the dictionary. Only blocks which
+        have been modified since the last compile are re-compiled.
         """
-        i = 0
+        with self.compile_lock:
+            self._compile()
+
+    def _compile(self):
+        instrument = self.instrument
+        if instrument is not None:
+            start = time.perf_counter()
+            compiled = 0
+
+        blocks = []
+        for block in self.blocks:
+            if block.groupnames:
+                block.position = len(blocks)
+                blocks.append(block)
+            else:
+                self._unindex_block(block)
+
+        self.blocks = blocks
+
+        for block in self.blocks:
+            if block.sources is None:
+                self._compile_block(block)
+            elif block.compiled is None:
+                block.compiled = [self.backend.compile(source, self.flags)
+                                  for source in block.sources]
+                for wildcard in block.wildcards:
+                    wildcard.compiled = self.backend.compile(wildcard.source, self.flags)
+            else:
+                continue
+
+            if instrument is not None:
+                compiled += 1
+
+        self.unfiltered_blocks = [block for block in self.blocks if block.unfiltered]
+        self.wildcard_index = None
+        self.compiled = [regex for block in self.blocks
+                         for regex in block.compiled + [w.compiled for w in block.wildcards]]
+
+        if (instrument is not None) and compiled:
+            instrument.compile(self, compiled, time.perf_counter() - start)
+
+    def analyze(self):
+        """
+        Report constructs which can make matching slow, such as nested
+        quantifiers, for every pattern in the dictionary. The analysis is done
+        when each block of patterns is compiled, so this compiles any blocks
+        which have been modified since the last compile.
+
+        :return: list of reports, one per pattern, in the order the patterns\
+            were added
+        :rtype: [chatbot_utils.analysis.PatternReport]
+        """
+        self.compile()
         ret = []
-        block = []
-        self.compiled = []
 
-        for groupname in self.patterns:
-            pattern, _ = self.patterns[groupname]
-            block.append('(?P<%s>^%s$)' % (groupname, pattern))
-            i += 1
+        for block in self.blocks:
+            wildcards = set(wildcard.groupname for wildcard in block.wildcards)
+            wildcards.update(token.groupname for token in block.tokens if token.prefixed)
+            uncompiled = set(token.groupname for token in block.tokens)
+            uncompiled.update(block.plain)
 
-            if i == self.groups_per_regex:
-                self.compiled.extend(self._block_to_regexs(block))
-                i = 0
-                block = []
+            for name in block.groupnames:
+                issues, degree = block.analysis[name]
+                position = None if name in uncompiled else block.position
+                ret.append(PatternReport(self.patterns[name][0], issues, degree,
+                                         block=position, wildcard=name in wildcards))
 
-        if block:
-            self.compiled.extend(self._block_to_regexs(block))
+        return ret
 
     def dump_to_dict(self):
         """
@@ -127,45 +689,433 @@ class ReDict(dict):
 
         :param dict data: pattern/value pairs to load
         """
-        self.groupid = 1
-        self.compiled = None
-        self.patterns = {}
+        self._reset()
 
         for pattern in data:
             self.__setitem__(pattern, data[pattern])
 
         return self
 
-    def _do_match(self, text):
-        if not self.compiled:
-            self.compile()
+    def _candidate_blocks(self, folded):
+        if len(self.blocks) < 2:
+            return self.blocks
+
+        candidates = self.literal_index.search(folded)
+        candidates.update(self.unfiltered_blocks)
+        return sorted(candidates, key=_block_position)
+
+    def _match_wildcards(self, block, text, folded, name):
+        # Find the first wildcard pattern in the block that matches, if it was
+        # added before the pattern 'name' (the first matching pattern in the
+        # block's compiled regular expressions, if any)
+        limit = None if name is None else int(name[1:])
+        if (self.flags & re.DOTALL) or ("\n" not in text):
+            end = len(text)
+        else:
+            end = text.index("\n")
+
+        for wildcard in block.wildcards:
+            if (limit is not None) and (wildcard.gid > limit):
+                break
+
+            groups = wildcard.match(text, folded, end)
+            if groups is not None:
+                return wildcard.groupname, groups
+
+        return None, None
+
+    def _token_starts(self, text, folded):
+        # Finds the token patterns matching 'text'. Returns a dict mapping
+        # each pattern to the position in 'text' where the pattern, or the
+        # rest of the pattern after "(.* )?", starts matching.
+        key = folded if (self.flags & re.IGNORECASE) else text
+        if key.endswith("\n"):
+            # '$' also matches before a newline at the end of the text
+            key = key[:-1]
+
+        # Token patterns can only match a newline with "match anything"
+        if ("\n" in key) and not (self.flags & re.DOTALL):
+            return {}
+
+        tokens = key.split(" ")
+        starts = dict.fromkeys(self.token_trie.search(tokens), 0)
+
+        if self.prefixed_token_trie.size:
+            # "(.* )?" is greedy, so the last token where the rest of the
+            # pattern matches is used
+            position = len(key) + 1
+            for i in range(len(tokens) - 1, -1, -1):
+                position -= len(tokens[i]) + 1
+                for token in self.prefixed_token_trie.search(tokens, i):
+                    if token not in starts:
+                        starts[token] = position
+
+        return starts
+
+    def _token_groups(self, token, text, start):
+        # Groups are found by matching the pattern's own regular expression,
+        # compiled the first time the pattern matches
+        source = token.pattern[len(TOKEN_PREFIX):] if token.prefixed else token.pattern
+        if "(" not in source:
+            groups = ()
+        else:
+            compiled = token.compiled
+            if compiled is None:
+                compiled = token.compiled = self.backend.compile("(?:%s)$" % source, self.flags)
+
+            groups = compiled.match(text, start).groups()
+
+        if not token.prefixed:
+            return groups
+
+        # The prefix group doesn't participate if the rest of the pattern
+        # matches from the start of the text
+        return ((text[:start] if start else None),) + groups
 
+    def _direct_match(self, text, folded):
+        # Finds the first plain or token pattern matching 'text', which
+        # doesn't require trying any blocks. Returns a tuple of the form
+        # (groupname, groups), or None.
         ret = None
-        m = None
-        for compiled in self.compiled:
-            m = compiled.match(text)
-            if m and m.lastgroup:
-                ret = m
+        if self.plain_patterns:
+            names = self._plain_names(text, folded)
+            if names:
+                ret = (names[0], ())
+
+        if self.token_trie.size or self.prefixed_token_trie.size:
+            starts = self._token_starts(text, folded)
+            if starts:
+                token = min(starts, key=_token_gid)
+                if (ret is None) or (token.gid < int(ret[0][1:])):
+                    ret = (token.groupname, self._token_groups(token, text, starts[token]))
+
+        return ret
+
+    def _plain_names(self, text, folded):
+        # Group names of the plain patterns matching 'text', in the order
+        # they were added, or None
+        key = folded if (self.flags & re.IGNORECASE) else text
+        if key.endswith("\n"):
+            # '$' also matches before a newline at the end of the text
+            key = key[:-1]
+
+        return self.plain_patterns.get(key)
+
+    def _timeout(self, text, block):
+        patterns = None if block is None else [self.patterns[name][0] for name in block.groupnames]
+        position = None if block is None else block.position
+        return MatchTimeoutError(text, position, patterns)
+
+    def _scan(self, text, deadline=None, stats=None):
+        if self.compiled is None:
+            with self.compile_lock:
+                if self.compiled is None:
+                    self._compile()
+
+        if (deadline is not None) and (time.monotonic() > deadline):
+            raise self._timeout(text, None)
+
+        folded = fold_case(text)
+        direct = self._direct_match(text, folded)
+        if direct is not None:
+            direct_gid = int(direct[0][1:])
+            direct_position = self.block_map[direct[0]].position
+
+        for block in self._candidate_blocks(folded):
+            # Blocks after the directly matched pattern's block only hold
+            # patterns which were added after it
+            if (direct is not None) and (block.position > direct_position):
                 break
 
-        if not ret:
-            raise KeyError("No patterns matching '%s' in dict" % text)
+            if stats is not None:
+                stats[0] += 1
+
+            name = None
+            for i in range(len(block.compiled)):
+                m = block.compiled[i].match(text)
+                if m and m.lastgroup:
+                    name, start, end = block.spans[i][m.lastindex]
+                    groups = m.groups()[start:end]
+                    break
+
+            if block.wildcards:
+                wildcard_name, wildcard_groups = self._match_wildcards(block, text, folded, name)
+                if wildcard_name is not None:
+                    name, groups = wildcard_name, wildcard_groups
+
+            if name is not None:
+                if (direct is None) or (int(name[1:]) < direct_gid):
+                    return name, groups
+
+                break
+
+            if (deadline is not None) and (time.monotonic() > deadline):
+                raise self._timeout(text, block)
+
+        if direct is not None:
+            return direct
+
+        return None, None
+
+    def _cached_scan(self, text, deadline=None, stats=None):
+        cache = self.cache
+        ret = cache.get(text)
+
+        if ret is not None:
+            self.cache_hits += 1
+            try:
+                cache.move_to_end(text)
+            except KeyError:
+                pass
+
+            return ret
+
+        self.cache_misses += 1
+        ret = self._scan(text, deadline, stats)
+        cache[text] = ret
+
+        if len(cache) > self.cache_size:
+            try:
+                cache.popitem(last=False)
+            except KeyError:
+                pass
 
         return ret
 
+    def _instrumented_match(self, text, deadline):
+        start = time.perf_counter()
+        stats = [0]
+
+        if self.cache is None:
+            groupname, groups = self._scan(text, deadline, stats)
+        else:
+            groupname, groups = self._cached_scan(text, deadline, stats)
+
+        block = None if groupname is None else self.block_map[groupname].position
+        self.instrument.match(self, block, stats[0], time.perf_counter() - start)
+        return groupname, groups
+
+    def _do_match(self, text, deadline=None):
+        if self.instrument is not None:
+            groupname, groups = self._instrumented_match(text, deadline)
+        elif self.cache is None:
+            groupname, groups = self._scan(text, deadline)
+        else:
+            groupname, groups = self._cached_scan(text, deadline)
+
+        if groupname is None:
+            raise KeyError("No patterns matching '%s' in dict" % text)
+
+        return groupname, groups
+
+    def _reset(self):
+        self.groupid = 1
+        self.compiled = None
+        self.patterns = {}
+        self.blocks = []
+        self.block_map = {}
+        self.literal_index = LiteralIndex()
+        self.unfiltered_blocks = []
+        self.plain_patterns = {}
+        self.token_trie = TokenTrie()
+        self.prefixed_token_trie = TokenTrie()
+        self.wildcard_index = None
+
+        if self.cache:
+            self.cache.clear()
+
+    def _block_full(self, block, subgroups):
+        # Checks whether a pattern with 'subgroups' subgroups needs to go in
+        # a new block, rather than being added to 'block'. Blocks always hold
+        # at least one pattern.
+        count = len(block.groupnames)
+        if count == 0:
+            return False
+
+        if (count >= self.groups_per_regex) or ((block.subgroups + subgroups) > self.subgroups_per_regex):
+            return True
+
+        max_groups = self.backend.max_groups
+        return (max_groups is not None) and ((count + 1 + block.subgroups + subgroups) > max_groups)
+
+    def _add_to_block(self, groupname, pattern):
+        subgroups = count_subgroups(pattern)
+        if (not self.blocks) or self._block_full(self.blocks[-1], subgroups):
+            self.blocks.append(_Block())
+
+        block = self.blocks[-1]
+        block.groupnames.append(groupname)
+        block.subgroups += subgroups
+        self.block_map[groupname] = block
+        return block
+
+    def _layout(self):
+        # Re-arranges all patterns into new blocks, in the order they were
+        # added, using the current block size limits
+        plain = {}
+        for block in self.blocks:
+            self._unindex_block(block)
+            plain.update(block.plain)
+
+        self.blocks = []
+        self.block_map = {}
+        for groupname, (pattern, _) in self.patterns.items():
+            block = self._add_to_block(groupname, pattern)
+            if groupname in plain:
+                block.plain[groupname] = plain[groupname]
+                block.analysis[groupname] = ([], 1)
+
+        self._mark_changed()
+
+    def _mark_changed(self):
+        self.compiled = None
+
+        if self.cache:
+            self.cache.clear()
+
+    def _mark_dirty(self, block):
+        block.compiled = None
+        block.sources = None
+        block.all_compiled = None
+        self._mark_changed()
+
+    def _remove_group(self, groupname):
+        pattern, _ = self.patterns.pop(groupname)
+        block = self.block_map.pop(groupname)
+        block.groupnames.remove(groupname)
+        block.subgroups -= count_subgroups(pattern)
+
+        key = block.plain.pop(groupname, None)
+        if key is None:
+            self._mark_dirty(block)
+            return
+
+        names = self.plain_patterns[key]
+        names.remove(groupname)
+        if not names:
+            del self.plain_patterns[key]
+
+        self._mark_changed()
 
     def __setitem__(self, pattern, value):
         if not pattern:
             return
 
-        self.patterns["g%d" % self.groupid] = (pattern, value)
+        groupname = "g%d" % self.groupid
+        block = self._add_to_block(groupname, pattern)
+        self.patterns[groupname] = (pattern, value)
         self.groupid += 1
-        self.compiled = None
+
+        key = plain_key(pattern, self.flags)
+        if key is None:
+            self._mark_dirty(block)
+            return
+
+        # Plain patterns are not compiled, so the block's regular expressions
+        # don't need to be re-compiled
+        block.plain[groupname] = key
+        block.analysis[groupname] = ([], 1)
+        self.plain_patterns.setdefault(key, []).append(groupname)
+        self._mark_changed()
+
+    def match(self, text, deadline=None):
+        """
+        Find the value associated with a pattern matching 'text', along with
+        the subgroups from the match. Unlike fetching an item and then calling
+        ``groups``, this does not store anything on the ReDict instance, so
+        it is safe to call from multiple threads at once (as long as the dict
+        is not modified at the same time).
+
+        :param str text: text to match against
+        :param float deadline: if not None, value of ``time.monotonic()``\
+            after which the lookup is abandoned. The deadline is checked\
+            between blocks of patterns, so a single block is never interrupted.
+        :return: tuple of the form ``(value, groups)``, where ``groups`` is\
+            a tuple of subgroups from the match
+        :rtype: tuple
+        :raises KeyError: if no patterns match 'text'
+        :raises MatchTimeoutError: if the deadline passes before a match is found
+        """
+        groupname, groups = self._do_match(text, deadline)
+        return self.patterns[groupname][1], groups
+
+    def match_all(self, text):
+        """
+        Find every pattern matching 'text', along with its value and the
+        subgroups from its match. Each pattern is matched exactly as by
+        ``match``, but all patterns in a block are tried in a single pass,
+        and blocks which cannot match are skipped, so this is much faster than
+        matching each pattern on its own. Like ``match``, this does not store
+        anything on the ReDict instance.
+
+        :param str text: text to match against
+        :return: list of tuples of the form ``(pattern, value, groups)``, one\
+            for each matching pattern, in the order the patterns were added.\
+            The first item, if any, is the one that ``match`` returns.
+        :rtype: list
+        """
+        if self.compiled is None:
+            with self.compile_lock:
+                if self.compiled is None:
+                    self._compile()
+
+        folded = fold_case(text)
+        if (self.flags & re.DOTALL) or ("\n" not in text):
+            end = len(text)
+        else:
+            end = text.index("\n")
+
+        wildcard_index = self.wildcard_index
+        if wildcard_index is None:
+            wildcard_index = LiteralIndex()
+            for block in self.blocks:
+                for wildcard in block.wildcards:
+                    for prefix in wildcard.prefixes:
+                        wildcard_index.add(prefix, wildcard)
+
+            self.wildcard_index = wildcard_index
+
+        matches = []
+        if self.plain_patterns:
+            for name in self._plain_names(text, folded) or []:
+                matches.append((int(name[1:]), name, ()))
+
+        if self.token_trie.size or self.prefixed_token_trie.size:
+            for token, start in self._token_starts(text, folded).items():
+                matches.append((token.gid, token.groupname, self._token_groups(token, text, start)))
+
+        for wildcard in wildcard_index.search(folded):
+            groups = wildcard.match(text, folded, end)
+            if groups is not None:
+                matches.append((wildcard.gid, wildcard.groupname, groups))
+
+        for block in self._candidate_blocks(folded):
+            if block.all_compiled is None:
+                skip = set(wildcard.groupname for wildcard in block.wildcards)
+                skip.update(token.groupname for token in block.tokens)
+                skip.update(block.plain)
+                names = [name for name in block.groupnames if name not in skip]
+                nodes = {}
+                if len(block.compiled) == 1:
+                    # The block's own regular expression is the root node
+                    nodes[(0, len(names))] = (block.compiled[0], block.spans[0])
+
+                positions = dict((names[i], i) for i in range(len(names)))
+                block.all_compiled = (names, positions, nodes)
+
+            self._match_range(block, 0, len(block.all_compiled[0]), 0, text, matches)
+
+        ret = []
+        matches.sort(key=lambda item: item[0])
+        for _, name, groups in matches:
+            pattern, value = self.patterns[name]
+            ret.append((pattern, value, groups))
+
+        return ret
 
     def __getitem__(self, text):
-        m = self._do_match(text)
-        self.subgroups = m.groups()[m.lastindex:]
-        return self.patterns[m.lastgroup][1]
+        groupname, self.subgroups = self._do_match(text)
+        return self.patterns[groupname][1]
 
     def __delitem__(self, pattern):
         key = None
@@ -178,8 +1128,7 @@ class ReDict(dict):
         if key is None:
             raise KeyError("No such pattern in ReDict: '%s'" % pattern)
 
-        del self.patterns[key]
-        self.compiled = None
+        self._remove_group(key)
 
     def __contains__(self, text):
         try:
@@ -197,12 +1146,9 @@ class ReDict(dict):
         :param str text: text to match against
         :return: value associated with pattern matching 'text' (if any)
         """
-        m = self._do_match(text)
-        ret = self.patterns[m.lastgroup][1]
-        del self.patterns[m.lastgroup]
-
-        if self.compiled is not None:
-            self.compiled = None
+        groupname, _ = self._do_match(text)
+        ret = self.patterns[groupname][1]
+        self._remove_group(groupname)
 
         return ret
 
@@ -242,6 +1188,24 @@ class ReDict(dict):
         for groupname in self.patterns:
             yield self.patterns[groupname]
 
+    def __reduce__(self):
+        # Patterns are not stored in the underlying dict, so only the
+        # instance state needs to be pickled
+        return (self.__class__, (), self.__getstate__())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['compile_lock']
+        state['compiled'] = None
+        state['cache'] = OrderedDict() if self.cache is not None else None
+        state['instrument'] = None
+        state['wildcard_index'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.compile_lock = threading.RLock()
+
     def __str__(self):
         return str(self.dump_to_dict())
 
@@ -255,9 +1219,7 @@ class ReDict(dict):
         """
         Clear all key/value pairs stored in this dict
         """
-        self.groupid = 1
-        self.compiled = None
-        self.patterns.clear()
+        self._reset()
 
     def copy(self):
         """
@@ -267,7 +1229,9 @@ class ReDict(dict):
         :return: new ReDict instance containing copied data
         :rtype: ReDict
         """
-        new = ReDict()
+        new = ReDict(cache_size=self.cache_size, backend=self.backend)
+        new.groups_per_regex = self.groups_per_regex
+        new.subgroups_per_regex = self.subgroups_per_regex
         for pattern, value in self.iteritems():
             new[pattern] = value
 
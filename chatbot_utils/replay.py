@@ -0,0 +1,134 @@
+import multiprocessing
+from collections import deque
+
+from chatbot_utils.responder import Responder
+from chatbot_utils.session import Session
+
+
+# Number of chunks of conversations queued per worker process
+_CHUNKS_PER_PROCESS = 4
+
+# Responder used by the current worker process
+_responder = None
+
+
+def _load_responder(responder, content_hash):
+    if isinstance(responder, str):
+        responder = Responder.load_compiled(responder, content_hash)
+
+    return responder.compile()
+
+def _init_worker(responder, content_hash):
+    global _responder
+    _responder = _load_responder(responder, content_hash)
+
+def _replay(responder, conversations):
+    # All conversations in a chunk go through a single get_responses call,
+    # so identical input texts in the same state are only matched once
+    pairs = []
+    for conversation in conversations:
+        session = Session()
+        pairs.extend((session, text) for text in conversation)
+
+    results = responder.get_responses(pairs)
+    return [[next(results) for _ in conversation] for conversation in conversations]
+
+def _replay_chunk(conversations):
+    return _replay(_responder, conversations)
+
+def _chunks(conversations, chunk_size):
+    chunk = []
+    for conversation in conversations:
+        chunk.append(list(conversation))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+def _pool_context():
+    # Forked workers share the parent's compiled responder without copying
+    # or pickling it, so prefer fork wherever it is available
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+
+    return multiprocessing.get_context()
+
+def replay(responder, conversations, processes=None, chunk_size=16, content_hash=None):
+    """
+    Replay recorded conversations through a responder, using several worker
+    processes. Each conversation is replayed from the start with a new
+    session, in a single worker process, so context and chain state is the
+    same as if the conversation was replayed with ``Responder.get_response``.
+    Different conversations are replayed in parallel.
+
+    The responder is compiled once before the workers are started. Where the
+    ``fork`` start method is available, workers share the parent process's
+    compiled responder; otherwise it is pickled and sent to each worker.
+    Alternatively, the name of a file saved by ``Responder.save_compiled``
+    can be passed, in which case each worker loads the file.
+
+    Conversations are read from 'conversations' as needed, and results are
+    generated in the same order as the conversations, so very large numbers
+    of conversations can be replayed without holding them all in memory.
+    Response objects must be picklable.
+
+    Example:
+
+    >>> conversations = [["hello", "my name is bob"], ["who are you?"]]
+    >>> for results in replay(responder, conversations):
+    ...     print([response for response, groups in results])
+
+    :param responder: chatbot_utils.responder.Responder instance, or name of\
+        a file saved by ``Responder.save_compiled``
+    :param conversations: iterable of conversations, where each conversation\
+        is an iterable of input texts
+    :param int processes: number of worker processes. If None, the number of\
+        CPUs is used. If 1, conversations are replayed in this process.
+    :param int chunk_size: number of conversations sent to a worker process\
+        at a time
+    :param str content_hash: if 'responder' is a file name, and this is not\
+        None, workers raise ValueError unless the saved responder has this\
+        content hash (see ``Responder.content_hash``)
+    :return: generator of lists of ``(response, groups)`` tuples, one list\
+        per conversation, with one tuple per input text (see\
+        ``Responder.get_response``)
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be at least 1")
+
+    if processes < 1:
+        raise ValueError("Number of processes must be at least 1")
+
+    if processes == 1:
+        responder = _load_responder(responder, content_hash)
+        for chunk in _chunks(conversations, chunk_size):
+            for results in _replay(responder, chunk):
+                yield results
+
+        return
+
+    if not isinstance(responder, str):
+        responder.compile()
+
+    pool = _pool_context().Pool(processes, _init_worker, (responder, content_hash))
+    try:
+        pending = deque()
+        for chunk in _chunks(conversations, chunk_size):
+            pending.append(pool.apply_async(_replay_chunk, (chunk,)))
+
+            # Limit the number of queued chunks, to keep memory use flat
+            if len(pending) >= (processes * _CHUNKS_PER_PROCESS):
+                for results in pending.popleft().get():
+                    yield results
+
+        while pending:
+            for results in pending.popleft().get():
+                yield results
+    finally:
+        pool.terminate()
+        pool.join()
@@ -1,18 +1,41 @@
-from chatbot_utils.format_tokens import FormattedResponse
-from chatbot_utils.redict import ReDict
+import hashlib
+import pickle
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+from chatbot_utils import __version__
+from chatbot_utils.backends import DEFAULT_BACKEND
+from chatbot_utils.analysis import analyze_pattern
+from chatbot_utils.format_tokens import ResponseTemplate
+from chatbot_utils.instrument import (CONTEXT, SUBCONTEXT_ENTRY, CONTEXT_EXIT, RESPONSES,
+    CONTEXT_ENTRY, RENDER)
+from chatbot_utils.redict import ReDict, MatchTimeoutError
+from chatbot_utils.session import Session
+
+
+# Version of the file format written by Responder.save_compiled
+COMPILED_FORMAT_VERSION = 12
+
+# Policies for input text longer than Responder.max_input_length
+TRUNCATE = "truncate"
+REJECT = "reject"
+
+# Number of match timeouts kept in Responder.timeouts
+MAX_TIMEOUT_RECORDS = 100
 
 
 class NoResponse(object):
     pass
 
-def _check_get_response(responsedict, text):
+def _check_get_response(responsedict, text, deadline=None):
     try:
-        response = responsedict[text]
+        return responsedict.match(text, deadline)
     except KeyError:
         return NoResponse, None
 
-    return response, responsedict.groups()
-
 def _check_pattern_response_pair(pair):
     regex = None
     if len(pair) != 2:
@@ -29,36 +52,462 @@ def _check_pattern_response_pair(pair):
 
     return regex, response
 
-def _attempt_context_entry(contexts, text):
-    for context in contexts:
-        response, groups = _check_get_response(context.entry, text)
-        if response != NoResponse:
-            return context, response, groups
+def _entry_index(parent):
+    # Returns an _EntryIndex containing the entry phrases of all contexts in
+    # 'parent' (a Responder or Context), so that the context to enter can be
+    # found with one lookup. Built on first use, and then kept up to date as
+    # entry phrases and contexts are added and removed.
+    index = parent.entry_index
+    if index is None:
+        cache_size = max([context.entry.cache_size for context in parent.contexts] + [0])
+        index = _EntryIndex(cache_size=cache_size, backend=parent.responses.backend)
+        for responsedict in [index, index.late]:
+            responsedict.groups_per_regex = parent.responses.groups_per_regex
+            responsedict.subgroups_per_regex = parent.responses.subgroups_per_regex
+
+        # Report to the same instrument as the parent's own ReDicts, under a
+        # name next to the parent's responses, e.g. "contexts[0].entry_index"
+        name = parent.responses.name
+        if name is not None:
+            name = name[:-len("responses")] + "entry_index"
+
+        index.set_instrument(parent.responses.instrument, name)
+
+        for i in range(len(parent.contexts)):
+            index.add_context(i, parent.contexts[i])
+
+        parent.entry_index = index
+
+    return index
+
+def _add_subcontext(parent, context):
+    # Adds 'context' to the contexts of 'parent' (a Responder or Context)
+    parent.contexts.append(context)
+    if parent not in context.parents:
+        context.parents.append(parent)
+
+    if parent.entry_index is not None:
+        parent.entry_index.add_context(len(parent.contexts) - 1, context)
+
+def _attempt_context_entry(parent, text, deadline=None):
+    if not parent.contexts:
+        return None, NoResponse, None
+
+    try:
+        i, response, groups = _entry_index(parent).lookup(text, deadline)
+    except KeyError:
+        return None, NoResponse, None
+
+    return i, response, groups
+
+class ChainSteps(object):
+    """
+    Holds the patterns for every step of every chain in a context. Each unique
+    pattern is stored (and compiled) once, and chains refer to patterns by
+    their index in ``patterns``.
+
+    :ivar list patterns: unique step patterns, in the order they were added
+    :ivar list regexs: compiled regular expression for each pattern in\
+        ``patterns``, or None for patterns that have not been compiled yet
+    :ivar compiled: same as ``regexs`` once all patterns have been compiled,\
+        otherwise None
+    """
+    def __init__(self):
+        self.flags = re.IGNORECASE
+        self.backend = DEFAULT_BACKEND
+        self.patterns = []
+        self.pattern_ids = {}
+        self.regexs = []
+        self.compiled = None
+
+    def add(self, pattern):
+        """
+        Add a step pattern, if it has not already been added
+
+        :param str pattern: regular expression for the step
+        :return: index of the pattern in ``patterns``
+        :rtype: int
+        """
+        if pattern not in self.pattern_ids:
+            self.pattern_ids[pattern] = len(self.patterns)
+            self.patterns.append(pattern)
+            self.regexs.append(None)
+            self.compiled = None
+
+        return self.pattern_ids[pattern]
+
+    def _compile_pattern(self, pattern_id):
+        # Anchored the same way as patterns in a ReDict
+        regex = self.backend.compile('^%s$' % self.patterns[pattern_id], self.flags)
+        self.regexs[pattern_id] = regex
+        return regex
+
+    def compile(self):
+        """
+        Compile all step patterns which have not been compiled yet
+        """
+        for i in range(len(self.patterns)):
+            if self.regexs[i] is None:
+                self._compile_pattern(i)
+
+        self.compiled = self.regexs
+
+    def match(self, pattern_id, text):
+        """
+        Check if text matches a step pattern
+
+        :param int pattern_id: index of the pattern in ``patterns``
+        :param str text: text to match against
+        :return: tuple of subgroups from the match, or None if 'text' does\
+            not match the pattern
+        """
+        regex = self.regexs[pattern_id]
+        if regex is None:
+            regex = self._compile_pattern(pattern_id)
+
+        m = regex.match(text)
+        if m is None:
+            return None
 
-    return None, NoResponse, None
+        return m.groups()
 
-def _attempt_context_exit(context, text):
-    response, groups = _check_get_response(context.exit, text)
+    def set_backend(self, backend):
+        """
+        Set the regular expression engine used to compile step patterns (see
+        ``ReDict.set_backend``)
+
+        :param chatbot_utils.backends.Backend backend: engine to use
+        """
+        self.backend = backend
+        self.regexs = [None] * len(self.patterns)
+        self.compiled = None
+        return self
+
+    def analyze(self):
+        """
+        Report constructs which can make matching slow for every step pattern
+        (see ``ReDict.analyze``)
+
+        :return: list of reports, one per pattern, in the order the patterns\
+            were added
+        :rtype: [chatbot_utils.analysis.PatternReport]
+        """
+        return [analyze_pattern(pattern, self.flags) for pattern in self.patterns]
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __getstate__(self):
+        # Compiled regular expressions are re-compiled on first use
+        state = self.__dict__.copy()
+        state['regexs'] = [None] * len(self.patterns)
+        state['compiled'] = None
+        return state
+
+
+def _hash_redict(hasher, responsedict):
+    hasher.update(("redict %d %d %d\n" % (responsedict.flags, responsedict.groups_per_regex,
+                                          responsedict.subgroups_per_regex)).encode("utf-8"))
+    for pattern, value in responsedict.iteritems():
+        hasher.update(pattern.encode("utf-8") + b"\n")
+        hasher.update(pickle.dumps(value, protocol=2) + b"\n")
+
+def _hash_context(hasher, context):
+    hasher.update(b"context\n")
+    for responsedict in [context.entry, context.exit, context.responses]:
+        _hash_redict(hasher, responsedict)
+
+    for chain in context.chains:
+        hasher.update(("chain %d\n" % len(chain)).encode("utf-8"))
+        for pattern_id, response in chain:
+            hasher.update(context.chain_steps.patterns[pattern_id].encode("utf-8") + b"\n")
+            hasher.update(pickle.dumps(response, protocol=2) + b"\n")
+
+    for subcontext in context.contexts:
+        _hash_context(hasher, subcontext)
+
+    hasher.update(b"end\n")
+
+def _warm_up_order(responder):
+    # Yields all ReDicts in a responder, roughly in the order they are likely
+    # to be needed; combined entry phrases for each level of contexts come
+    # before anything that can only be used inside those contexts
+    yield responder.responses
+
+    queue = deque([responder])
+    while queue:
+        parent = queue.popleft()
+        if parent.contexts:
+            yield _entry_index(parent)
+
+        for context in parent.contexts:
+            yield context.entry
+            yield context.responses
+            yield context.exit
+
+            if context.chains:
+                yield context.chain_heads
+                yield context.chain_steps
+
+            queue.append(context)
+
+def _iter_responses(responder):
+    # Yields all response objects in a responder, including those of contexts
+    # and chains
+    yield responder.default_response
+    for response in responder.responses.values():
+        yield response
+
+    stack = list(responder.contexts)
+    while stack:
+        context = stack.pop()
+        for responsedict in [context.entry, context.exit, context.responses]:
+            for response in responsedict.values():
+                yield response
+
+        for chain in context.chains:
+            for _, response in chain:
+                yield response
+
+        stack.extend(context.contexts)
+
+def _analyze_context(context, location):
+    ret = []
+    for name in ["entry", "responses", "exit", "chain_heads", "chain_steps"]:
+        for report in getattr(context, name).analyze():
+            report.location = "%s.%s" % (location, name)
+            ret.append(report)
+
+    for i in range(len(context.contexts)):
+        ret.extend(_analyze_context(context.contexts[i], "%s.contexts[%d]" % (location, i)))
+
+    return ret
+
+def _set_instrument(parent, instrument, prefix):
+    # Sets the instrument of all ReDicts in a Responder or Context, and all
+    # of its subcontexts, naming each ReDict by its location
+    names = ["responses"] if isinstance(parent, Responder) else [
+        "entry", "responses", "exit", "chain_heads"]
+
+    for name in names:
+        getattr(parent, name).set_instrument(instrument, prefix + name)
+
+    if parent.entry_index is not None:
+        parent.entry_index.set_instrument(instrument, prefix + "entry_index")
+
+    for i in range(len(parent.contexts)):
+        _set_instrument(parent.contexts[i], instrument, "%scontexts[%d]." % (prefix, i))
+
+def _find_context_path(contexts, target):
+    for i in range(len(contexts)):
+        if contexts[i] is target:
+            return (i,)
+
+        path = _find_context_path(contexts[i].contexts, target)
+        if path is not None:
+            return (i,) + path
+
+    return None
+
+def _report_stage(instrument, stage, start):
+    # Reports the time since 'start' for a stage, and returns the current time
+    now = time.perf_counter()
+    instrument.stage(stage, now - start)
+    return now
+
+def _attempt_context_exit(context, text, deadline=None):
+    response, groups = _check_get_response(context.exit, text, deadline)
     if response != NoResponse:
         return response, groups
 
     return NoResponse, None
 
 
+class _EntryIndex(ReDict):
+    """
+    ReDict holding the entry phrases of all contexts of a Responder or
+    Context, so that the context to enter can be found with one lookup.
+    Values are tuples of the form ``(key, context index, response)``, where
+    ``key`` is ``(context index, group ID of the phrase in context.entry)``.
+    When phrases overlap, the phrase with the lowest key wins, meaning the
+    first context added, and then the first phrase added to that context.
+
+    Phrases are added and removed one at a time as the contexts change, so
+    only the blocks holding them need to be re-compiled. A phrase added after
+    phrases with higher keys (e.g. to the first context, after phrases were
+    added to the second) has lower priority in this ReDict than it should, so
+    it is also added to ``late``, which is checked for matches with lower
+    keys than the first match found.
+
+    :ivar dict entries: maps ``(context index, group name in context.entry)``\
+        to the group name of the phrase in this ReDict
+    :ivar ReDict late: phrases added out of order, with the same values
+    :ivar dict late_entries: like ``entries``, for ``late``
+    :ivar tuple last: highest key of any phrase added so far, or None
+    """
+    def __init__(self, *args, **kwargs):
+        super(_EntryIndex, self).__init__(*args, **kwargs)
+        self.entries = {}
+        self.late = ReDict(cache_size=self.cache_size, backend=self.backend)
+        self.late_entries = {}
+        self.last = None
+
+    def add_context(self, i, context):
+        """
+        Add all entry phrases of a context
+
+        :param int i: index of the context in its parent's contexts
+        :param chatbot_utils.responder.Context context: context to add
+        """
+        for groupname, (pattern, response) in context.entry.patterns.items():
+            self.add_phrase(i, groupname, pattern, response)
+
+    def add_phrase(self, i, groupname, pattern, response):
+        """
+        Add one entry phrase of a context
+
+        :param int i: index of the context in its parent's contexts
+        :param str groupname: group name of the phrase in context.entry
+        :param str pattern: the phrase
+        :param response: response for the phrase
+        """
+        key = (i, int(groupname[1:]))
+        self.entries[(i, groupname)] = "g%d" % self.groupid
+        self[pattern] = (key, i, response)
+
+        if (self.last is not None) and (key < self.last):
+            self.late_entries[(i, groupname)] = "g%d" % self.late.groupid
+            self.late[pattern] = (key, i, response)
+        else:
+            self.last = key
+
+    def remove_phrase(self, i, groupname):
+        """
+        Remove one entry phrase of a context
+
+        :param int i: index of the context in its parent's contexts
+        :param str groupname: group name of the phrase in context.entry
+        """
+        self._remove_group(self.entries.pop((i, groupname)))
+
+        late = self.late_entries.pop((i, groupname), None)
+        if late is not None:
+            self.late._remove_group(late)
+
+    def lookup(self, text, deadline=None):
+        """
+        Find the entry phrase with the lowest key matching 'text'
+
+        :param str text: text to match against
+        :param float deadline: see ``ReDict.match``
+        :return: tuple of the form ``(context index, response, groups)``
+        :rtype: tuple
+        :raises KeyError: if no phrases match 'text'
+        """
+        (key, i, response), groups = self.match(text, deadline)
+        if self.late:
+            for _, (late_key, late_i, late_response), late_groups in self.late.match_all(text):
+                if late_key < key:
+                    key, i, response, groups = late_key, late_i, late_response, late_groups
+
+        return i, response, groups
+
+    def compile(self):
+        super(_EntryIndex, self).compile()
+        self.late.compile()
+
+    def set_cache_size(self, cache_size):
+        super(_EntryIndex, self).set_cache_size(cache_size)
+
+        # Also called by ReDict.__init__, before 'late' is created
+        if hasattr(self, "late"):
+            self.late.set_cache_size(cache_size)
+
+        return self
+
+    def set_backend(self, backend):
+        super(_EntryIndex, self).set_backend(backend)
+        self.late.set_backend(backend)
+        return self
+
+    def set_block_size(self, block_size):
+        super(_EntryIndex, self).set_block_size(block_size)
+        self.late.set_block_size(block_size)
+        return self
+
+
+class _EntryPhrases(ReDict):
+    """
+    ReDict holding the entry phrases of a context, which keeps the
+    _EntryIndex of each of the context's parents up to date when phrases are
+    added or removed, however the ReDict is modified
+
+    :ivar context: chatbot_utils.responder.Context instance owning this ReDict
+    """
+    def __init__(self, context=None):
+        super(_EntryPhrases, self).__init__()
+        self.context = context
+
+    def _indexes(self):
+        # Yields (index, context index) for each built entry index that
+        # holds this ReDict's phrases
+        if self.context is None:
+            return
+
+        for parent in self.context.parents:
+            index = parent.entry_index
+            if index is not None:
+                for i in range(len(parent.contexts)):
+                    if parent.contexts[i] is self.context:
+                        yield index, i
+
+    def __setitem__(self, pattern, value):
+        groupid = self.groupid
+        super(_EntryPhrases, self).__setitem__(pattern, value)
+        if self.groupid != groupid:
+            for index, i in self._indexes():
+                index.add_phrase(i, "g%d" % groupid, pattern, value)
+
+    def _remove_group(self, groupname):
+        super(_EntryPhrases, self)._remove_group(groupname)
+        for index, i in self._indexes():
+            index.remove_phrase(i, groupname)
+
+    def _reset(self):
+        for groupname in list(self.patterns):
+            self._remove_group(groupname)
+
+        super(_EntryPhrases, self)._reset()
+
+
 class Context(object):
     """
     Class representing a "discussion" context, allowing for a Responder that
     responds with contextual awareness
     """
     def __init__(self, lists=None):
-        self.entry = ReDict()
+        self.entry = _EntryPhrases(self)
         self.exit = ReDict()
         self.responses = ReDict()
-        self.chains = []
-        self.chain = None
-        self.chain_index = 0
         self.contexts = []
 
+        # Each chain is a tuple of (pattern ID, response) steps, where the
+        # pattern ID is an index into chain_steps.patterns. chain_heads maps
+        # the first pattern of each chain to the index of the chain.
+        self.chains = []
+        self.chain_steps = ChainSteps()
+        self.chain_heads = ReDict()
+
+        # Combined entry phrases of all subcontexts, built on first use. Any
+        # Responder or Context that this context is added to is stored in
+        # 'parents', so that their combined entry phrases can be updated
+        # when the entry phrases of this context change.
+        self.entry_index = None
+        self.parents = []
+
+        # Conversation state used when get_response is called without a session
+        self.session = Session()
+
         if lists:
             self._build_from_lists(lists)
 
@@ -70,13 +519,80 @@ class Context(object):
         if self.entry:
             self.entry.compile()
 
+        if self.exit:
+            self.exit.compile()
+
         if self.responses:
             self.responses.compile()
 
         if self.chains:
-            for chain in self.chains:
-                for responsedict in chain:
-                    responsedict.compile()
+            self.chain_heads.compile()
+            self.chain_steps.compile()
+
+        for context in self.contexts:
+            context.compile()
+
+        if self.contexts:
+            _entry_index(self).compile()
+
+        return self
+
+    def set_cache_size(self, cache_size):
+        """
+        Set the lookup result cache size for all ReDicts in this context,
+        including those of any subcontexts (see ``ReDict.set_cache_size``)
+
+        :param int cache_size: maximum number of cached lookup results per ReDict
+        """
+        for responsedict in [self.entry, self.exit, self.responses]:
+            responsedict.set_cache_size(cache_size)
+
+        self.chain_heads.set_cache_size(cache_size)
+
+        for context in self.contexts:
+            context.set_cache_size(cache_size)
+
+        if self.entry_index is not None:
+            self.entry_index.set_cache_size(cache_size)
+
+        return self
+
+    def set_backend(self, backend):
+        """
+        Set the regular expression engine for all ReDicts and chains in this
+        context, including those of any subcontexts (see\
+        ``ReDict.set_backend``)
+
+        :param chatbot_utils.backends.Backend backend: engine to use
+        """
+        for responsedict in [self.entry, self.exit, self.responses, self.chain_heads]:
+            responsedict.set_backend(backend)
+
+        self.chain_steps.set_backend(backend)
+
+        for context in self.contexts:
+            context.set_backend(backend)
+
+        if self.entry_index is not None:
+            self.entry_index.set_backend(backend)
+
+        return self
+
+    def set_block_size(self, block_size):
+        """
+        Set the block size limits for all ReDicts in this context, including
+        those of any subcontexts (see ``ReDict.set_block_size``)
+
+        :param chatbot_utils.tuning.BlockSize block_size: block size limits
+        """
+        for responsedict in [self.entry, self.exit, self.responses, self.chain_heads]:
+            responsedict.set_block_size(block_size)
+
+        for context in self.contexts:
+            context.set_block_size(block_size)
+
+        if self.entry_index is not None:
+            self.entry_index.set_block_size(block_size)
 
         return self
 
@@ -99,11 +615,12 @@ class Context(object):
         chain = []
         for pair in pattern_response_pairs:
             pattern, response = _check_pattern_response_pair(pair)
-            responsedict = ReDict()
-            responsedict[pattern] = response
-            chain.append(responsedict)
+            chain.append((self.chain_steps.add(pattern), response))
 
-        self.chains.append(chain)
+        if chain:
+            self.chain_heads[self.chain_steps.patterns[chain[0][0]]] = len(self.chains)
+
+        self.chains.append(tuple(chain))
         return self
 
     def add_entry_phrase(self, patterns, response):
@@ -222,7 +739,7 @@ class Context(object):
         if not isinstance(context, Context):
             raise ValueError("add_context argument must be a Context instance")
 
-        self.contexts.append(context)
+        _add_subcontext(self, context)
         return self
 
     def add_contexts(self, *contexts):
@@ -236,62 +753,74 @@ class Context(object):
 
         return self
 
-    def _search_chains(self, text):
-        for chain in self.chains:
-            if (len(chain) > 0):
-                resp, groups = _check_get_response(chain[0], text)
-                if resp != NoResponse:
-                    return chain, resp, groups
+    def _search_chains(self, text, deadline=None):
+        try:
+            chain, groups = self.chain_heads.match(text, deadline)
+        except KeyError:
+            return None, NoResponse, None
 
-        return None, NoResponse, None
+        return chain, self.chains[chain][0][1], groups
 
-    def _get_chained_response(self, text):
-        if not self.chain:
-            chain, response, groups  = self._search_chains(text)
-            if chain:
-                self.chain = chain
-                self.chain_index = 1
+    def _get_chained_response(self, text, session, deadline=None):
+        if session.chain is None:
+            chain, response, groups  = self._search_chains(text, deadline)
+            if chain is not None:
+                session.chain = chain
+                session.chain_index = min(1, len(self.chains[chain]) - 1)
                 return response, groups
 
             return NoResponse, None
 
-        responsedict = self.chain[self.chain_index]
-        resp, groups = _check_get_response(responsedict, text)
+        chain = self.chains[session.chain]
+        pattern_id, resp = chain[session.chain_index]
+        groups = self.chain_steps.match(pattern_id, text)
 
-        if resp != NoResponse:
-            if self.chain_index < (len(self.chain) - 1):
-                self.chain_index += 1
-        elif self.chain_index > 0:
-            responsedict = self.chain[self.chain_index - 1]
-            resp, groups = _check_get_response(responsedict, text)
+        if groups is not None:
+            if session.chain_index < (len(chain) - 1):
+                session.chain_index += 1
+        elif session.chain_index > 0:
+            pattern_id, resp = chain[session.chain_index - 1]
+            groups = self.chain_steps.match(pattern_id, text)
+
+        if groups is None:
+            return NoResponse, None
 
         return resp, groups
 
-    def get_response(self, text):
+    def get_response(self, text, session=None, deadline=None):
         """
         Find a response object associated with a pattern in this context that
         matches 'text', and return it (if any). If no matching patterns can be
         found, 'text' itself will be returned.
 
         :param str text: input text to check for matching patterns against
+        :param chatbot_utils.session.Session session: session holding the \
+            conversation state (e.g. the current chain). If None, the \
+            context's own session is used.
+        :param float deadline: if not None, value of ``time.monotonic()`` \
+            after which matching is abandoned (see ``ReDict.match``)
+        :raises chatbot_utils.redict.MatchTimeoutError: if the deadline passes
         :return: tuple of the form ``(response, groups)``. ``response`` is the \
             response object associated with the matching regular expression, \
             if any, otherwise 'text'. ``groups`` is a tuple of subgroups from \
             the regular expression match (as returned by \
             re.MatchObject.groups), if any, otherwise None.
         """
-        resp, groups = self._get_chained_response(text)
+        if session is None:
+            session = self.session
+
+        resp, groups = self._get_chained_response(text, session, deadline)
         if resp != NoResponse:
             return resp, groups
 
-        resp, groups = _check_get_response(self.responses, text)
+        resp, groups = _check_get_response(self.responses, text, deadline)
         if resp == NoResponse:
-            resp, groups = _check_get_response(self.entry, text)
+            resp, groups = _check_get_response(self.entry, text, deadline)
 
         # If we got a response from anything other than a chain, make
-        # sure we exit any current chains by setting self.chain = False
+        # sure we exit any current chains by setting session.chain = None
         if resp != NoResponse:
-            self.chain = None
+            session.chain = None
 
         return resp, groups
 
@@ -306,10 +835,62 @@ class Responder(object):
     def __init__(self):
         self.responses = ReDict()
         self.default_response = NoResponse
-
-        self.context = None
         self.contexts = []
-        self.variables = {}
+
+        # Combined entry phrases of all top-level contexts, built on first use
+        self.entry_index = None
+
+        # Parsed response templates, keyed by response string
+        self.templates = {}
+
+        # Input text limits, see set_max_input_length and set_match_timeout
+        self.max_input_length = None
+        self.input_policy = TRUNCATE
+        self.match_timeout = None
+
+        # Most recent MatchTimeoutError instances, newest last
+        self.timeouts = deque(maxlen=MAX_TIMEOUT_RECORDS)
+
+        # Receives stage timings, see set_instrument
+        self.instrument = None
+
+        # Conversation state used when get_response is called without a session
+        self.session = Session()
+
+    @property
+    def context(self):
+        """
+        Currently active context of the responder's own session
+        """
+        return self.session.context
+
+    @context.setter
+    def context(self, context):
+        path = () if context is None else _find_context_path(self.contexts, context)
+        if path is None:
+            raise ValueError("Context has not been added to this responder")
+
+        self.session.set_context(context, path)
+
+    @property
+    def variables(self):
+        """
+        Variables of the responder's own session
+        """
+        return self.session.variables
+
+    @variables.setter
+    def variables(self, variables):
+        self.session.variables = variables
+
+    def __getstate__(self):
+        # The instrument may not be picklable (Counters holds a lock), and
+        # recorded timeouts are exceptions holding the input text, so
+        # neither is stored. ReDicts drop their own instruments.
+        state = self.__dict__.copy()
+        state['instrument'] = None
+        state['timeouts'] = deque(maxlen=self.timeouts.maxlen)
+        return state
 
     def compile(self):
         """
@@ -323,6 +904,259 @@ class Responder(object):
             for context in self.contexts:
                 context.compile()
 
+            _entry_index(self).compile()
+
+        for response in _iter_responses(self):
+            if type(response) == str:
+                self._template(response)
+
+        return self
+
+    def analyze(self):
+        """
+        Report constructs which can make matching slow, such as nested
+        quantifiers, for every pattern in this responder, including those of
+        all contexts and chains (see ``ReDict.analyze``). Each report's
+        ``location`` shows where the pattern lives, e.g.
+        ``"contexts[0].responses"``. This compiles the responder.
+
+        Example, to fail a test if any pattern may take exponential time:
+
+        >>> slow = [r for r in responder.analyze() if r.degree is None]
+        >>> assert not slow, "\\n".join(str(r) for r in slow)
+
+        :return: list of reports, one per pattern
+        :rtype: [chatbot_utils.analysis.PatternReport]
+        """
+        self.compile()
+
+        ret = []
+        for report in self.responses.analyze():
+            report.location = "responses"
+            ret.append(report)
+
+        for i in range(len(self.contexts)):
+            ret.extend(_analyze_context(self.contexts[i], "contexts[%d]" % i))
+
+        return ret
+
+    def warm_up(self, executor=None):
+        """
+        Compile the contextless responses of this responder immediately, and
+        compile everything else in the background. ReDicts are compiled in
+        priority order: the combined entry phrases of all top-level contexts
+        first, then the entry phrases, responses, exit phrases and chains of
+        each top-level context, then the combined entry phrases of their
+        subcontexts, and so on. Any ReDict that is needed before the background
+        compilation reaches it is compiled on first use, as usual.
+
+        :param executor: ``concurrent.futures.Executor`` instance to run the \
+            background compilation on. If None, a new daemon thread is started.
+        :return: the started ``threading.Thread``, or the ``Future`` returned \
+            by the executor
+        """
+        self.responses.compile()
+        remaining = list(_warm_up_order(self))[1:]
+
+        def compile_remaining():
+            for responsedict in remaining:
+                if responsedict.compiled is None:
+                    responsedict.compile()
+
+        if executor is not None:
+            return executor.submit(compile_remaining)
+
+        thread = threading.Thread(target=compile_remaining)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def content_hash(self):
+        """
+        Compute a hash of everything that determines this responder's
+        behaviour: all patterns and responses, the structure of all contexts
+        and chains, and the versions of chatbot_utils and Python in use.
+        Response objects are hashed by pickling them.
+
+        :return: hex digest string
+        :rtype: str
+        """
+        hasher = hashlib.sha256()
+        hasher.update(("chatbot_utils %s python %d.%d\n" % ((__version__,) + tuple(sys.version_info[:2]))).encode("utf-8"))
+        hasher.update(pickle.dumps(self.default_response, protocol=2) + b"\n")
+        _hash_redict(hasher, self.responses)
+
+        for context in self.contexts:
+            _hash_context(hasher, context)
+
+        return hasher.hexdigest()
+
+    def save_compiled(self, filename):
+        """
+        Compile this responder and save it to a file, which can be loaded
+        with ``load_compiled``. The file stores all patterns, responses,
+        contexts and chains, along with the layout of each ReDict's compiled
+        blocks and literal index, so that none of it needs to be rebuilt after
+        loading. All response objects must be picklable.
+
+        :param str filename: name of file to write
+        :return: content hash of the saved responder (see ``content_hash``)
+        :rtype: str
+        """
+        self.compile()
+        content_hash = self.content_hash()
+        data = {
+            "format": COMPILED_FORMAT_VERSION,
+            "version": __version__,
+            "python": tuple(sys.version_info[:2]),
+            "hash": content_hash,
+            "responder": self
+        }
+
+        with open(filename, 'wb') as fh:
+            pickle.dump(data, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+        return content_hash
+
+    @classmethod
+    def load_compiled(cls, filename, content_hash=None):
+        """
+        Load a responder from a file created by ``save_compiled``. The
+        regular expressions in each ReDict are re-compiled from the stored
+        sources on first use. Files are loaded with pickle, so only load files
+        from a trusted source.
+
+        :param str filename: name of file to load
+        :param str content_hash: if not None, raise ValueError unless the\
+            saved responder has this content hash (see ``content_hash``)
+        :return: loaded responder
+        :rtype: chatbot_utils.responder.Responder
+        """
+        with open(filename, 'rb') as fh:
+            data = pickle.load(fh)
+
+        if ((not isinstance(data, dict)) or (data.get("format") != COMPILED_FORMAT_VERSION)
+                or (data.get("version") != __version__)
+                or (data.get("python") != tuple(sys.version_info[:2]))):
+            raise ValueError("File '%s' was not saved by this version of "
+                             "chatbot_utils and Python" % filename)
+
+        if (content_hash is not None) and (content_hash != data["hash"]):
+            raise ValueError("Content hash of responder in file '%s' does not "
+                             "match" % filename)
+
+        return data["responder"]
+
+    def set_cache_size(self, cache_size):
+        """
+        Set the lookup result cache size for all ReDicts in this responder,
+        including those of all contexts (see ``ReDict.set_cache_size``)
+
+        :param int cache_size: maximum number of cached lookup results per ReDict
+        """
+        self.responses.set_cache_size(cache_size)
+
+        for context in self.contexts:
+            context.set_cache_size(cache_size)
+
+        if self.entry_index is not None:
+            self.entry_index.set_cache_size(cache_size)
+
+        return self
+
+    def set_backend(self, backend):
+        """
+        Set the regular expression engine for all ReDicts in this responder,
+        including those of all contexts (see ``ReDict.set_backend``). Call
+        this after all contexts have been added.
+
+        :param chatbot_utils.backends.Backend backend: engine to use
+        """
+        self.responses.set_backend(backend)
+
+        for context in self.contexts:
+            context.set_backend(backend)
+
+        if self.entry_index is not None:
+            self.entry_index.set_backend(backend)
+
+        return self
+
+    def set_block_size(self, block_size):
+        """
+        Set the block size limits for all ReDicts in this responder, including
+        those of all contexts (see ``ReDict.set_block_size``). Call this after
+        all contexts have been added. Limits measured for the machine the
+        responder runs on can be found with :func:`chatbot_utils.tuning.calibrate`.
+
+        :param chatbot_utils.tuning.BlockSize block_size: block size limits
+        """
+        self.responses.set_block_size(block_size)
+
+        for context in self.contexts:
+            context.set_block_size(block_size)
+
+        if self.entry_index is not None:
+            self.entry_index.set_block_size(block_size)
+
+        return self
+
+    def set_instrument(self, instrument):
+        """
+        Report measurements from this responder to an instrument: the
+        duration of each stage of ``get_response``, and the duration, number
+        of blocks of patterns tried and matching block of every lookup in
+        every ReDict, including those of all contexts (see
+        ``ReDict.set_instrument``). Each ReDict is named by its location in
+        this responder, e.g. ``"contexts[0].responses"``. Nothing is measured
+        while no instrument is set.
+
+        Contexts added after this is called are not instrumented until it is
+        called again.
+
+        Example, using an instrument which keeps running totals:
+
+        >>> counters = Counters()
+        >>> responder.set_instrument(counters)
+        >>> responder.get_response("hello")
+        >>> counters.snapshot()["stages"]
+
+        :param chatbot_utils.instrument.Instrument instrument: instrument to\
+            report to, or None to stop reporting
+        """
+        self.instrument = instrument
+        _set_instrument(self, instrument, "")
+        return self
+
+    def set_max_input_length(self, max_length, policy=TRUNCATE):
+        """
+        Limit the length of input text passed to ``get_response``.
+
+        :param int max_length: maximum number of characters of input text to \
+            match against, or None for no limit
+        :param str policy: what to do with longer input text; ``TRUNCATE`` \
+            to only match against the first ``max_length`` characters, or \
+            ``REJECT`` to return the default response without matching
+        """
+        if policy not in (TRUNCATE, REJECT):
+            raise ValueError("Unknown input length policy '%s'" % policy)
+
+        self.max_input_length = max_length
+        self.input_policy = policy
+        return self
+
+    def set_match_timeout(self, timeout):
+        """
+        Set a time budget for matching input text in each call to
+        ``get_response``. The budget is checked between blocks of patterns (see
+        ``ReDict.match``). If it runs out, the default response is returned,
+        the session is left as it was before the call, and the
+        ``MatchTimeoutError`` describing the block of patterns that was being
+        tried is added to ``timeouts``.
+
+        :param float timeout: time budget in seconds, or None for no limit
+        """
+        self.match_timeout = timeout
         return self
 
     def add_default_response(self, response):
@@ -332,6 +1166,9 @@ class Responder(object):
         :param response: object to return as default response
         """
         self.default_response = response
+        if type(response) == str:
+            self._template(response)
+
         return self
 
     def add_response(self, patterns, response):
@@ -349,6 +1186,9 @@ class Responder(object):
         """
         pattern, response = _check_pattern_response_pair((patterns, response))
         self.responses[pattern] = response
+        if type(response) == str:
+            self._template(response)
+
         return self
 
     def add_responses(self, *pattern_response_pairs):
@@ -375,7 +1215,7 @@ class Responder(object):
         if not isinstance(context, Context):
             raise ValueError("add_context argument must be a Context instance")
 
-        self.contexts.append(context)
+        _add_subcontext(self, context)
         return self
 
     def add_contexts(self, *contexts):
@@ -389,64 +1229,224 @@ class Responder(object):
 
         return self
 
-    def get_response(self, text):
+    def _template(self, response):
+        template = self.templates.get(response)
+        if template is None:
+            template = ResponseTemplate(response)
+            self.templates[response] = template
+
+        return template
+
+    def get_context(self, context_path):
+        """
+        Get the context at a position in this responder's context tree
+
+        :param tuple context_path: position of the context, as stored in\
+            ``Session.context_path``
+        :return: context at the given position
+        :rtype: chatbot_utils.responder.Context
+        """
+        contexts = self.contexts
+        context = None
+
+        for index in context_path:
+            context = contexts[index]
+            contexts = context.contexts
+
+        return context
+
+    def get_response(self, text, session=None):
         """
         Find a response object associated with a pattern that matches 'text',
         and return it (if any). If no matching patterns can be found, 'text'
         itself will be returned.
 
         :param str text: input text to check for matching patterns against
+        :param chatbot_utils.session.Session session: session holding the \
+            conversation state (current context, variables). If None, the \
+            responder's own session is used. Passing a separate session for \
+            each conversation allows one responder to be shared between any \
+            number of conversations.
         :return: tuple of the form ``(response, groups)``. ``response`` is the \
             response object associated with the matching regular expression, \
             if any, otherwise 'text'. ``groups`` is a tuple of subgroups from \
             the regular expression match (as returned by \
             re.MatchObject.groups), if any, otherwise None.
         """
+        if session is None:
+            session = self.session
+
+        if session.context_path and (session.context is None):
+            # Session was restored from serialized data, look up active context
+            session.context = self.get_context(session.context_path)
+
+        max_length = self.max_input_length
+        if (max_length is not None) and (len(text) > max_length):
+            if self.input_policy == TRUNCATE:
+                text = text[:max_length]
+                response, groups, _ = self._match_limited(text, session)
+            else:
+                response, groups = self.default_response, None
+        else:
+            response, groups, _ = self._match_limited(text, session)
+
+        instrument = self.instrument
+        if instrument is None:
+            return self._render(response, groups, session), groups
+
+        start = time.perf_counter()
+        response_obj = self._render(response, groups, session)
+        instrument.stage(RENDER, time.perf_counter() - start)
+        return response_obj, groups
+
+    def get_responses(self, pairs, batch_size=10000):
+        """
+        Get responses for many input texts, e.g. when replaying recorded
+        conversations. Equivalent to calling ``get_response`` for each input
+        text in turn, but inputs which are matched in the same state (the
+        same active context and chain step) as an identical earlier input
+        text reuse the earlier result instead of being matched again.
+
+        Responses are generated one at a time, in the same order as the
+        inputs, so very large iterables of inputs can be processed without
+        holding them in memory. Inputs from several conversations may be
+        interleaved, as long as each conversation has its own session.
+
+        :param pairs: iterable of ``(session, text)`` tuples. If ``session``\
+            is None, the responder's own session is used.
+        :param int batch_size: number of inputs after which previous results\
+            are discarded, to limit memory use
+        :return: generator of ``(response, groups)`` tuples, one per input\
+            (see ``get_response``)
+        """
+        results = {}
+        count = 0
+        max_length = self.max_input_length
+
+        for session, text in pairs:
+            if session is None:
+                session = self.session
+
+            if session.context_path and (session.context is None):
+                session.context = self.get_context(session.context_path)
+
+            if (max_length is not None) and (len(text) > max_length):
+                if self.input_policy != TRUNCATE:
+                    yield self._render(self.default_response, None, session), None
+                    continue
+
+                text = text[:max_length]
+
+            count += 1
+            if count > batch_size:
+                results.clear()
+                count = 1
+
+            key = (session.context, session.chain, session.chain_index, text)
+            result = results.get(key)
+            if result is None:
+                response, groups, timed_out = self._match_limited(text, session)
+                if not timed_out:
+                    results[key] = (response, groups, session.context,
+                                    session.context_path, session.chain,
+                                    session.chain_index)
+            else:
+                (response, groups, session.context, session.context_path,
+                 session.chain, session.chain_index) = result
+
+            yield self._render(response, groups, session), groups
+
+    def _render(self, response, groups, session):
+        if type(response) != str:
+            return response
+
+        template = self.templates.get(response)
+        if template is None:
+            template = self._template(response)
+
+        if template.static is not None:
+            # Literal response, nothing to format or assign
+            return template.static
+
+        response_obj, variables = template.render(groups, session.variables)
+        session.variables.update(variables)
+        return response_obj
+
+    def _match_limited(self, text, session):
+        # Returns (response, groups, timed_out)
+        if self.match_timeout is None:
+            return self._match(text, session) + (False,)
+
+        state = (session.context, session.context_path, session.chain, session.chain_index)
+        try:
+            return self._match(text, session, time.monotonic() + self.match_timeout) + (False,)
+        except MatchTimeoutError as e:
+            (session.context, session.context_path, session.chain,
+             session.chain_index) = state
+
+            self.timeouts.append(e)
+            return self.default_response, None, True
+
+    def _match(self, text, session, deadline=None):
         response = NoResponse
         groups = None
 
+        # Each stage is timed only if an instrument is set
+        instrument = self.instrument
+        if instrument is not None:
+            start = time.perf_counter()
+
         # If currently in a context, try to get a response from the context
-        if self.context:
-            response, groups = self.context.get_response(text)
+        if session.context:
+            response, groups = session.context.get_response(text, session, deadline)
+            if instrument is not None:
+                start = _report_stage(instrument, CONTEXT, start)
+
             if response == NoResponse:
                 # Try entering subcontexts contained in current context, if any
-                context, response, groups = _attempt_context_entry(
-                    self.context.contexts, text)
+                index, response, groups = _attempt_context_entry(
+                    session.context, text, deadline)
 
-                if context:
-                    self.context = context
+                if instrument is not None:
+                    start = _report_stage(instrument, SUBCONTEXT_ENTRY, start)
+
+                if index is not None:
+                    session.set_context(session.context.contexts[index],
+                                        session.context_path + (index,))
                 else:
                     # Subcontext entry failed, see if we need to exit the current context
-                    response, groups = _attempt_context_exit(self.context, text)
+                    response, groups = _attempt_context_exit(session.context, text, deadline)
+                    if instrument is not None:
+                        start = _report_stage(instrument, CONTEXT_EXIT, start)
+
                     if response != NoResponse:
-                        self.context = None
+                        session.set_context(None)
 
         # If no contextual response is available, try to get a response from
         # the dict of contextless responses
         if response == NoResponse:
-            response, groups = _check_get_response(self.responses, text)
+            response, groups = _check_get_response(self.responses, text, deadline)
+            if instrument is not None:
+                start = _report_stage(instrument, RESPONSES, start)
+
             if response != NoResponse:
                 # If we are currently in a context but only able to get a
                 # matching response from the contextless dict, set the current
                 # context to None
-                if self.context:
-                    self.context = None
+                if session.context:
+                    session.set_context(None)
             else:
                 # No contextless responses available, attempt context entry
-                context, response, groups = _attempt_context_entry(
-                    self.contexts, text)
+                index, response, groups = _attempt_context_entry(
+                    self, text, deadline)
+
+                if instrument is not None:
+                    _report_stage(instrument, CONTEXT_ENTRY, start)
 
-                if context:
-                    self.context = context
+                if index is not None:
+                    session.set_context(self.contexts[index], (index,))
                 else:
                     response = self.default_response
                     groups = None
 
-        if type(response) == str:
-            formatted = FormattedResponse(response, groups, self.variables)
-            self.variables.update(formatted.variables)
-            response_obj = formatted.formatted_response_text
-        else:
-            response_obj = response
-
-        return response_obj, groups
+        return response, groups
@@ -0,0 +1,111 @@
+import json
+import struct
+
+
+# Serialized session format version
+_FORMAT_VERSION = 1
+
+# version, context path length
+_HEADER = struct.Struct("<BB")
+
+# chain ID (-1 for none), chain index
+_CHAIN = struct.Struct("<iI")
+
+
+class Session(object):
+    """
+    Holds the state of a single conversation with a Responder. Responders and
+    contexts do not store any conversation state themselves when a session is
+    passed to ``get_response``, so a single Responder can serve any number of
+    concurrent conversations, each with its own Session instance.
+
+    Sessions can be serialized with ``to_bytes`` and restored with
+    ``from_bytes``, so that idle conversations can be stored outside of the
+    process and resumed later against the same Responder.
+
+    :ivar context: currently active chatbot_utils.responder.Context instance,\
+        or None if no context is active
+    :ivar tuple context_path: position of the active context in the\
+        Responder's context tree; each item is the index of a context in its\
+        parent's list of contexts. Empty if no context is active.
+    :ivar dict variables: variables set by variable assignments in responses
+    :ivar int chain: index of the chain currently being followed in the\
+        active context, or None
+    :ivar int chain_index: index of the next expected step in the current chain
+    """
+    __slots__ = ['context', 'context_path', 'variables', 'chain', 'chain_index']
+
+    def __init__(self):
+        self.context = None
+        self.context_path = ()
+        self.variables = {}
+        self.chain = None
+        self.chain_index = 0
+
+    def set_context(self, context, context_path=()):
+        """
+        Set the active context. If the active context changes, the current
+        chain (if any) is exited.
+
+        :param context: chatbot_utils.responder.Context instance, or None
+        :param tuple context_path: position of the context in the Responder's\
+            context tree (see ``context_path``)
+        """
+        if context is not self.context:
+            self.context = context
+            self.context_path = context_path
+            self.chain = None
+            self.chain_index = 0
+
+    def to_bytes(self):
+        """
+        Serialize this session. All variable names and values must be
+        JSON-serializable.
+
+        :return: serialized session
+        :rtype: bytes
+        """
+        path = self.context_path
+        chain = -1 if self.chain is None else self.chain
+        ret = [
+            _HEADER.pack(_FORMAT_VERSION, len(path)),
+            struct.pack("<%dH" % len(path), *path),
+            _CHAIN.pack(chain, self.chain_index)
+        ]
+
+        if self.variables:
+            ret.append(json.dumps(self.variables, separators=(",", ":")).encode("utf-8"))
+
+        return b"".join(ret)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Create a session from data returned by ``to_bytes``. The active context
+        is looked up from ``context_path`` the next time the session is passed
+        to ``Responder.get_response``.
+
+        :param bytes data: serialized session
+        :return: new session
+        :rtype: chatbot_utils.session.Session
+        """
+        version, pathlen = _HEADER.unpack_from(data, 0)
+        if version != _FORMAT_VERSION:
+            raise ValueError("Unsupported session format version %d" % version)
+
+        pos = _HEADER.size
+        path = struct.unpack_from("<%dH" % pathlen, data, pos)
+        pos += 2 * pathlen
+
+        chain, chain_index = _CHAIN.unpack_from(data, pos)
+        pos += _CHAIN.size
+
+        ret = cls()
+        ret.context_path = path
+        ret.chain = None if chain < 0 else chain
+        ret.chain_index = chain_index
+
+        if pos < len(data):
+            ret.variables = json.loads(data[pos:].decode("utf-8"))
+
+        return ret
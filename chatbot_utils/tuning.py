@@ -0,0 +1,273 @@
+"""
+Calibration of the size of the blocks of patterns that ReDicts compile
+together into one regular expression. The best size depends on the
+regular expression engine, the Python version and the machine, so it can
+be measured once and saved:
+
+::
+
+    python -m chatbot_utils.tuning --output block_size.json
+
+And then loaded and applied to a responder, or a single ReDict:
+
+>>> responder.set_block_size(BlockSize.load("block_size.json"))
+"""
+
+import argparse
+import json
+import platform
+import re
+import sys
+import time
+
+from chatbot_utils.backends import BACKENDS, DEFAULT_BACKEND, get_backend
+from chatbot_utils.redict import (DEFAULT_GROUPS_PER_REGEX,
+    DEFAULT_SUBGROUPS_PER_REGEX, ReDict)
+
+
+# Number of times each lookup measurement is repeated, keeping the fastest
+_REPEATS = 3
+
+
+class BlockSize(object):
+    """
+    Limits on the size of the blocks of patterns that a ReDict compiles
+    together into one regular expression (see ``ReDict.set_block_size``). A
+    new block is started when the last block holds ``patterns`` patterns, or
+    when adding a pattern to it would take the total number of subgroups of
+    its patterns past ``subgroups``.
+
+    :param int patterns: maximum number of patterns in a block
+    :param int subgroups: maximum total number of subgroups of the patterns\
+        in a block
+    :param dict measurements: if not None, the measurements the limits were\
+        chosen from (see :func:`calibrate`)
+    """
+    def __init__(self, patterns, subgroups, measurements=None):
+        if patterns < 1:
+            raise ValueError("patterns must be at least 1")
+
+        if subgroups < 0:
+            raise ValueError("subgroups must not be negative")
+
+        self.patterns = patterns
+        self.subgroups = subgroups
+        self.measurements = measurements
+
+    def to_dict(self):
+        """
+        Convert to a dict which can be serialized as JSON
+
+        :return: dict with keys ``patterns``, ``subgroups`` and ``measurements``
+        :rtype: dict
+        """
+        return {
+            "patterns": self.patterns,
+            "subgroups": self.subgroups,
+            "measurements": self.measurements
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create block size limits from a dict returned by ``to_dict``
+
+        :param dict data: dict to load
+        :return: new block size limits
+        :rtype: chatbot_utils.tuning.BlockSize
+        """
+        return cls(data["patterns"], data["subgroups"], data.get("measurements"))
+
+    def save(self, filename):
+        """
+        Save to a JSON file, which can be loaded with ``load``
+
+        :param str filename: name of file to write
+        """
+        with open(filename, "w") as fh:
+            json.dump(self.to_dict(), fh, indent=2)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load block size limits from a JSON file written by ``save``
+
+        :param str filename: name of file to load
+        :return: loaded block size limits
+        :rtype: chatbot_utils.tuning.BlockSize
+        """
+        with open(filename, "r") as fh:
+            return cls.from_dict(json.load(fh))
+
+    def __eq__(self, other):
+        return (isinstance(other, BlockSize) and (self.patterns == other.patterns)
+                and (self.subgroups == other.subgroups))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "BlockSize(%d, %d)" % (self.patterns, self.subgroups)
+
+
+DEFAULT_BLOCK_SIZE = BlockSize(DEFAULT_GROUPS_PER_REGEX, DEFAULT_SUBGROUPS_PER_REGEX)
+
+
+def _measure(backend, flags, size, subgroups, count, samples):
+    # Measures the cost per pattern of compiling 'count' patterns with
+    # 'subgroups' subgroups each, in blocks of 'size' patterns, and of
+    # lookups that have to try every block
+    d = ReDict(backend=backend)
+    d.flags = flags
+    d.groups_per_regex = size
+    d.subgroups_per_regex = size * subgroups
+
+    prefix = "(?:hello|hi) " + ("(\\w+) " * subgroups)
+    for i in range(count):
+        d["%s[0-9]{%d}" % (prefix, i + 1)] = i
+
+    start = time.perf_counter()
+    d.compile()
+    compile_time = time.perf_counter() - start
+
+    text = "hello " + ("word " * subgroups) + "x"
+    match_time = None
+    for _ in range(_REPEATS):
+        start = time.perf_counter()
+        for _ in range(samples):
+            try:
+                d.match(text)
+            except KeyError:
+                pass
+
+        elapsed = time.perf_counter() - start
+        if (match_time is None) or (elapsed < match_time):
+            match_time = elapsed
+
+    return {
+        "patterns": size,
+        "subgroups": subgroups,
+        "compile_us": (compile_time / count) * 1e6,
+        "match_us": (match_time / (samples * count)) * 1e6
+    }
+
+def _best(results, tolerance):
+    # Of the block sizes that match within 'tolerance' of the fastest, the
+    # one which is quickest to re-compile after a change
+    fastest = min(result["match_us"] for result in results)
+    good = [result for result in results if result["match_us"] <= fastest * (1.0 + tolerance)]
+    return min(good, key=lambda result: result["compile_us"] * result["patterns"])
+
+def calibrate(backend=None, flags=re.IGNORECASE, sizes=(10, 25, 50, 75, 100, 150, 200),
+              subgroups=(0, 1, 2, 4), patterns=600, samples=20, tolerance=0.1,
+              progress=None):
+    """
+    Measure the cost of compiling and matching blocks of generated patterns
+    of several sizes, and choose block size limits from the results.
+
+    For patterns with no subgroups, and for each of the other numbers of
+    subgroups per pattern, the chosen size is the one which is quickest to
+    re-compile, out of all sizes whose lookups are no more than 'tolerance'
+    slower than the fastest size. The pattern limit is the size chosen for
+    patterns with no subgroups, and the subgroup limit is the median of the
+    total number of subgroups in a block of each other chosen size, kept
+    within the backend's limit on groups (see
+    ``chatbot_utils.backends.Backend.max_groups``).
+
+    :param chatbot_utils.backends.Backend backend: regular expression engine\
+        to measure. If None, the standard library's ``re`` module is used.
+    :param int flags: flags to compile patterns with
+    :param list sizes: block sizes to measure, in patterns
+    :param list subgroups: numbers of subgroups per pattern to measure.\
+        Must include 0 and at least one other number.
+    :param int patterns: number of patterns to measure each block size with
+    :param int samples: number of lookups timed for each block size
+    :param float tolerance: fraction by which lookups may be slower than\
+        with the fastest block size
+    :param progress: if not None, a file to write progress messages to
+    :return: chosen block size limits, with ``measurements`` set to a dict\
+        with keys ``python``, ``backend`` and ``results``, a list of dicts\
+        with keys ``patterns`` (block size), ``subgroups`` (per pattern),\
+        ``compile_us`` and ``match_us`` (cost per pattern, in microseconds)
+    :rtype: chatbot_utils.tuning.BlockSize
+    :raises ValueError: if 'subgroups' doesn't include 0 and another number
+    """
+    if (0 not in subgroups) or (len(set(subgroups)) < 2):
+        raise ValueError("subgroups must include 0 and at least one other number")
+
+    if backend is None:
+        backend = DEFAULT_BACKEND
+
+    results = []
+    chosen = {}
+    for count in sorted(set(subgroups)):
+        measured = []
+        for size in sizes:
+            # Blocks must not have more groups than the backend supports
+            if (backend.max_groups is not None) and ((size * (count + 1)) > backend.max_groups):
+                continue
+
+            if progress is not None:
+                progress.write("%d patterns per block, %d subgroups per pattern\n" % (size, count))
+
+            measured.append(_measure(backend, flags, size, count, patterns, samples))
+
+        if not measured:
+            raise ValueError("No block sizes within the limits of backend '%s'" % backend.name)
+
+        results.extend(measured)
+        chosen[count] = _best(measured, tolerance)["patterns"]
+
+    totals = sorted(chosen[count] * count for count in chosen if count > 0)
+    max_subgroups = totals[len(totals) // 2]
+    if backend.max_groups is not None:
+        max_subgroups = min(max_subgroups, backend.max_groups - chosen[0])
+
+    return BlockSize(chosen[0], max_subgroups, {
+        "python": platform.python_version(),
+        "backend": backend.name,
+        "results": results
+    })
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m chatbot_utils.tuning",
+                                     description="Calibrate the block size of ReDicts")
+
+    parser.add_argument("--backend", default="re",
+                        help="regular expression backend, one of: %s (default: %%(default)s)"
+                        % ", ".join(sorted(BACKENDS)))
+    parser.add_argument("--sizes", default="10,25,50,75,100,150,200",
+                        help="comma-separated block sizes to measure (default: %(default)s)")
+    parser.add_argument("--subgroups", default="0,1,2,4",
+                        help="comma-separated numbers of subgroups per pattern to "
+                        "measure (default: %(default)s)")
+    parser.add_argument("--patterns", type=int, default=600,
+                        help="patterns to measure each block size with (default: %(default)s)")
+    parser.add_argument("--samples", type=int, default=20,
+                        help="lookups timed per block size (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="fraction by which lookups may be slower than with the "
+                        "fastest block size (default: %(default)s)")
+    parser.add_argument("--output", default=None,
+                        help="file to write JSON results to (default: standard output)")
+    parser.add_argument("--quiet", action="store_true", help="don't print progress")
+
+    args = parser.parse_args(args)
+
+    try:
+        block_size = calibrate(get_backend(args.backend), re.IGNORECASE,
+                               [int(size) for size in args.sizes.split(",")],
+                               [int(count) for count in args.subgroups.split(",")],
+                               args.patterns, args.samples, args.tolerance,
+                               None if args.quiet else sys.stderr)
+    except (ValueError, ImportError) as e:
+        parser.error(str(e))
+
+    if args.output is None:
+        json.dump(block_size.to_dict(), sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        block_size.save(args.output)
+
+if __name__ == "__main__":
+    main()
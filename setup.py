@@ -14,8 +14,13 @@ classifiers = [
     'License :: OSI Approved :: Apache Software License',
     'Operating System :: OS Independent',
     'Programming Language :: Python',
-    'Programming Language :: Python :: 2',
-    'Programming Language :: Python :: 2.7',
+    'Programming Language :: Python :: 3',
+    'Programming Language :: Python :: 3 :: Only',
+    'Programming Language :: Python :: 3.7',
+    'Programming Language :: Python :: 3.8',
+    'Programming Language :: Python :: 3.9',
+    'Programming Language :: Python :: 3.10',
+    'Programming Language :: Python :: 3.11',
 ]
 
 long_description = ""
@@ -51,6 +56,8 @@ setup(
     author='Erik Nyquist',
     author_email='eknyquist@gmail.com',
     license='Apache 2.0',
+    classifiers=classifiers,
+    python_requires='>=3.7',
     install_requires=dependencies,
     packages=find_packages(),
     package_dir={'chatbot_utils':'chatbot_utils'},
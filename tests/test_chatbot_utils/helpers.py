@@ -0,0 +1,27 @@
+from chatbot_utils.responder import Responder, Context
+
+
+def build_responder(default_response=None):
+    """
+    Build the responder shared by the session, replay and asynchronous
+    responder tests: a "cats" context with a chain of phrases, a "dogs"
+    context, and contextless responses which set and read a variable
+
+    :param default_response: if not None, response for unmatched text
+    :return: new responder
+    :rtype: chatbot_utils.responder.Responder
+    """
+    c1 = Context().add_entry_phrase("cats", "cats!").add_response("favourite", "fuzzy")
+    c1.add_chained_phrases(("a", 1), ("b", 2), ("c", 3))
+
+    c2 = Context().add_entry_phrase("dogs", "dogs!").add_response("favourite", "loyal")
+
+    r = Responder().add_contexts(c1, c2)
+    r.add_response("my name is (.*)", "hi {p0};;name={p0}")
+    r.add_response("who am i", "{name}")
+    r.add_response("(.*) food", "I like {p0}")
+
+    if default_response is not None:
+        r.add_default_response(default_response)
+
+    return r
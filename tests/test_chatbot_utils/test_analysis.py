@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+from chatbot_utils.analysis import (analyze_pattern, PatternReport, NESTED_QUANTIFIER,
+    OVERLAPPING_ALTERNATION, UNANCHORED_WILDCARD)
+
+
+class TestAnalysis(TestCase):
+    def kinds(self, report):
+        return [kind for kind, _ in report.issues]
+
+    def test_linear(self):
+        for pattern in ["hello", "good (morning|evening)", "(.* )?hello.*", "[a-z]+ \\d+"]:
+            report = analyze_pattern(pattern)
+            self.assertEqual(report.degree, 1, pattern)
+            self.assertEqual(report.complexity, "O(n)")
+
+    def test_nested_quantifier(self):
+        for pattern in ["(a+)+", "(\\w+\\s?)+ food", "(x*y?)*z"]:
+            report = analyze_pattern(pattern)
+            self.assertIsNone(report.degree, pattern)
+            self.assertIn(NESTED_QUANTIFIER, self.kinds(report))
+            self.assertEqual(report.cost(), float("inf"))
+
+        # Fixed repeat counts don't backtrack
+        self.assertEqual(analyze_pattern("(ab{2}){3}").degree, 1)
+
+    def test_overlapping_alternation(self):
+        report = analyze_pattern("([hj]i|hello)")
+        self.assertEqual(self.kinds(report), [OVERLAPPING_ALTERNATION])
+        self.assertEqual(report.degree, 1)
+
+        report = analyze_pattern("([ab]|ab)*c")
+        self.assertIsNone(report.degree)
+
+        self.assertEqual(analyze_pattern("(cat|dog)s").issues, [])
+        self.assertEqual(analyze_pattern("(Cat|cow)s").degree, 1)
+
+    def test_wildcards(self):
+        report = analyze_pattern(".*a.*b")
+        self.assertEqual(self.kinds(report), [UNANCHORED_WILDCARD])
+        self.assertEqual(report.degree, 2)
+        self.assertEqual(report.complexity, "O(n^2)")
+        self.assertEqual(report.cost(10), 100.0)
+
+        # Trailing wildcards don't backtrack
+        self.assertEqual(analyze_pattern("a.*").issues, [])
+        self.assertEqual(analyze_pattern("a.*$").issues, [])
+        self.assertEqual(analyze_pattern("a[^x]*b").degree, 1)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, analyze_pattern, "(a")
+
+    def test_str(self):
+        report = PatternReport("x", [], 1, block=2, location="responses")
+        self.assertEqual(str(report), "responses block 2 'x' O(n)")
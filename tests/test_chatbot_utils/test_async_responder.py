@@ -0,0 +1,129 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from chatbot_utils.session import Session
+from chatbot_utils.async_responder import (AsyncResponder, QueueFullError,
+    process_executor)
+from tests.test_chatbot_utils.helpers import build_responder
+
+
+CONVERSATION = ["my name is bob", "cats", "a", "b", "c", "favourite", "who am i"]
+EXPECTED = ["hi bob", "cats!", 1, 2, 3, "fuzzy", "bob"]
+
+
+class TestAsyncResponder(TestCase):
+    def converse(self, async_responder, count):
+        sessions = [Session() for _ in range(count)]
+
+        async def run():
+            # Send every message of every conversation at once; messages for
+            # the same session must still be handled in order
+            calls = [async_responder.get_response(text, s)
+                     for text in CONVERSATION for s in sessions]
+            return await asyncio.gather(*calls)
+
+        results = asyncio.run(run())
+        return [r[0] for r in results], sessions
+
+    def check(self, async_responder, count=4):
+        responses, sessions = self.converse(async_responder, count)
+        self.assertEqual(responses, [x for x in EXPECTED for _ in range(count)])
+
+        for s in sessions:
+            # The last message matched a contextless response
+            self.assertIsNone(s.context)
+            self.assertEqual(s.context_path, ())
+            self.assertEqual(s.variables, {"name": "bob"})
+
+        info = async_responder.queue_info()
+        self.assertEqual(info["waiting"], 0)
+        self.assertEqual(info["running"], 0)
+        self.assertEqual(info["completed"], count * len(CONVERSATION))
+        self.assertEqual(async_responder._locks, {})
+
+    def test_default_executor(self):
+        self.check(AsyncResponder(build_responder()))
+
+    def test_thread_pool(self):
+        with ThreadPoolExecutor(4) as executor:
+            self.check(AsyncResponder(build_responder(), executor, max_pending=2))
+
+    def test_process_pool(self):
+        r = build_responder()
+        with process_executor(r, 2) as executor:
+            self.check(AsyncResponder(r, executor, max_pending=3))
+
+    def test_multiple_loops(self):
+        # Created outside of any event loop, then used from two loops
+        async_responder = AsyncResponder(build_responder(), max_pending=1)
+        for _ in range(2):
+            responses, _ = self.converse(async_responder, 4)
+            self.assertEqual(responses, [x for x in EXPECTED for _ in range(4)])
+
+        self.assertEqual(async_responder.queue_info()["completed"], 8 * len(CONVERSATION))
+
+    def test_max_pending(self):
+        r = build_responder()
+        running = []
+        peak = []
+        lock = threading.Lock()
+        get_response = r.get_response
+
+        def slow_get_response(text, session):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+
+            threading.Event().wait(0.01)
+            with lock:
+                running.pop()
+
+            return get_response(text, session)
+
+        r.get_response = slow_get_response
+        with ThreadPoolExecutor(8) as executor:
+            async_responder = AsyncResponder(r, executor, max_pending=3)
+            self.converse(async_responder, 6)
+
+        self.assertEqual(max(peak), 3)
+        self.assertGreater(async_responder.queue_info()["max_wait"], 0.0)
+
+    def test_max_waiting(self):
+        r = build_responder()
+        release = threading.Event()
+        get_response = r.get_response
+
+        def blocked_get_response(text, session):
+            release.wait(5.0)
+            return get_response(text, session)
+
+        r.get_response = blocked_get_response
+
+        async def run(async_responder):
+            # One request is matched, and two wait for a slot
+            tasks = [asyncio.ensure_future(async_responder.get_response("cats", Session()))
+                     for _ in range(3)]
+            while async_responder.queue_info()["waiting"] < 2:
+                await asyncio.sleep(0.001)
+
+            with self.assertRaises(QueueFullError):
+                await async_responder.get_response("cats", Session())
+
+            release.set()
+            return await asyncio.gather(*tasks)
+
+        with ThreadPoolExecutor(2) as executor:
+            async_responder = AsyncResponder(r, executor, max_pending=1, max_waiting=2)
+            results = asyncio.run(run(async_responder))
+
+        self.assertEqual([response for response, _ in results], ["cats!"] * 3)
+        info = async_responder.queue_info()
+        self.assertEqual(info["rejected"], 1)
+        self.assertEqual(info["completed"], 3)
+        self.assertEqual(info["waiting"], 0)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, AsyncResponder, build_responder(), max_pending=0)
+        self.assertRaises(ValueError, AsyncResponder, build_responder(), max_waiting=-1)
@@ -0,0 +1,99 @@
+import pickle
+import re
+import unittest
+from unittest import TestCase
+
+from chatbot_utils import backends
+from chatbot_utils.backends import Backend, StdlibBackend, RegexBackend, get_backend
+from chatbot_utils.redict import ReDict
+from chatbot_utils.responder import Responder, Context
+from chatbot_utils import benchmark
+
+
+class CountingBackend(Backend):
+    # Non-native backend, so that ReDict can't take any shortcuts that only
+    # work with the standard library's compiled regular expressions
+    name = "counting"
+
+    def __init__(self):
+        self.patterns = []
+
+    def compile(self, pattern, flags):
+        self.patterns.append(pattern)
+        return re.compile(pattern, flags)
+
+
+def build_redict(backend=None):
+    d = ReDict(backend=backend)
+    d.groups_per_regex = 2
+    for i, pattern in enumerate(["hello", "(.* )?cats (.*)", "(a+)(b)", "x|y", "(.*) food"]):
+        d[pattern] = i
+
+    return d
+
+
+class TestBackends(TestCase):
+    def check_redict(self, d):
+        self.assertEqual(d.match("HELLO"), (0, ()))
+        self.assertEqual(d.match("i like cats a lot"), (1, ("i like ", "a lot")))
+        self.assertEqual(d.match("aab"), (2, ("aa", "b")))
+        self.assertEqual(d.match("cat food"), (4, ("cat",)))
+        self.assertRaises(KeyError, d.match, "nothing")
+        self.assertEqual([v for _, v, _ in d.match_all("cats food")], [1, 4])
+
+    def test_default(self):
+        d = build_redict()
+        self.assertIs(d.backend, backends.DEFAULT_BACKEND)
+        self.check_redict(d)
+
+    def test_custom_backend(self):
+        backend = CountingBackend()
+        d = build_redict(backend)
+        self.check_redict(d)
+
+        # Every block and wildcard pattern was compiled by the backend. The
+        # only pattern in the first block that isn't a wildcard is plain.
+        self.assertIn("(?:cats (.*))$", backend.patterns)
+        self.assertEqual(len([p for p in backend.patterns if "(?P<g" in p]), 2)
+
+        # Switching backend re-compiles everything with the new backend
+        other = CountingBackend()
+        d.set_backend(other)
+        self.check_redict(d)
+        self.assertEqual(len([p for p in other.patterns if "(?P<g" in p]), 2)
+
+        self.assertIs(d.copy().backend, other)
+
+    def test_responder_backend(self):
+        c = Context().add_entry_phrase("cats", "cats!").add_chained_phrases(("a", 1), ("b", 2))
+        c.add_context(Context().add_entry_phrase("food", "food!"))
+        r = Responder().add_context(c).add_response("hi", "hello")
+
+        backend = CountingBackend()
+        r.set_backend(backend)
+        self.assertEqual([r.get_response(t)[0] for t in ["hi", "cats", "a", "b", "food"]],
+                         ["hello", "cats!", 1, 2, "food!"])
+
+        self.assertIn("^b$", backend.patterns)
+        self.assertIs(r.entry_index.backend, backend)
+        self.assertIs(c.entry_index.backend, backend)
+
+    def test_pickle(self):
+        d = pickle.loads(pickle.dumps(build_redict(StdlibBackend())))
+        self.assertTrue(isinstance(d.backend, StdlibBackend))
+        self.check_redict(d)
+
+    def test_get_backend(self):
+        self.assertTrue(isinstance(get_backend("re"), StdlibBackend))
+        self.assertRaises(ValueError, get_backend, "nothing")
+
+    @unittest.skipIf(backends.regex is None, "regex module not installed")
+    def test_regex_backend(self):
+        self.check_redict(build_redict(RegexBackend()))
+
+        results = benchmark.run([20], ["hit"], samples=3, backends=["re", "regex"])
+        self.assertEqual([r["backend"] for r in results["results"]], ["re", "regex"])
+
+    @unittest.skipIf(backends.regex is not None, "regex module installed")
+    def test_regex_backend_missing(self):
+        self.assertRaises(ImportError, RegexBackend)
@@ -0,0 +1,36 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from chatbot_utils import benchmark
+
+
+class TestBenchmark(TestCase):
+    def test_run(self):
+        results = benchmark.run([20, 40], samples=5)
+        self.assertEqual(len(results["results"]), 2 * len(benchmark.BENCHMARKS))
+
+        for result in results["results"]:
+            self.assertIn(result["patterns"], [20, 40])
+            if "samples" in result:
+                self.assertEqual(result["samples"], 5)
+                self.assertGreater(result["mean_us"], 0.0)
+
+        self.assertRaises(ValueError, benchmark.run, [20], ["nothing"])
+
+    def test_main(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tempdir, "results.json")
+            benchmark.main(["--counts", "10", "--benchmarks", "compile,hit", "--samples",
+                            "3", "--output", filename, "--quiet"])
+
+            with open(filename, "r") as fh:
+                results = json.load(fh)
+
+            self.assertEqual([r["benchmark"] for r in results["results"]], ["compile", "hit"])
+            self.assertGreater(results["results"][0]["seconds"], 0.0)
+        finally:
+            shutil.rmtree(tempdir)
@@ -6,17 +6,15 @@ def iterate_redicts(context):
     yield context.responses
     yield context.entry
 
-    for chain in context.chains:
-        for responsedict in chain:
-            yield responsedict
+    yield context.chain_heads
 
 class TestContext(TestCase):
     def test_compile(self):
         c = Context().add_entry_phrase("a+", 1).add_response("b+", 2)
         c.add_chained_phrases(
-            ("x", 3),
-            ("y", 4),
-            ("z", 5)
+            ("x+", 3),
+            ("y+", 4),
+            ("z+", 5)
         )
 
         # Verify nothing's been compiled yet
@@ -35,6 +33,10 @@ class TestContext(TestCase):
             for compiled in responsedict.compiled:
                 self.assertEqual(type(compiled), retype)
 
+        self.assertEqual(len(c.chain_steps.compiled), 3)
+        for compiled in c.chain_steps.compiled:
+            self.assertEqual(type(compiled), retype)
+
     def test_add_chained_phrases(self):
         c = Context().add_chained_phrases(
             ("0", 0),
@@ -364,3 +366,30 @@ class TestContext(TestCase):
         self.assertRaises(ValueError, c.add_contexts, "test")
         self.assertRaises(ValueError, c.add_contexts, Responder())
         self.assertRaises(ValueError, c.add_contexts, Context(), 0)
+
+    def test_chain_steps_shared(self):
+        c = Context().add_chained_phrases(("a", 1), ("(b+)", 2), ("c", 3))
+        c.add_chained_phrases(("d", 4), ("(b+)", 5))
+        c.add_chained_phrases(("a", 6), ("e", 7))
+
+        # Identical step patterns should only be stored once
+        self.assertEqual(c.chain_steps.patterns, ["a", "(b+)", "c", "d", "e"])
+        self.assertEqual(c.chains[1], ((3, 4), (1, 5)))
+        self.assertEqual(len(c.chain_heads), 3)
+
+        # First chain added should win when chain heads overlap
+        self.assertEqual(c.get_response("a"), (1, ()))
+        self.assertEqual(c.get_response("bb"), (2, ("bb",)))
+        self.assertEqual(c.get_response("e")[0], NoResponse)
+
+        c.get_response("q")
+        c.session.chain = None
+        self.assertEqual(c.get_response("d"), (4, ()))
+        self.assertEqual(c.get_response("bbb"), (5, ("bbb",)))
+        self.assertEqual(c.get_response("b"), (5, ("b",)))
+
+    def test_single_step_chain(self):
+        c = Context().add_chained_phrases(("a", 1))
+        self.assertEqual(c.get_response("a")[0], 1)
+        self.assertEqual(c.get_response("a")[0], 1)
+        self.assertEqual(c.get_response("b")[0], NoResponse)
@@ -0,0 +1,71 @@
+from unittest import TestCase
+from chatbot_utils.format_tokens import (FormattedResponse, ResponseTemplate,
+    InvalidFormatTokenError, LITERAL, TOKENIZED, ASSIGNING)
+
+
+def formatted(text, groups, variables={}):
+    ret = FormattedResponse(text, groups, variables)
+    return ret.formatted_response_text, ret.variables
+
+
+class TestResponseTemplate(TestCase):
+    def verify_same(self, text, groups, variables={}):
+        expected = formatted(text, groups, variables)
+        self.assertEqual(ResponseTemplate(text).render(groups, variables), expected)
+        return expected
+
+    def test_kind(self):
+        self.assertEqual(ResponseTemplate("hello {{there}}").kind, LITERAL)
+        self.assertEqual(ResponseTemplate("").kind, LITERAL)
+        self.assertEqual(ResponseTemplate("hello {p0}").kind, TOKENIZED)
+        self.assertEqual(ResponseTemplate("hello {p0.upper}").kind, TOKENIZED)
+        self.assertEqual(ResponseTemplate("hello;;a=b").kind, ASSIGNING)
+        self.assertEqual(ResponseTemplate("hello;;").kind, ASSIGNING)
+
+        self.assertEqual(ResponseTemplate("hello").static, "hello")
+        self.assertIsNone(ResponseTemplate("hello;;a=b").static)
+
+    def test_static(self):
+        t = ResponseTemplate("hello {{there}}")
+        self.assertEqual(t.static, "hello {there}")
+        self.verify_same("hello {{there}}", ("a",))
+        self.verify_same("", None)
+
+    def test_groups(self):
+        self.assertEqual(self.verify_same("I like {p1} and {p0}", ("cats", "dogs")),
+                         ("I like dogs and cats", {}))
+
+        self.verify_same("{p0!r} {p1:>5}", ("a", "b"))
+        self.verify_same("{p0}", (None,))
+
+    def test_variables(self):
+        self.assertEqual(self.verify_same("you like {like1}, {p0}", ("x",), {"like1": "y"}),
+                         ("you like y, x", {}))
+
+    def test_assignments(self):
+        text = "OK, {p0} and {p1};;like1={p0}, like2 = {p1},bad,=x"
+        self.assertEqual(self.verify_same(text, ("green", "red")),
+                         ("OK, green and red", {"like1": "green", "like2": "red", "": "x"}))
+
+        self.verify_same("a;;b;;x={p0}", ("y",))
+        self.verify_same("a;;", ("y",))
+
+    def test_separators_in_groups(self):
+        # Match groups containing separators are split after formatting
+        self.assertEqual(self.verify_same("ok;;a={p0}", ("b,c=d",)),
+                         ("ok", {"a": "b", "c": "d"}))
+
+    def test_invalid_tokens(self):
+        for text, groups in [("{p2}", ("a",)), ("{x}", None), ("{0}", ("a",)),
+                             ("a;;b={x}", ("a",)), ("a;;{p3}", ("a",)),
+                             ("{p0[4]}", ("a",))]:
+            self.assertRaises(InvalidFormatTokenError, formatted, text, groups)
+            self.assertRaises(InvalidFormatTokenError, ResponseTemplate(text).render, groups, {})
+
+    def test_unsupported(self):
+        # Templates with attribute lookups or nested fields fall back to
+        # FormattedResponse
+        t = ResponseTemplate("{p0.upper} {p0:{w}}")
+        self.assertIsNone(t.compiled)
+        self.verify_same("{p0.upper} {p0:{w}}", ("a",), {"w": "3"})
+        self.assertRaises(ValueError, ResponseTemplate("{").render, None, {})
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from chatbot_utils.redict import ReDict
+from chatbot_utils.responder import Responder, Context
+from chatbot_utils.instrument import (Instrument, Counters, CONTEXT, SUBCONTEXT_ENTRY,
+    CONTEXT_EXIT, RESPONSES, CONTEXT_ENTRY, RENDER)
+
+
+class Recorder(Instrument):
+    def __init__(self):
+        self.stages = []
+        self.matches = []
+        self.compiles = []
+
+    def stage(self, stage, duration):
+        self.stages.append(stage)
+
+    def match(self, redict, block, scanned, duration):
+        self.matches.append((redict.name, block, scanned))
+
+    def compile(self, redict, blocks, duration):
+        self.compiles.append((redict.name, blocks))
+
+
+class TestInstrument(TestCase):
+    def test_redict(self):
+        d = ReDict()
+        d.groups_per_regex = 2
+        # Every pattern requires a space, so every block is tried for text
+        # containing a space, and none for text without one
+        for i in range(6):
+            d["\\w+ " + ("\\d" * (i + 1))] = i
+
+        recorder = Recorder()
+        d.set_instrument(recorder, "test")
+        self.assertEqual(d["hello 12345"], 4)
+        self.assertRaises(KeyError, d.__getitem__, "\n")
+        self.assertEqual(recorder.compiles, [("test", 3)])
+        self.assertEqual(recorder.matches, [("test", 2, 3), ("test", None, 0)])
+
+        # Only modified blocks are re-compiled
+        d["x+"] = 6
+        d.compile()
+        self.assertEqual(recorder.compiles[-1], ("test", 1))
+
+        # Cached results don't scan any blocks
+        d.set_cache_size(10)
+        d.match("x")
+        d.match("x")
+        self.assertEqual(recorder.matches[-2:], [("test", 3, 1), ("test", 3, 0)])
+
+        # Instruments are not pickled
+        d2 = ReDict()
+        d2.__setstate__(d.__getstate__())
+        self.assertIsNone(d2.instrument)
+
+        d.set_instrument(None)
+        d.match("x")
+        self.assertEqual(len(recorder.matches), 4)
+
+    def test_responder_stages(self):
+        sub = Context().add_entry_phrase("food", "food!")
+        c = Context().add_entry_phrase("cats", "cats!").add_exit_phrase("bye", "bye!")
+        c.add_context(sub)
+
+        r = Responder().add_context(c).add_response("hi", "hello")
+        recorder = Recorder()
+        r.set_instrument(recorder)
+
+        r.get_response("cats")
+        self.assertEqual(recorder.stages, [RESPONSES, CONTEXT_ENTRY, RENDER])
+        self.assertEqual([m[0] for m in recorder.matches], ["responses", "entry_index"])
+
+        recorder.stages = []
+        recorder.matches = []
+        r.get_response("bye")
+        self.assertEqual(recorder.stages, [CONTEXT, SUBCONTEXT_ENTRY, CONTEXT_EXIT, RENDER])
+        self.assertEqual([m[0] for m in recorder.matches], [
+            "contexts[0].chain_heads", "contexts[0].responses", "contexts[0].entry", "contexts[0].entry_index",
+            "contexts[0].exit"])
+
+    def test_counters(self):
+        r = Responder().add_response("hi", "hello").add_response("x (.*)", "{p0}")
+        counters = Counters()
+        r.set_instrument(counters)
+
+        for text in ["hi", "x a", "x b", "nothing"]:
+            r.get_response(text)
+
+        snapshot = counters.snapshot(reset=True)
+        self.assertEqual(snapshot["stages"][RESPONSES][0], 4)
+        self.assertEqual(snapshot["stages"][RENDER][0], 4)
+        self.assertEqual(snapshot["lookups"]["responses"][:3], [4, 3, 4])
+        self.assertEqual(snapshot["blocks"], {("responses", 0): 3})
+        self.assertEqual(snapshot["compiles"]["responses"][:2], [1, 1])
+        self.assertEqual(counters.snapshot()["stages"], {})
+
+    def test_save_load_instrumented(self):
+        c = Context().add_entry_phrase("enter", "entered").add_response("x (.*)", "{p0}")
+        r = Responder().add_response("hi", "hello").add_context(c)
+        r.set_instrument(Counters()).set_match_timeout(10.0)
+        r.get_response("enter")
+
+        tempdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tempdir, "responder.pkl")
+            r.save_compiled(filename)
+            loaded = Responder.load_compiled(filename)
+        finally:
+            shutil.rmtree(tempdir)
+
+        # The instrument stays with the original responder only
+        self.assertIsNone(loaded.instrument)
+        self.assertEqual(len(loaded.timeouts), 0)
+        self.assertIsNotNone(r.instrument)
+        self.assertEqual(loaded.get_response("x y")[0], "y")
+        self.assertEqual(loaded.get_response("hi")[0], "hello")
@@ -0,0 +1,106 @@
+from unittest import TestCase
+
+import re
+
+from chatbot_utils.literals import (LiteralIndex, TokenTrie, count_subgroups,
+    fold_case, required_literals, leading_literals, parse_pattern, split_wildcard)
+
+
+class TestLiterals(TestCase):
+    def test_fold_case(self):
+        self.assertEqual(fold_case("HeLLo"), "hello")
+        self.assertEqual(fold_case(u"Kſ"), "ks")
+
+    def test_required_literals(self):
+        self.assertEqual(required_literals("(.* )?hello.*"), frozenset(["hello"]))
+        self.assertEqual(required_literals("GOOD morning"), frozenset(["good mor"]))
+        self.assertEqual(required_literals("what\\?"), frozenset(["what?"]))
+        self.assertEqual(required_literals("cat|dog"), frozenset(["cat", "dog"]))
+        self.assertEqual(required_literals("(x+)yz"), frozenset(["yz"]))
+
+    def test_required_literals_none(self):
+        self.assertIsNone(required_literals(".*"))
+        self.assertIsNone(required_literals("[a-z]+"))
+        self.assertIsNone(required_literals("(abc)?"))
+        self.assertIsNone(required_literals("cat|.*"))
+        self.assertIsNone(required_literals("(invalid"))
+
+    def test_leading_literals(self):
+        def leading(pattern):
+            return leading_literals(parse_pattern(pattern))
+
+        self.assertEqual(leading("Hello.*"), frozenset(["hello"]))
+        self.assertEqual(leading("(talk about|tell( me)? about) cats?"),
+                         frozenset(["talk abo", "tell"]))
+        self.assertEqual(leading("[ab]c+d"), frozenset(["ac", "bc"]))
+        self.assertEqual(leading("(?:x|y)z"), frozenset(["xz", "yz"]))
+        self.assertEqual(leading("(x|)z"), frozenset(["xz", "z"]))
+        self.assertIsNone(leading("(x|)"))
+        self.assertIsNone(leading("\\w+ hello"))
+        self.assertIsNone(leading("(hello)?"))
+
+    def test_split_wildcard(self):
+        source, compiled, capture, sep, prefixes, _ = split_wildcard("(.* )?(hello|hi)(.*)", re.IGNORECASE)
+        self.assertEqual(compiled.match("hi there").groups(), ("hi", " there"))
+        self.assertEqual(source, "(?:(hello|hi)(.*))$")
+        self.assertEqual((capture, sep, prefixes), (True, " ", frozenset(["hello", "hi"])))
+
+        self.assertEqual(split_wildcard("(.*)?hi")[2:5], (True, None, frozenset(["hi"])))
+        self.assertEqual(split_wildcard(".*hi")[2:5], (False, None, frozenset(["hi"])))
+        self.assertEqual(split_wildcard("(.*,)?hi")[2:5], (True, ",", frozenset(["hi"])))
+
+    def test_split_wildcard_none(self):
+        for pattern in ["hello", "(.* )?a|b", "(.* )?\\w+", ".*?hi", ".*{2}hi",
+                        "(.*a)?hi", "(.* )?(?i)hi", "(.* )?(a)\\2", "(.* )?hi)",
+                        "(.* )?", "(.* )?hi(?i)", "(.* )?(?s)hi"]:
+            self.assertIsNone(split_wildcard(pattern, re.IGNORECASE))
+
+        # Scoped flags, and flags in escapes and character classes, are fine
+        for pattern in ["(.* )?(?i:hi)", "(.* )?hi\\(?i\\)", "(.* )?hi[(?i)]"]:
+            self.assertIsNotNone(split_wildcard(pattern, re.IGNORECASE))
+
+        self.assertIsNone(split_wildcard("(.* )?hi", re.VERBOSE))
+        self.assertIsNotNone(split_wildcard("(.* )?[|]hi"))
+
+    def test_count_subgroups(self):
+        for pattern in ["hello", "(a)(b)", "(?:a)(?P<n>b)(?=c)(?#x)", "((a)|(b))?",
+                        "\\(a\\)", "[(]a", "[]()](a)", "[^]]()", "a\\\\(b)"]:
+            self.assertEqual(count_subgroups(pattern), re.compile(pattern).groups)
+
+    def test_literal_index(self):
+        index = LiteralIndex()
+        index.add("hello", 1)
+        index.add("tell", 2)
+        index.add("bye", 2)
+
+        self.assertEqual(index.search(fold_case("Oh, HELLO there")), set([1]))
+        self.assertEqual(index.search("tell me hello"), set([1, 2]))
+        self.assertEqual(index.search("hell"), set())
+
+        index.remove("hello", 1)
+        self.assertEqual(index.search("hello goodbye"), set([2]))
+
+    def test_token_trie(self):
+        trie = TokenTrie()
+        trie.add("tell me about cats", False, 1)
+        trie.add("tell me", True, 2)
+        trie.add("tell me about", True, 3)
+        trie.add("hi", True, 4)
+
+        self.assertEqual(sorted(trie.search("tell me about cats".split(" "))), [1, 2, 3])
+        self.assertEqual(trie.search("tell meow".split(" ")), [2])
+        self.assertEqual(trie.max_partial, 5)
+
+        # Removing the longest last token lowers max_partial, and removing
+        # texts prunes the nodes only they used
+        trie.remove("tell me about", True, 3)
+        self.assertEqual(trie.max_partial, 2)
+        trie.remove("tell me about cats", False, 1)
+        self.assertEqual(trie.search("tell me about cats".split(" ")), [2])
+        self.assertEqual(trie.root, {"tell": {0: {"me": [2]}}, 0: {"hi": [4]}})
+
+        trie.remove("tell me", True, 2)
+        trie.remove("hi", True, 4)
+        self.assertEqual(trie.root, {})
+        self.assertEqual(trie.max_partial, 0)
+        self.assertEqual(trie.size, 0)
@@ -1,8 +1,13 @@
 import re
 import random
-from unittest import TestCase
+import threading
+import time
+from unittest import TestCase, mock
 
-from chatbot_utils.redict import ReDict
+from chatbot_utils.backends import StdlibBackend
+from chatbot_utils.redict import ReDict, MatchTimeoutError
+from chatbot_utils.tuning import BlockSize
+from chatbot_utils.literals import fold_case
 
 class TestReDict(TestCase):
     def fill_redict(self, dictobj=None, numitems=1000):
@@ -46,6 +51,44 @@ class TestReDict(TestCase):
         for i in range(num_iterations):
             self.assertEqual(i, d["foo %d" % i])
 
+    def test_block_size(self):
+        d = ReDict()
+        d.set_block_size(BlockSize(3, 4))
+        patterns = ["hello", "(a)(b)(c) %d", "(x) %d", "(y) %d", "i like (red|blue)",
+                    "[a-z]+ %d", "(d)(e)(f)(g)(h) %d", "bye"]
+        for i in range(len(patterns)):
+            d[patterns[i].replace("%d", str(i))] = i
+
+        # Blocks are limited to 3 patterns, or 4 subgroups, but always hold
+        # at least one pattern
+        self.assertEqual([block.groupnames for block in d.blocks],
+                         [["g1", "g2", "g3"], ["g4", "g5", "g6"], ["g7"], ["g8"]])
+        self.assertEqual([block.subgroups for block in d.blocks], [4, 2, 5, 0])
+
+        del d["(x) 2"]
+        self.assertEqual(d.blocks[0].subgroups, 3)
+
+        # Existing patterns are re-arranged, keeping their priority
+        d["(.*)"] = 8
+        d.set_block_size(BlockSize(10, 100))
+        self.assertEqual(len(d.blocks), 1)
+        self.assertEqual(d.blocks[0].subgroups, 11)
+        self.assertEqual(d.match("HELLO"), (0, ()))
+        self.assertEqual(d.match("i like blue"), (4, ("blue",)))
+        self.assertEqual(d.match("d e f g h 6"), (8, ("d e f g h 6",)))
+        self.assertEqual(d.match("bye"), (7, ()))
+
+        copied = d.copy()
+        self.assertEqual((copied.groups_per_regex, copied.subgroups_per_regex), (10, 100))
+
+        # Blocks never have more groups than the backend supports
+        backend = StdlibBackend()
+        backend.max_groups = 8
+        d.set_backend(backend)
+        self.assertEqual([block.groupnames for block in d.blocks],
+                         [["g1", "g2", "g4"], ["g5", "g6"], ["g7", "g8"], ["g9"]])
+        self.assertEqual(d.match("x d e f g h 6"), (8, ("x d e f g h 6",)))
+
     def test_value_can_be_arbitrary_object(self):
         d = ReDict()
         strval = "test string"
@@ -68,9 +111,9 @@ class TestReDict(TestCase):
         retype = type(re.compile("a+"))
 
         d = ReDict()
-        d["a"] = 1
-        d["b"] = 2
-        d["c"] = 3
+        d["a+"] = 1
+        d["b+"] = 2
+        d["c+"] = 3
         self.assertFalse(d.compiled)
 
         d.compile()
@@ -283,3 +326,325 @@ class TestReDict(TestCase):
                 self.assertTrue(keyerror)
             else:
                 raise RuntimeError("Malformed test data")
+
+    def test_incremental_compile(self):
+        d = ReDict()
+        num_items = d.groups_per_regex * 3
+
+        for i in range(num_items):
+            d["(foo|bar) %d" % i] = i
+
+        d.compile()
+        self.assertEqual(3, len(d.blocks))
+        first, second, third = [block.compiled for block in d.blocks]
+
+        # Deleting an item should only require the block it lives in to be re-compiled
+        del d["(foo|bar) %d" % (d.groups_per_regex + 1)]
+        self.assertFalse(d.compiled)
+        d.compile()
+        self.assertIs(d.blocks[0].compiled, first)
+        self.assertIsNot(d.blocks[1].compiled, second)
+        self.assertIs(d.blocks[2].compiled, third)
+
+        # New items should be appended to a new tail block
+        d["(foo|bar) new"] = "new"
+        d.compile()
+        self.assertEqual(4, len(d.blocks))
+        self.assertIs(d.blocks[0].compiled, first)
+        self.assertIs(d.blocks[2].compiled, third)
+
+        self.assertEqual(d["foo new"], "new")
+        self.assertEqual(d["bar %d" % (num_items - 1)], num_items - 1)
+        self.assertRaises(KeyError, d.__getitem__, "foo %d" % (d.groups_per_regex + 1))
+
+    def test_groups_only_include_matched_pattern(self):
+        d = ReDict()
+        d["(a+)(b+)"] = 1
+        d["(c+)(d+)(e+)"] = 2
+
+        self.assertEqual(d["aabbb"], 1)
+        self.assertEqual(d.groups(), ("aa", "bbb"))
+
+        self.assertEqual(d["cde"], 2)
+        self.assertEqual(d.groups(), ("c", "d", "e"))
+
+    def test_literal_prefilter(self):
+        d = ReDict()
+        d.groups_per_regex = 2
+
+        d["(.* )?hello+.*"] = 1
+        d["(.* )?goodbye+.*"] = 2
+        d["(.* )?(cat|dog)s*.*"] = 3
+        d["[0-9]+"] = 4
+        d["thanks*"] = 5
+
+        d.compile()
+        self.assertEqual([d.blocks[1]], d.unfiltered_blocks)
+        self.assertEqual(d._candidate_blocks(fold_case("thanks")), d.blocks[1:])
+        self.assertEqual(d._candidate_blocks(fold_case("oh HELLO there")), d.blocks[:2])
+
+        self.assertEqual(d["oh HELLO there"], 1)
+        self.assertEqual(d["I like dogs"], 3)
+        self.assertEqual(d["1234"], 4)
+        self.assertEqual(d["Thanks"], 5)
+        self.assertRaises(KeyError, d.__getitem__, "nothing")
+
+    def test_plain_patterns(self):
+        d = ReDict()
+        d.groups_per_regex = 2
+
+        d["good (morning|night)"] = 1
+        d["Good Morning"] = 2
+        d["thanks"] = 3
+        d["th.nks"] = 4
+        d["hello"] = 5
+        d["HELLO"] = 6
+        d["(hello|hi) there"] = 7
+        d["hi there"] = 8
+
+        d.compile()
+        self.assertEqual(d.plain_patterns, {"good morning": ["g2"], "thanks": ["g3"],
+                                            "hello": ["g5", "g6"], "hi there": ["g8"]})
+        self.assertEqual(d.blocks[2].compiled, [])
+        self.assertEqual(d.blocks[2].unfiltered, False)
+
+        # Patterns added first take priority, whether plain or not
+        self.assertEqual(d.match("good MORNING"), (1, ("MORNING",)))
+        self.assertEqual(d.match("THANKS"), (3, ()))
+        self.assertEqual(d.match("thinks"), (4, ()))
+        self.assertEqual(d.match("hello\n"), (5, ()))
+        self.assertEqual(d.match("hi there"), (7, ("hi",)))
+        self.assertRaises(KeyError, d.match, "hello\nthere")
+        self.assertEqual([v for _, v, _ in d.match_all("Hello")], [5, 6])
+        self.assertEqual([v for _, v, _ in d.match_all("hi there")], [7, 8])
+
+        # Adding or removing plain patterns doesn't re-compile any blocks
+        d["Kelvin"] = 9
+        del d["hello"]
+        self.assertIsNone(d.compiled)
+        self.assertTrue(all(block.compiled is not None for block in d.blocks[:4]))
+        self.assertEqual(d.match("\u212aELVIN"), (9, ()))
+        self.assertEqual(d.match("hello"), (6, ()))
+
+        del d["HELLO"]
+        self.assertRaises(KeyError, d.match, "hello")
+        self.assertNotIn("hello", d.plain_patterns)
+
+        # Case-sensitive dicts look up plain patterns without folding case
+        d = ReDict()
+        d.flags = 0
+        d["Hello"] = 1
+        self.assertEqual(d.match("Hello"), (1, ()))
+        self.assertRaises(KeyError, d.match, "hello")
+
+    def test_token_patterns(self):
+        patterns = ["(.* )?cats? (are|is) (great|fun).*", "tell me about (dogs|cats)",
+                    "i like (\\w+)", "(.* )?i like (red|blue)", "how are you\\??",
+                    "[a-z]+ are great"]
+
+        d = ReDict()
+        d.groups_per_regex = 2
+        for i in range(len(patterns)):
+            d[patterns[i]] = i
+
+        d.compile()
+        self.assertEqual([[t.groupname for t in block.tokens] for block in d.blocks],
+                         [["g1", "g2"], ["g4"], ["g5"]])
+
+        self.assertEqual(d.match("well cats are great fun"), (0, ("well ", "are", "great")))
+        self.assertEqual(d.match("cat is fun"), (0, (None, "is", "fun")))
+        self.assertEqual(d.match("TELL me about cats"), (1, ("cats",)))
+        self.assertEqual(d.match("How are you?"), (4, ()))
+        self.assertRaises(KeyError, d.match, "a cat is fun\nok")
+        self.assertRaises(KeyError, d.match, "tell me about")
+
+        # Patterns added first take priority, whether token patterns or not
+        self.assertEqual(d.match("i like red"), (2, ("red",)))
+        self.assertEqual(d.match("you know i like blue"), (3, ("you know ", "blue")))
+        self.assertEqual([v for _, v, _ in d.match_all("cats are great")], [0, 5])
+
+        del d[patterns[0]]
+        self.assertEqual(d.match("cats are great"), (5, ()))
+
+        d = ReDict()
+        d.flags |= re.DOTALL
+        d[patterns[0]] = 0
+        self.assertEqual(d.match("a\nb cat is fun\nok"), (0, ("a\nb ", "is", "fun")))
+
+    def test_wildcards(self):
+        patterns = ["(.* )?(hello|hi)( there)?.*", "(.*)?cat(s?)", ".*dog(.*)",
+                    "(.*,)?yes", "(.* )?(a)?(b)", "(b)( .*)?"]
+        texts = ["hello", "oh HI there you", "hello hi hello", "a hello\nhi",
+                 "cats", "some cat", "dogdog", "one dog, two dogs",
+                 "yes", "ok,yes", "no, yes,yes", "a b", "b", "ab ab", "b b b",
+                 "x\ny hi", "nothing"]
+
+        d = ReDict()
+        d.groups_per_regex = 4
+        for i in range(len(patterns)):
+            d[patterns[i]] = i
+
+        d.compile()
+        self.assertEqual(len([w for b in d.blocks for w in b.wildcards]), 3)
+        self.assertEqual(len([t for b in d.blocks for t in b.tokens]), 3)
+
+        for text in texts:
+            expected = None
+            for i in range(len(patterns)):
+                m = re.match("^(?:%s)$" % patterns[i], text, re.IGNORECASE)
+                if m:
+                    expected = (i, m.groups())
+                    break
+
+            if expected is None:
+                self.assertRaises(KeyError, d.match, text)
+            else:
+                self.assertEqual(d.match(text), expected)
+
+    def test_wildcards_order(self):
+        # Wildcard patterns must not take priority over earlier patterns
+        d = ReDict()
+        d["hello (.*)"] = 1
+        d["(.* )?hello.*"] = 2
+        d["(.*) world"] = 3
+
+        self.assertEqual(d.match("hello world"), (1, ("world",)))
+        self.assertEqual(d.match("oh hello world"), (2, ("oh ",)))
+        self.assertEqual(d.match("well world"), (3, ("well",)))
+
+    def test_deadline(self):
+        d = ReDict()
+        d.groups_per_regex = 2
+        for i in range(6):
+            d["a+%d" % i] = i
+
+        self.assertEqual(d.match("aa5", deadline=time.monotonic() + 60), (5, ()))
+
+        # Deadline passed before the lookup
+        with self.assertRaises(MatchTimeoutError) as cm:
+            d.match("aa5", deadline=time.monotonic() - 1)
+
+        self.assertIsNone(cm.exception.position)
+        self.assertIsNone(cm.exception.patterns)
+
+        # Deadline passes while the second block is being tried
+        with mock.patch("time.monotonic", side_effect=[0, 1, 10]):
+            with self.assertRaises(MatchTimeoutError) as cm:
+                d.match("aa5", deadline=5)
+
+        self.assertEqual(cm.exception.position, 1)
+        self.assertEqual(cm.exception.patterns, ["a+2", "a+3"])
+        self.assertEqual(cm.exception.text, "aa5")
+
+    def test_cache(self):
+        d = ReDict(cache_size=2)
+        d["(a+)b"] = 1
+        d["c"] = 2
+
+        self.assertEqual(d["aab"], 1)
+        self.assertEqual(d["aab"], 1)
+        self.assertEqual(d.groups(), ("aa",))
+        self.assertRaises(KeyError, d.__getitem__, "x")
+        self.assertRaises(KeyError, d.__getitem__, "x")
+
+        info = d.cache_info()
+        self.assertEqual(info["hits"], 2)
+        self.assertEqual(info["misses"], 2)
+        self.assertEqual(info["size"], 2)
+
+        # Oldest entry should be evicted
+        self.assertEqual(d["c"], 2)
+        self.assertEqual(list(d.cache.keys()), ["x", "c"])
+
+        # Modifying the dict should invalidate cached results
+        d["x"] = 3
+        self.assertEqual(d.cache_info()["size"], 0)
+        self.assertEqual(d["x"], 3)
+
+    def test_analyze(self):
+        d = ReDict()
+        d.groups_per_regex = 2
+        d["hello"] = 1
+        d["(\\w+\\s?)+ food"] = 2
+        d["(.* )?talk about .*"] = 3
+
+        reports = d.analyze()
+        self.assertEqual([r.pattern for r in reports], list(d.keys()))
+        # Plain and token patterns are not compiled in a block
+        self.assertEqual([r.block for r in reports], [None, 0, None])
+        self.assertEqual([r.wildcard for r in reports], [False, False, True])
+        self.assertEqual([r.degree for r in reports], [1, None, 2])
+
+        # Analysis survives saving and loading the compiled state
+        d2 = ReDict()
+        d2.__setstate__(d.__getstate__())
+        self.assertEqual([str(r) for r in d2.analyze()], [str(r) for r in reports])
+
+    def test_cache_disabled(self):
+        d = ReDict()
+        d["a"] = 1
+        self.assertEqual(d["a"], 1)
+        self.assertIsNone(d.cache)
+        self.assertEqual(d.cache_info()["misses"], 0)
+
+    def test_match(self):
+        d = ReDict()
+        d["(.*) (.*)"] = 1
+        d["x"] = 2
+
+        self.assertEqual(d.match("hello world"), (1, ("hello", "world")))
+        self.assertEqual(d.match("X"), (2, ()))
+        self.assertRaises(KeyError, d.match, "nothing")
+
+        # match() should not store anything on the instance
+        self.assertIsNone(d.groups())
+
+    def test_match_all(self):
+        d = ReDict()
+        d.groups_per_regex = 3
+        patterns = ["(a+)(b)", "a|x", "(.* )?b.*", "(.*)", "zz", "aab", "(.* )?aab", "a(a)b"]
+        for i in range(len(patterns)):
+            d[patterns[i]] = i
+
+        self.assertEqual(d.match_all("aab"), [
+            ("(a+)(b)", 0, ("aa", "b")),
+            ("a|x", 1, ()),
+            ("(.*)", 3, ("aab",)),
+            ("aab", 5, ()),
+            ("(.* )?aab", 6, (None,)),
+            ("a(a)b", 7, ("a",))
+        ])
+
+        self.assertEqual(d.match_all("x b"), [("(.* )?b.*", 2, ("x ",)), ("(.*)", 3, ("x b",))])
+
+        del d["(.*)"]
+        self.assertEqual(d.match_all("nothing"), [])
+
+        # First match is the same one that match() finds
+        for text in ["aab", "x b", "zz", "b"]:
+            self.assertEqual(d.match_all(text)[0][1:], d.match(text))
+
+    def test_match_threads(self):
+        d = ReDict(cache_size=50)
+        for i in range(200):
+            d["(foo|bar) ([a-z]+) %d" % i] = i
+
+        errors = []
+
+        def worker(seed):
+            rand = random.Random(seed)
+            for _ in range(500):
+                i = rand.randrange(200)
+                word = rand.choice(["abc", "xyz", "qqq"])
+                value, groups = d.match("foo %s %d" % (word, i))
+                if (value != i) or (groups != ("foo", word)):
+                    errors.append((i, word, value, groups))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
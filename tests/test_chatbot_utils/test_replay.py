@@ -0,0 +1,57 @@
+import os
+import random
+import shutil
+import tempfile
+from unittest import TestCase
+
+from chatbot_utils.session import Session
+from chatbot_utils.replay import replay
+from tests.test_chatbot_utils.helpers import build_responder
+
+
+def build_conversations(count):
+    inputs = ["cats", "a", "b", "c", "favourite", "my name is bob", "cat food", "xyz"]
+    rand = random.Random(count)
+    return [[rand.choice(inputs) for _ in range(rand.randrange(1, 10))]
+            for _ in range(count)]
+
+
+class TestReplay(TestCase):
+    def expected(self, conversations):
+        r = build_responder("what?")
+        ret = []
+        for conversation in conversations:
+            session = Session()
+            ret.append([r.get_response(text, session) for text in conversation])
+
+        return ret
+
+    def test_replay_in_process(self):
+        conversations = build_conversations(50)
+        results = replay(build_responder("what?"), iter(conversations), processes=1, chunk_size=3)
+        self.assertEqual(list(results), self.expected(conversations))
+
+    def test_replay_processes(self):
+        conversations = build_conversations(200)
+        results = replay(build_responder("what?"), conversations, processes=2, chunk_size=5)
+        self.assertEqual(list(results), self.expected(conversations))
+
+    def test_replay_compiled_file(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tempdir, "responder.pkl")
+            content_hash = build_responder("what?").save_compiled(filename)
+            conversations = build_conversations(20)
+
+            results = replay(filename, conversations, processes=2,
+                             content_hash=content_hash)
+            self.assertEqual(list(results), self.expected(conversations))
+
+            results = replay(filename, conversations, processes=1, content_hash="x")
+            self.assertRaises(ValueError, list, results)
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_replay_invalid(self):
+        self.assertRaises(ValueError, list, replay(build_responder("what?"), [], processes=0))
+        self.assertRaises(ValueError, list, replay(build_responder("what?"), [], chunk_size=0))
@@ -1,6 +1,14 @@
+import os
 import re
-from unittest import TestCase
-from chatbot_utils.responder import Responder, Context
+import shutil
+import tempfile
+import itertools
+from unittest import TestCase, mock
+from concurrent.futures import ThreadPoolExecutor
+from chatbot_utils.responder import (Responder, Context, _warm_up_order, _entry_index,
+    NoResponse, TRUNCATE, REJECT)
+from chatbot_utils.session import Session
+from chatbot_utils.tuning import BlockSize
 
 def iterate_redicts(responder):
     yield responder.responses
@@ -8,25 +16,23 @@ def iterate_redicts(responder):
         yield context.responses
         yield context.entry
 
-        for chain in context.chains:
-            for responsedict in chain:
-                yield responsedict
+        yield context.chain_heads
 
 class TestResponder(TestCase):
     def test_compile(self):
-        r = Responder().add_response("f?", 0)
+        r = Responder().add_response("f*", 0)
         c1 = Context().add_entry_phrase("a+", 1).add_response("b+", 2)
         c1.add_chained_phrases(
-            ("x", 3),
-            ("y", 4),
-            ("z", 5)
+            ("x+", 3),
+            ("y+", 4),
+            ("z+", 5)
         )
 
         c2 = Context().add_entry_phrase("q+", 6).add_response("t*", 7)
         c2.add_chained_phrases(
-            ("x", 3),
-            ("y", 4),
-            ("z", 5)
+            ("x+", 3),
+            ("y+", 4),
+            ("z+", 5)
         )
 
         r.add_contexts(c1, c2)
@@ -47,6 +53,11 @@ class TestResponder(TestCase):
             for compiled in responsedict.compiled:
                 self.assertEqual(type(compiled), retype)
 
+        for context in r.contexts:
+            self.assertEqual(len(context.chain_steps.compiled), 3)
+            for compiled in context.chain_steps.compiled:
+                self.assertEqual(type(compiled), retype)
+
     def test_add_default_response(self):
         r = Responder()
         r.add_responses(("a", 1), ("b", 2)).add_default_response(3)
@@ -159,3 +170,247 @@ class TestResponder(TestCase):
         self.assertRaises(ValueError, r.add_contexts, True)
         self.assertRaises(ValueError, r.add_contexts, Responder())
         self.assertRaises(ValueError, r.add_contexts, Context(), 5)
+
+    def test_max_input_length(self):
+        r = Responder().add_default_response("default").add_response("a+", "as")
+        r.set_max_input_length(3)
+        self.assertEqual(r.get_response("aaa"), ("as", ()))
+        self.assertEqual(r.get_response("aaab"), ("as", ()))
+
+        r.set_max_input_length(3, REJECT)
+        self.assertEqual(r.get_response("aaa"), ("as", ()))
+        self.assertEqual(r.get_response("aaaa"), ("default", None))
+
+        r.set_max_input_length(None, TRUNCATE)
+        self.assertEqual(r.get_response("aaaa"), ("as", ()))
+        self.assertRaises(ValueError, r.set_max_input_length, 3, "drop")
+
+    def test_match_timeout(self):
+        c = Context().add_entry_phrase("enter", "entered")
+        c.add_chained_phrases(("one", 1), ("two", 2))
+        c.add_response("b+", "bs")
+
+        r = Responder().add_default_response("default").add_context(c)
+        r.add_response("x+", "xs")
+        r.set_match_timeout(60)
+
+        self.assertEqual(r.get_response("enter")[0], "entered")
+        self.assertEqual(r.get_response("one")[0], 1)
+        self.assertEqual(r.get_response("bbb")[0], "bs")
+        self.assertEqual(len(r.timeouts), 0)
+
+        # Clock jumps forward on every check, so the budget always runs out
+        r.set_match_timeout(0.5)
+        with mock.patch("time.monotonic", side_effect=itertools.count()):
+            self.assertEqual(r.get_response("one"), ("default", None))
+
+        self.assertEqual(len(r.timeouts), 1)
+        self.assertEqual(r.timeouts[0].text, "one")
+
+        # Session state is left as it was before the call that timed out
+        self.assertIs(r.context, c)
+        r.set_match_timeout(None)
+        self.assertEqual(r.get_response("one")[0], 1)
+        self.assertEqual(r.get_response("two")[0], 2)
+
+    def test_set_cache_size(self):
+        c = Context().add_entry_phrase("a", 1).add_response("b", 2)
+        c.add_chained_phrases(("x", 3), ("y", 4))
+        r = Responder().add_response("q", 5).add_context(c).set_cache_size(10)
+
+        for responsedict in iterate_redicts(r):
+            self.assertEqual(responsedict.cache_size, 10)
+
+        self.assertEqual(r.get_response("q")[0], 5)
+        self.assertEqual(r.get_response("q")[0], 5)
+        self.assertEqual(r.responses.cache_info()["hits"], 1)
+
+    def test_set_block_size(self):
+        c = Context().add_entry_phrase("a", 1).add_response("b", 2)
+        c.add_chained_phrases(("x", 3), ("y", 4))
+        r = Responder().add_response("q", 5).add_context(c)
+        old_hash = r.content_hash()
+        r.set_block_size(BlockSize(10, 20))
+
+        for responsedict in iterate_redicts(r):
+            self.assertEqual((responsedict.groups_per_regex, responsedict.subgroups_per_regex),
+                             (10, 20))
+
+        self.assertNotEqual(r.content_hash(), old_hash)
+        self.assertEqual(r.get_response("q")[0], 5)
+
+    def test_save_load_compiled(self):
+        c = Context().add_entry_phrase("a+", 1).add_response("(b+)", "got {p0}")
+        c.add_chained_phrases(("x", 3), ("y", 4))
+        r = Responder().add_response("f?", 0).add_context(c).add_default_response(5)
+
+        tempdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tempdir, "responder.bin")
+            content_hash = r.save_compiled(filename)
+            self.assertEqual(content_hash, r.content_hash())
+
+            loaded = Responder.load_compiled(filename, content_hash)
+            self.assertRaises(ValueError, Responder.load_compiled, filename, "1234")
+        finally:
+            shutil.rmtree(tempdir)
+
+        self.assertEqual(loaded.content_hash(), content_hash)
+        for responsedict in iterate_redicts(loaded):
+            self.assertIsNone(responsedict.compiled)
+            self.assertTrue(all(block.sources is not None for block in responsedict.blocks))
+
+        self.assertEqual(loaded.get_response("aa")[0], 1)
+        self.assertEqual(loaded.get_response("bb")[0], "got bb")
+        self.assertEqual(loaded.get_response("x")[0], 3)
+        self.assertEqual(loaded.get_response("y")[0], 4)
+        self.assertEqual(loaded.get_response("")[0], 0)
+        self.assertEqual(loaded.get_response("zzz")[0], 5)
+
+    def test_content_hash(self):
+        r1 = Responder().add_response("a", 1).add_context(Context().add_entry_phrase("b", 2))
+        r2 = Responder().add_response("a", 1).add_context(Context().add_entry_phrase("b", 2))
+        self.assertEqual(r1.content_hash(), r2.content_hash())
+
+        r2.contexts[0].add_response("c", 3)
+        self.assertNotEqual(r1.content_hash(), r2.content_hash())
+
+        r1.contexts[0].add_response("c", 4)
+        self.assertNotEqual(r1.content_hash(), r2.content_hash())
+
+    def build_nested(self):
+        sub = Context().add_entry_phrase("s", 4).add_response("t", 5).add_exit_phrase("u", 6)
+        c1 = Context().add_entry_phrase("a", 1).add_response("b", 2).add_context(sub)
+        c1.add_chained_phrases(("x", 7), ("y", 8))
+        c2 = Context().add_entry_phrase("c", 3)
+        return Responder().add_response("q", 0).add_contexts(c1, c2), c1, c2, sub
+
+    def test_response_templates(self):
+        r = Responder().add_response("(a+)", "got {p0};;last={p0}")
+        r.add_context(Context().add_response("b", "in {last}"))
+        self.assertEqual(list(r.templates), ["got {p0};;last={p0}"])
+
+        r.compile()
+        self.assertEqual(sorted(r.templates), ["got {p0};;last={p0}", "in {last}"])
+
+        self.assertEqual(r.get_response("aa"), ("got aa", ("aa",)))
+        self.assertEqual(r.variables, {"last": "aa"})
+
+    def test_analyze(self):
+        sub = Context().add_response("(a+)+b", "x")
+        c = Context().add_entry_phrase("cats", "x").add_chained_phrases(("one", "x"), ("two", "x"))
+        c.add_context(sub)
+        r = Responder().add_response("hello", "x").add_context(c)
+
+        reports = r.analyze()
+        self.assertEqual([(x.location, x.pattern) for x in reports], [
+            ("responses", "hello"),
+            ("contexts[0].entry", "cats"),
+            ("contexts[0].chain_heads", "one"),
+            ("contexts[0].chain_steps", "one"),
+            ("contexts[0].chain_steps", "two"),
+            ("contexts[0].contexts[0].responses", "(a+)+b")
+        ])
+
+        self.assertEqual([x.degree for x in reports], [1, 1, 1, 1, 1, None])
+        self.assertEqual(reports[-1].block, 0)
+        self.assertIsNone(reports[3].block)
+
+    def test_warm_up_order(self):
+        r, c1, c2, sub = self.build_nested()
+        order = list(_warm_up_order(r))
+        expected = [r.responses, _entry_index(r), c1.entry, c1.responses, c1.exit,
+                    c1.chain_heads, c1.chain_steps, c2.entry, c2.responses, c2.exit,
+                    _entry_index(c1), sub.entry, sub.responses, sub.exit]
+
+        self.assertEqual(len(order), len(expected))
+        for responsedict, expected_responsedict in zip(order, expected):
+            self.assertIs(responsedict, expected_responsedict)
+
+    def test_warm_up(self):
+        r, c1, c2, sub = self.build_nested()
+        r.warm_up().join()
+        for responsedict in _warm_up_order(r):
+            self.assertIsNotNone(responsedict.compiled)
+
+        r, c1, c2, sub = self.build_nested()
+        with ThreadPoolExecutor(1) as executor:
+            future = r.warm_up(executor)
+            self.assertIsNotNone(r.responses.compiled)
+            self.assertEqual(r.get_response("a")[0], 1)
+            future.result()
+
+        for responsedict in _warm_up_order(r):
+            self.assertIsNotNone(responsedict.compiled)
+
+    def test_compile_nested(self):
+        r, c1, c2, sub = self.build_nested()
+        r.compile()
+
+        # Empty ReDicts are skipped by compile()
+        for responsedict in _warm_up_order(r):
+            if len(responsedict) > 0:
+                self.assertIsNotNone(responsedict.compiled)
+
+    def test_entry_index(self):
+        c1 = Context().add_entry_phrases(("a+", 1), ("(b)(c+)", 2))
+        c2 = Context().add_entry_phrases(("a", 3), ("d", 4))
+        r = Responder().add_contexts(c1, c2)
+
+        # First context registered should win when entry phrases overlap
+        self.assertEqual(r.get_response("a"), (1, ()))
+        self.assertIs(r.context, c1)
+        self.assertEqual(r.get_response("d"), (4, ()))
+        self.assertIs(r.context, c2)
+        self.assertEqual(r.get_response("bcc"), (2, ("b", "cc")))
+        self.assertIs(r.context, c1)
+
+        index = _entry_index(r)
+        self.assertEqual(len(index), 4)
+        self.assertIs(_entry_index(r), index)
+
+        # Adding entry phrases or contexts updates the index in place
+        c2.add_entry_phrase("e", 5)
+        self.assertIs(r.entry_index, index)
+        self.assertEqual(r.get_response("e")[0], 5)
+
+        r.add_context(Context().add_entry_phrase("f", 6))
+        self.assertIs(r.entry_index, index)
+        self.assertEqual(r.get_response("f")[0], 6)
+        self.assertEqual(len(_entry_index(r)), 6)
+
+        # Phrases added to an earlier context still take priority
+        c2.add_entry_phrase("f", 7)
+        c1.add_entry_phrase("(f|e)", 8)
+        session = Session()
+        self.assertEqual(r.get_response("f", session), (8, ("f",)))
+        self.assertIs(session.context, c1)
+        self.assertEqual(r.get_response("e", Session()), (8, ("e",)))
+
+    def test_entry_index_remove(self):
+        c1 = Context().add_entry_phrases(("hel+o", 1), ("hi+", 2))
+        c2 = Context().add_entry_phrases(("hel+o", 3), ("bye+", 4))
+        r = Responder().add_contexts(c1, c2)
+        for i in range(200):
+            r.add_context(Context().add_entry_phrase("phrase %d" % i, i))
+
+        self.assertEqual(r.get_response("hello")[0], 1)
+        index = r.entry_index
+
+        # Entry phrases removed directly from the entry ReDict are removed
+        # from the index, re-compiling only the block that held them
+        del c1.entry["hel+o"]
+        self.assertIs(r.entry_index, index)
+        self.assertEqual([block.compiled is not None for block in index.blocks],
+                         [False] + [True] * (len(index.blocks) - 1))
+        self.assertEqual(r.get_response("hello")[0], 3)
+
+        c2.entry.pop("bye")
+        self.assertEqual(r.get_response("bye")[0], NoResponse)
+
+        c2.entry["bye+"] = 5
+        self.assertEqual(r.get_response("bye")[0], 5)
+
+        c1.entry.clear()
+        self.assertEqual(r.get_response("hi")[0], NoResponse)
+        self.assertEqual(r.get_response("phrase 199")[0], 199)
@@ -0,0 +1,156 @@
+import random
+from unittest import TestCase, mock
+
+from chatbot_utils.responder import Context, NoResponse
+from chatbot_utils.session import Session
+from tests.test_chatbot_utils.helpers import build_responder
+
+
+class TestSession(TestCase):
+    def test_independent_contexts(self):
+        r = build_responder()
+        s1 = Session()
+        s2 = Session()
+
+        self.assertEqual(r.get_response("cats", s1)[0], "cats!")
+        self.assertEqual(r.get_response("dogs", s2)[0], "dogs!")
+
+        self.assertEqual(r.get_response("favourite", s1)[0], "fuzzy")
+        self.assertEqual(r.get_response("favourite", s2)[0], "loyal")
+        self.assertIs(s1.context, r.contexts[0])
+        self.assertIs(s2.context, r.contexts[1])
+
+        # Responder's own session should be untouched
+        self.assertIsNone(r.context)
+        self.assertEqual(r.get_response("favourite")[0], NoResponse)
+
+    def test_independent_variables(self):
+        r = build_responder()
+        s1 = Session()
+        s2 = Session()
+
+        self.assertEqual(r.get_response("my name is bob", s1)[0], "hi bob")
+        self.assertEqual(r.get_response("my name is alice", s2)[0], "hi alice")
+        self.assertEqual(r.get_response("who am i", s1)[0], "bob")
+        self.assertEqual(r.get_response("who am i", s2)[0], "alice")
+        self.assertEqual(r.variables, {})
+
+    def test_independent_chains(self):
+        r = build_responder()
+        s1 = Session()
+        s2 = Session()
+
+        for s in [s1, s2]:
+            self.assertEqual(r.get_response("cats", s)[0], "cats!")
+
+        self.assertEqual(r.get_response("a", s1)[0], 1)
+        self.assertEqual(r.get_response("b", s1)[0], 2)
+        self.assertEqual(r.get_response("c", s2)[0], NoResponse)
+        self.assertEqual(r.get_response("a", s2)[0], 1)
+        self.assertEqual(r.get_response("c", s1)[0], 3)
+        self.assertEqual(r.get_response("b", s2)[0], 2)
+
+    def test_context_change_exits_chain(self):
+        r = build_responder()
+        s = Session()
+
+        self.assertEqual(r.get_response("cats", s)[0], "cats!")
+        self.assertEqual(r.get_response("a", s)[0], 1)
+        self.assertEqual(r.get_response("dogs", s)[0], "dogs!")
+        self.assertIsNone(s.chain)
+        self.assertEqual(r.get_response("cats", s)[0], "cats!")
+        self.assertEqual(r.get_response("b", s)[0], NoResponse)
+
+    def test_context_path(self):
+        r = build_responder()
+        sub = Context().add_entry_phrase("food", "food!").add_response("best", "tuna")
+        r.contexts[0].add_context(sub)
+        s = Session()
+
+        r.get_response("dogs", s)
+        self.assertEqual(s.context_path, (1,))
+        r.get_response("cats", s)
+        r.get_response("food", s)
+        self.assertEqual(s.context_path, (0, 0))
+        self.assertIs(r.get_context(s.context_path), sub)
+
+        r.context = sub
+        self.assertEqual(r.session.context_path, (0, 0))
+        self.assertRaises(ValueError, setattr, r, "context", Context())
+
+    def test_to_bytes_from_bytes(self):
+        r = build_responder()
+        s = Session()
+
+        r.get_response("my name is bob", s)
+        r.get_response("cats", s)
+        r.get_response("a", s)
+
+        data = s.to_bytes()
+        self.assertTrue(isinstance(data, bytes))
+
+        restored = Session.from_bytes(data)
+        self.assertIsNone(restored.context)
+        self.assertEqual(restored.context_path, (0,))
+        self.assertEqual(restored.chain, 0)
+        self.assertEqual(restored.chain_index, 1)
+        self.assertEqual(restored.variables, {"name": "bob"})
+
+        # Restored session should continue the conversation where it left off
+        self.assertEqual(r.get_response("b", restored)[0], 2)
+        self.assertIs(restored.context, r.contexts[0])
+        self.assertEqual(r.get_response("favourite", restored)[0], "fuzzy")
+        self.assertEqual(r.get_response("who am i", restored)[0], "bob")
+
+    def test_get_responses(self):
+        inputs = ["cats", "dogs", "a", "b", "c", "favourite", "my name is bob",
+                  "my name is alice", "who am i", "xyz"]
+
+        rand = random.Random(1)
+        pairs = [(rand.randrange(5), rand.choice(inputs)) for _ in range(500)]
+
+        expected_responder = build_responder()
+        expected_sessions = [Session() for _ in range(5)]
+        for s in expected_sessions:
+            s.variables["name"] = "nobody"
+
+        expected = [expected_responder.get_response(text, expected_sessions[i])
+                    for i, text in pairs]
+
+        for batch_size in [1, 7, 10000]:
+            r = build_responder()
+            sessions = [Session() for _ in range(5)]
+            for s in sessions:
+                s.variables["name"] = "nobody"
+
+            results = r.get_responses(((sessions[i], t) for i, t in pairs), batch_size)
+            self.assertEqual(list(results), expected)
+
+            for s1, s2 in zip(sessions, expected_sessions):
+                self.assertEqual(s1.to_bytes(), s2.to_bytes())
+
+    def test_get_responses_deduplicates(self):
+        r = build_responder()
+        s1 = Session()
+        s2 = Session()
+        pairs = [(s1, "cats"), (s2, "cats"), (s1, "favourite"), (s2, "favourite"),
+                 (None, "my name is bob"), (None, "who am i")]
+
+        with mock.patch.object(r, "_match", wraps=r._match) as match:
+            results = list(r.get_responses(pairs))
+
+        self.assertEqual([resp for resp, _ in results],
+                         ["cats!", "cats!", "fuzzy", "fuzzy", "hi bob", "bob"])
+        self.assertEqual(match.call_count, 4)
+        self.assertIs(s2.context, r.contexts[0])
+        self.assertEqual(r.variables, {"name": "bob"})
+
+    def test_to_bytes_empty(self):
+        restored = Session.from_bytes(Session().to_bytes())
+        self.assertEqual(restored.context_path, ())
+        self.assertIsNone(restored.chain)
+        self.assertEqual(restored.variables, {})
+        self.assertRaises(ValueError, Session.from_bytes, b"\x00\x00")
+
+    def test_slots(self):
+        self.assertRaises(AttributeError, setattr, Session(), "foo", 1)
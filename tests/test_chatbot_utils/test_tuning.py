@@ -0,0 +1,50 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from chatbot_utils import tuning
+from chatbot_utils.backends import StdlibBackend
+from chatbot_utils.tuning import BlockSize
+
+
+class TestTuning(TestCase):
+    def test_calibrate(self):
+        block_size = tuning.calibrate(sizes=[2, 5], subgroups=[0, 2], patterns=20, samples=2)
+        self.assertIn(block_size.patterns, [2, 5])
+        self.assertIn(block_size.subgroups, [4, 10])
+
+        results = block_size.measurements["results"]
+        self.assertEqual([(r["subgroups"], r["patterns"]) for r in results],
+                         [(0, 2), (0, 5), (2, 2), (2, 5)])
+        self.assertTrue(all(r["match_us"] > 0.0 for r in results))
+
+        # Sizes with more groups than the backend supports are skipped
+        backend = StdlibBackend()
+        backend.max_groups = 12
+        block_size = tuning.calibrate(backend, sizes=[2, 5], subgroups=[0, 2],
+                                      patterns=20, samples=2)
+        self.assertEqual(block_size.subgroups, 4)
+
+        self.assertRaises(ValueError, tuning.calibrate, subgroups=[1, 2])
+        self.assertRaises(ValueError, BlockSize, 0, 10)
+
+    def test_save_load(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tempdir, "block_size.json")
+            tuning.main(["--sizes", "2,3", "--subgroups", "0,1", "--patterns", "10",
+                         "--samples", "2", "--output", filename, "--quiet"])
+
+            block_size = BlockSize.load(filename)
+            self.assertIn(block_size.patterns, [2, 3])
+            self.assertEqual(len(block_size.measurements["results"]), 4)
+
+            BlockSize(10, 20).save(filename)
+            with open(filename, "r") as fh:
+                self.assertEqual(json.load(fh)["subgroups"], 20)
+
+            self.assertEqual(BlockSize.load(filename), BlockSize(10, 20))
+        finally:
+            shutil.rmtree(tempdir)